@@ -0,0 +1,162 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare single-pass document indexing with the old
+"regex scan + parse every document" approach, and a full
+index rebuild with an incremental one after a small corpus change.
+
+Usage::
+
+    $ python benchmarks/bench_indexing.py [annot.opcorpora.xml]
+
+Without arguments a synthetic corpus is built by repeating
+documents from tests/annot.corpus.xml.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import re
+import sys
+import time
+import tempfile
+import argparse
+from collections import OrderedDict
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from opencorpora import CorpusReader, xml_utils
+from opencorpora.compat import ElementTree
+from opencorpora.reader import Document
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), '..', 'tests', 'annot.corpus.xml')
+
+
+def legacy_document_meta(filename):
+    """ Document meta computation as it was done before single-pass indexing. """
+    meta = OrderedDict()
+    bounds_iter = xml_utils.bounds(filename,
+                        start_re=r'\s*<text id="(\d+)"[^>]*name="([^"]*)"',
+                        end_re=r'\s*</text>')
+    for match, bounds in bounds_iter:
+        doc_id, title = str(match.group(1)), match.group(2)
+        title = xml_utils.unescape_attribute(title)
+        xml_data = xml_utils.load_chunk(filename, bounds)
+        doc = Document(ElementTree.XML(xml_data.encode('utf8')))
+        meta[doc_id] = (title, bounds, doc.categories())
+    return meta
+
+
+def single_pass_document_meta(filename, workers=1):
+    reader = CorpusReader(filename, use_cache=False, index_workers=workers)
+    return OrderedDict(
+        (doc_id, (m.title, m.bounds, m.categories))
+        for doc_id, m in reader._compute_document_meta().items()
+    )
+
+
+def rebuild_indexes(filename, cache_filename, use_cache):
+    """ Build document and sentence indexes; return the build time. """
+    reader = CorpusReader(filename, cache_filename=cache_filename, use_cache=use_cache)
+    try:
+        start = time.time()
+        reader._get_meta()
+        reader._get_sentence_index()
+        return time.time() - start
+    finally:
+        reader.close()
+
+
+def bench_incremental(filename):
+    fd, cache_filename = tempfile.mkstemp(suffix='.idx')
+    os.close(fd)
+    try:
+        rebuild_indexes(filename, cache_filename, True)
+
+        # a new revision: one document is changed, the rest are shifted
+        with open(filename, 'rb') as f:
+            data = f.read()
+        with open(filename, 'wb') as f:
+            f.write(data.replace(b'revision="', b'revision="1', 1).replace(
+                b'<token id="2" text="', b'<token id="2" text="X', 1))
+
+        full_time = rebuild_indexes(filename, None, False)
+        print("full rebuild:        %0.3fs" % full_time)
+        inc_time = rebuild_indexes(filename, cache_filename, True)
+        print("incremental rebuild: %0.3fs (%0.1fx)" % (inc_time, full_time / inc_time))
+    finally:
+        for name in [cache_filename, cache_filename + '.sents']:
+            if os.path.exists(name):
+                os.remove(name)
+
+
+def make_corpus(path, copies):
+    """ Write a corpus with ``copies`` copies of test documents. """
+    with open(TEST_DATA, 'rb') as f:
+        data = f.read()
+    declaration, root, rest = data.split(b'\n', 2)
+    body, tail = rest.rsplit(b'</annotation>', 1)
+    with open(path, 'wb') as out:
+        out.write(declaration + b'\n' + root + b'\n')
+        doc_id = 0
+        for _ in range(copies):
+            def renumber(match):
+                renumber.doc_id += 1
+                return b'<text id="' + str(renumber.doc_id).encode('ascii') + b'"'
+            renumber.doc_id = doc_id
+            out.write(re.sub(br'<text id="\d+"', renumber, body))
+            doc_id = renumber.doc_id
+        out.write(b'</annotation>' + tail)
+
+
+def timeit(func, *args):
+    start = time.time()
+    result = func(*args)
+    return time.time() - start, result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('corpus', nargs='?', help='OpenCorpora XML file')
+    parser.add_argument('--copies', type=int, default=200,
+                        help='test corpus copies in a synthetic corpus')
+    parser.add_argument('--workers', type=int, default=0,
+                        help='also benchmark parallel indexing with this many processes')
+    args = parser.parse_args()
+
+    filename = args.corpus
+    if filename is None:
+        fd, filename = tempfile.mkstemp(suffix='.xml')
+        os.close(fd)
+        make_corpus(filename, args.copies)
+
+    try:
+        size = os.path.getsize(filename) / 1024 / 1024
+        print("Corpus: %s (%0.1f MB)" % (filename, size))
+
+        legacy_time, legacy = timeit(legacy_document_meta, filename)
+        print("legacy:      %0.3fs" % legacy_time)
+
+        new_time, new = timeit(single_pass_document_meta, filename)
+        print("single-pass: %0.3fs (%0.1fx)" % (new_time, legacy_time / new_time))
+
+        if legacy != new:
+            print("ERROR: results differ")
+            return 1
+
+        if args.workers:
+            par_time, par = timeit(single_pass_document_meta, filename, args.workers)
+            print("parallel/%d:  %0.3fs (%0.1fx)" % (
+                args.workers, par_time, legacy_time / par_time))
+            if par != new:
+                print("ERROR: parallel results differ")
+                return 1
+
+        if args.corpus is None:
+            # the synthetic corpus can be modified
+            bench_incremental(filename)
+    finally:
+        if args.corpus is None:
+            os.remove(filename)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,89 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare peak memory usage (RSS) of opencorpora.load with different options.
+
+Usage::
+
+    $ python benchmarks/bench_lxml_memory.py [annot.opcorpora.xml]
+
+Every configuration is loaded in a separate process; the peak RSS
+of a process which only imports lxml is reported as a baseline.
+Unix only (it uses the ``resource`` module).
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import sys
+import tempfile
+import argparse
+import subprocess
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from bench_indexing import make_corpus
+
+CONFIGS = [
+    ('baseline (no load)', None),
+    ('load()', {}),
+    ('load(lean=True)', {'lean': True}),
+    ('load(lean=True, categories=...)', {'lean': True, 'categories': 'Тема:ЧасКор:Медиа'}),
+]
+
+CHILD_CODE = """
+import sys, json, time, resource
+sys.path.insert(0, %(root)r)
+from opencorpora import load
+kwargs = json.loads(sys.argv[2])
+start = time.time()
+corpus = load(sys.argv[1], **kwargs) if kwargs is not None else None
+num_tokens = corpus.num_tokens if corpus is not None else 0
+elapsed = time.time() - start
+rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+if sys.platform == 'darwin':
+    rss //= 1024
+print(json.dumps([rss, elapsed, num_tokens]))
+"""
+
+
+def measure(filename, kwargs):
+    import json
+    code = CHILD_CODE % {'root': os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')}
+    output = subprocess.check_output([sys.executable, '-c', code, filename, json.dumps(kwargs)])
+    return json.loads(output.decode('utf8'))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('corpus', nargs='?', help='OpenCorpora XML file')
+    parser.add_argument('--copies', type=int, default=100,
+                        help='test corpus copies in a synthetic corpus')
+    args = parser.parse_args()
+
+    filename = args.corpus
+    if filename is None:
+        fd, filename = tempfile.mkstemp(suffix='.xml')
+        os.close(fd)
+        make_corpus(filename, args.copies)
+
+    try:
+        size = os.path.getsize(filename) / 1024 / 1024
+        print("Corpus: %s (%0.1f MB)" % (filename, size))
+        default_rss = None
+        for name, kwargs in CONFIGS:
+            rss, elapsed, num_tokens = measure(filename, kwargs)
+            rss_mb = rss / 1024
+            line = "%-34s peak RSS: %7.1f MB" % (name, rss_mb)
+            if kwargs is not None:
+                line += "   %5.2fs   %8d tokens" % (elapsed, num_tokens)
+            if default_rss is not None:
+                line += "   (%0.1fx less)" % (default_rss / rss_mb)
+            if kwargs == {}:
+                default_rss = rss_mb
+            print(line)
+    finally:
+        if args.corpus is None:
+            os.remove(filename)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
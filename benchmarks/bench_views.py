@@ -0,0 +1,72 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Compare tokens/sec of CorpusReader views computed from ElementTrees
+(Document methods) and by the streaming expat-based parser.
+
+Usage::
+
+    $ python benchmarks/bench_views.py [annot.opcorpora.xml]
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import sys
+import time
+import tempfile
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from opencorpora import CorpusReader
+from bench_indexing import make_corpus
+
+METHODS = ['iter_words', 'iter_tagged_words', 'iter_parsed_words', 'iter_raw_sents']
+
+
+def tree_view(corpus, method):
+    for doc in corpus.iter_documents(_destroy=True):
+        for res in getattr(doc, method)():
+            yield res
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('corpus', nargs='?', help='OpenCorpora XML file')
+    parser.add_argument('--copies', type=int, default=50,
+                        help='test corpus copies in a synthetic corpus')
+    args = parser.parse_args()
+
+    filename = args.corpus
+    if filename is None:
+        fd, filename = tempfile.mkstemp(suffix='.xml')
+        os.close(fd)
+        make_corpus(filename, args.copies)
+
+    try:
+        corpus = CorpusReader(filename, use_cache=False)
+        num_tokens = sum(1 for _ in corpus.iter_words())
+        print("Corpus: %s (%d tokens)" % (filename, num_tokens))
+
+        for method in METHODS:
+            start = time.time()
+            tree_res = list(tree_view(corpus, method))
+            tree_time = time.time() - start
+
+            start = time.time()
+            stream_res = list(getattr(corpus, method)())
+            stream_time = time.time() - start
+
+            print("%-18s tree: %8d tokens/s   streaming: %8d tokens/s (%0.1fx)" % (
+                method, num_tokens / tree_time, num_tokens / stream_time,
+                tree_time / stream_time))
+            if tree_res != stream_res:
+                print("ERROR: results differ")
+                return 1
+        corpus.close()
+    finally:
+        if args.corpus is None:
+            os.remove(filename)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
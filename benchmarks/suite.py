@@ -0,0 +1,534 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Run benchmark scenarios for CorpusReader and opencorpora.load entry points.
+
+Usage::
+
+    $ python benchmarks/suite.py --size-mb 50 --output results.json
+    $ python benchmarks/suite.py --size-mb 50 --compare results.json
+    $ python benchmarks/suite.py --corpus annot.opcorpora.xml -k views. -k lxml.
+
+Without ``--corpus`` a deterministic synthetic corpus is generated
+(see ``synthetic.py``), so results of different commits are comparable.
+Every scenario is run ``--repeat`` times and the best time is reported.
+Results are printed and optionally saved as JSON; with ``--compare``
+scenarios which became slower than ``--threshold`` (relative) are
+reported and the exit code is 1.
+"""
+from __future__ import absolute_import, print_function, division
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import platform
+import tempfile
+import argparse
+import subprocess
+from collections import OrderedDict
+
+ROOT = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..')
+sys.path.insert(0, ROOT)
+
+import opencorpora
+from opencorpora import CorpusReader, ParallelCorpusReader, streaming
+from opencorpora.diff import diff
+from opencorpora.batches import batches, FeatureVocabulary
+from synthetic import generate
+
+FORMAT_VERSION = 1
+SAMPLE_SIZE = 200
+
+SCENARIOS = OrderedDict()
+
+
+def scenario(name, unit='tokens', setup=None):
+    """
+    Register a benchmark. The function gets a :class:`Context` and the result
+    of ``setup(ctx)`` (not timed) and returns the number of processed
+    items in ``unit``\\s, or a dict with "items" and extra values.
+    """
+    def decorator(func):
+        SCENARIOS[name] = (func, unit, setup)
+        return func
+    return decorator
+
+
+class Context(object):
+    """ Benchmark corpus, a warm reader and samples of ids. """
+
+    def __init__(self, filename, temp_dir):
+        self.filename = filename
+        self.temp_dir = temp_dir
+        self.cache_filename = os.path.join(temp_dir, 'corpus.cache')
+        self.reader = CorpusReader(filename, cache_filename=self.cache_filename)
+        self.fileids = self.reader.fileids()
+        self.num_tokens = sum(1 for _ in self.reader.iter_words())
+
+        rng = random.Random(0)
+        self.doc_sample = [rng.choice(self.fileids) for _ in range(SAMPLE_SIZE)]
+        self.sent_sample, self.token_sample = [], []
+        for doc_id in self.doc_sample:
+            for sent in self.reader._document_xml(doc_id).iter('sentence'):
+                self.sent_sample.append(sent.get('id'))
+                self.token_sample.extend(t.get('id') for t in sent.iter('token'))
+        self.sent_sample = rng.sample(self.sent_sample, min(SAMPLE_SIZE, len(self.sent_sample)))
+        self.token_sample = rng.sample(self.token_sample, min(SAMPLE_SIZE, len(self.token_sample)))
+        self.category = sorted(self.reader.categories())[0].split(':')[0] + ':*'
+
+    def close(self):
+        self.reader.close()
+
+
+# === CorpusReader: indexes ===
+
+@scenario('index.documents', unit='documents')
+def index_documents(ctx, _):
+    reader = CorpusReader(ctx.filename, use_cache=False)
+    return len(reader._get_meta())
+
+
+def _uncached_reader(ctx):
+    reader = CorpusReader(ctx.filename, use_cache=False)
+    reader._get_meta()
+    return reader
+
+
+@scenario('index.sentences', unit='sentences', setup=_uncached_reader)
+def index_sentences(ctx, reader):
+    reader._sentence_index = None
+    return len(reader._get_sentence_index())
+
+
+@scenario('index.open_cached', unit='documents')
+def index_open_cached(ctx, _):
+    with CorpusReader(ctx.filename, cache_filename=ctx.cache_filename) as reader:
+        return len(reader.fileids())
+
+
+def _modified_copy(ctx):
+    path = os.path.join(ctx.temp_dir, 'modified.xml')
+    with open(ctx.filename, 'rb') as f:
+        data = f.read()
+    with open(path, 'wb') as f:
+        f.write(data.replace(b'<token id="1" text="', b'<token id="1" text="X', 1))
+    return path
+
+
+@scenario('index.incremental', unit='documents', setup=_modified_copy)
+def index_incremental(ctx, path):
+    cache_filename = os.path.join(ctx.temp_dir, 'modified.cache')
+    for name in [cache_filename, cache_filename + '.sents']:
+        if os.path.exists(name):
+            os.remove(name)
+    shutil.copy(ctx.cache_filename, cache_filename)
+    with CorpusReader(path, cache_filename=cache_filename) as reader:
+        return len(reader.fileids())
+
+
+# === CorpusReader: random access ===
+
+@scenario('fetch.get_document', unit='documents')
+def fetch_get_document(ctx, _):
+    for doc_id in ctx.doc_sample:
+        ctx.reader.get_document(doc_id).words()
+    return len(ctx.doc_sample)
+
+
+@scenario('fetch.get_documents', unit='documents')
+def fetch_get_documents(ctx, _):
+    for doc in ctx.reader.get_documents(ctx.reader.fileids(categories=ctx.category)):
+        doc.words()
+    return len(ctx.reader.fileids(categories=ctx.category))
+
+
+@scenario('fetch.raw', unit='documents')
+def fetch_raw(ctx, _):
+    for doc_id in ctx.doc_sample:
+        ctx.reader.raw(doc_id)
+    return len(ctx.doc_sample)
+
+
+@scenario('fetch.get_sentence', unit='sentences')
+def fetch_get_sentence(ctx, _):
+    for sent_id in ctx.sent_sample:
+        ctx.reader.get_sentence(sent_id).words()
+    return len(ctx.sent_sample)
+
+
+@scenario('fetch.get_token', unit='tokens')
+def fetch_get_token(ctx, _):
+    for token_id in ctx.token_sample:
+        ctx.reader.get_token(token_id)
+    return len(ctx.token_sample)
+
+
+@scenario('fetch.token_location', unit='tokens')
+def fetch_token_location(ctx, _):
+    for token_id in ctx.token_sample:
+        ctx.reader.token_location(token_id)
+    return len(ctx.token_sample)
+
+
+def _concordance_query(ctx):
+    index = ctx.reader._get_concordance_index()
+    lemmas = sorted(index.terms('lemmas'), key=lambda item: -item[1])
+    grammemes = sorted(index.terms('grammemes'), key=lambda item: -item[1])
+    return {'lemma': lemmas[len(lemmas) // 100][0], 'grammemes': grammemes[0][0]}
+
+
+@scenario('fetch.concordance', unit='queries', setup=_concordance_query)
+def fetch_concordance(ctx, query):
+    ctx.reader.concordance(limit=50, **query)
+    ctx.reader.concordance(grammemes=query['grammemes'], limit=50)
+    return 2
+
+
+# === CorpusReader: metadata ===
+
+@scenario('meta.fileids', unit='documents')
+def meta_fileids(ctx, _):
+    return len(ctx.reader.fileids())
+
+
+@scenario('meta.fileids_categories', unit='documents')
+def meta_fileids_categories(ctx, _):
+    return len(ctx.reader.fileids(categories=ctx.category))
+
+
+@scenario('meta.categories', unit='categories')
+def meta_categories(ctx, _):
+    return len(ctx.reader.categories())
+
+
+@scenario('meta.catalog', unit='documents')
+def meta_catalog(ctx, _):
+    return len(ctx.reader.catalog())
+
+
+@scenario('meta.statistics_build', unit='documents', setup=_uncached_reader)
+def meta_statistics_build(ctx, reader):
+    reader._statistics = None
+    return len(reader.statistics())
+
+
+def _warm_statistics(ctx):
+    ctx.reader.statistics()
+
+
+@scenario('meta.counts_categories', unit='documents', setup=_warm_statistics)
+def meta_counts_categories(ctx, _):
+    ctx.reader.counts(categories=ctx.category)
+    return len(ctx.reader.fileids(categories=ctx.category))
+
+
+@scenario('meta.get_annotation_info', unit='calls')
+def meta_annotation_info(ctx, _):
+    ctx.reader.get_annotation_info()
+    return 1
+
+
+# === CorpusReader: views ===
+
+def _view_scenario(method):
+    def run(ctx, _):
+        for _ in getattr(ctx.reader, method)():
+            pass
+        return ctx.num_tokens
+    scenario('views.' + method)(run)
+
+
+for _method in ['iter_words', 'iter_tagged_words', 'iter_parsed_words',
+                'iter_sents', 'iter_tagged_sents', 'iter_parsed_sents', 'iter_raw_sents',
+                'iter_paras', 'iter_tagged_paras', 'iter_parsed_paras', 'iter_raw_paras',
+                'iter_documents', 'iter_documents_raw']:
+    _view_scenario(_method)
+
+
+@scenario('views.parallel_iter_tagged_words', setup=lambda ctx: ParallelCorpusReader(
+    ctx.filename, cache_filename=ctx.cache_filename, workers=2))
+def views_parallel(ctx, reader):
+    for _ in reader.iter_tagged_words():
+        pass
+    return ctx.num_tokens
+
+
+@scenario('views.streaming_iter_file')
+def views_iter_file(ctx, _):
+    for _ in streaming.iter_file(ctx.filename, 'iter_tagged_words'):
+        pass
+    return ctx.num_tokens
+
+
+@scenario('columnar.export')
+def columnar_export(ctx, _):
+    ctx.reader.export_columnar(os.path.join(ctx.temp_dir, 'corpus.columnar'))
+    return ctx.num_tokens
+
+
+def _columnar_store(ctx):
+    path = os.path.join(ctx.temp_dir, 'corpus.columnar')
+    ctx.reader.export_columnar(path)
+    return CorpusReader.load_columnar(path)
+
+
+@scenario('columnar.iter_tagged_sents', setup=_columnar_store)
+def columnar_tagged_sents(ctx, store):
+    for _ in store.iter_tagged_sents():
+        pass
+    return ctx.num_tokens
+
+
+@scenario('batches.columnar', setup=_columnar_store)
+def batches_columnar(ctx, store):
+    for _ in batches(store, FeatureVocabulary(), batch_size=64):
+        pass
+    return ctx.num_tokens
+
+
+@scenario('diff.same_file', unit='documents')
+def diff_same(ctx, _):
+    other = CorpusReader(ctx.filename, cache_filename=ctx.cache_filename)
+    for _ in diff(ctx.reader, other):
+        pass
+    other.close()
+    return len(ctx.fileids)
+
+
+# === opencorpora.load (lxml) ===
+
+def _lxml_scenario(name, **kwargs):
+    def run(ctx, _):
+        corpus = opencorpora.load(ctx.filename, **kwargs)
+        return corpus.num_tokens
+    scenario('lxml.' + name)(run)
+
+
+_lxml_scenario('load')
+_lxml_scenario('load_lean', lean=True)
+_lxml_scenario('load_categories', lean=True, categories='Тема:*')
+
+
+@scenario('lxml.load_fileids')
+def lxml_load_fileids(ctx, _):
+    return opencorpora.load(ctx.filename, fileids=ctx.doc_sample[:10]).num_tokens
+
+
+def _lxml_corpus(ctx):
+    return opencorpora.load(ctx.filename)
+
+
+@scenario('lxml.iter_tokens', setup=_lxml_corpus)
+def lxml_iter_tokens(ctx, corpus):
+    for token in corpus.tokens:
+        token.source, token.lemma, token.grammemes
+    return ctx.num_tokens
+
+
+@scenario('lxml.random_access', setup=_lxml_corpus)
+def lxml_random_access(ctx, corpus):
+    rng = random.Random(0)
+    tokens = corpus.tokens
+    for _ in range(SAMPLE_SIZE):
+        tokens[rng.randrange(len(tokens))].source
+    return SAMPLE_SIZE
+
+
+@scenario('lxml.get_token', setup=_lxml_corpus)
+def lxml_get_token(ctx, corpus):
+    for token_id in ctx.token_sample:
+        corpus.get_token(token_id)
+    return len(ctx.token_sample)
+
+
+# ru_maxrss survives exec() on Linux, so the peak RSS of the parent
+# process would be reported; /proc/self/status is used when available.
+MEMORY_CODE = """
+import sys, json, resource
+sys.path.insert(0, %(root)r)
+from opencorpora import load
+corpus = load(sys.argv[1], **json.loads(sys.argv[2]))
+try:
+    with open('/proc/self/status') as f:
+        rss = [int(line.split()[1]) for line in f if line.startswith('VmHWM:')][0]
+except (IOError, IndexError):
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        rss //= 1024
+print(json.dumps(rss))
+"""
+
+
+def _memory_scenario(name, **kwargs):
+    def run(ctx, _):
+        code = MEMORY_CODE % {'root': ROOT}
+        output = subprocess.check_output(
+            [sys.executable, '-c', code, ctx.filename, json.dumps(kwargs)])
+        return {'items': ctx.num_tokens, 'peak_rss_mb': json.loads(output.decode('utf8')) / 1024}
+    scenario('lxml.memory_' + name)(run)
+
+
+_memory_scenario('load')
+_memory_scenario('load_lean', lean=True)
+
+
+# === harness ===
+
+def run_scenario(ctx, name, repeat):
+    func, unit, setup = SCENARIOS[name]
+    state = setup(ctx) if setup is not None else None
+    try:
+        runs, extra = [], {}
+        for _ in range(repeat):
+            start = time.time()
+            items = func(ctx, state)
+            runs.append(time.time() - start)
+            if isinstance(items, dict):
+                extra = dict(items)
+                items = extra.pop('items')
+    finally:
+        if hasattr(state, 'close'):
+            state.close()
+    best = min(runs)
+    result = OrderedDict([
+        ('seconds', best), ('runs', runs), ('items', items), ('unit', unit),
+        ('items_per_second', items / best if best else None),
+    ])
+    result.update(sorted(extra.items()))
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.check_output(
+            ['git', 'rev-parse', 'HEAD'], cwd=ROOT, stderr=subprocess.STDOUT
+        ).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return OrderedDict([
+        ('commit', commit),
+        ('python', platform.python_version()),
+        ('implementation', platform.python_implementation()),
+        ('platform', platform.platform()),
+        ('time', time.strftime('%Y-%m-%dT%H:%M:%S')),
+    ])
+
+
+def compare(results, baseline, threshold, min_seconds=0.001):
+    """
+    Print a comparison with baseline results; return names of regressions.
+    Timings shorter than ``min_seconds`` are too noisy to be reported.
+    """
+    regressions = []
+    print("\n%-36s %10s %10s %8s" % ('scenario', 'baseline', 'current', 'ratio'))
+    for name, result in results.items():
+        old = baseline.get(name)
+        if old is None:
+            continue
+        pairs = [('', old['seconds'], result['seconds'])]
+        if 'peak_rss_mb' in result and 'peak_rss_mb' in old:
+            pairs.append((' (RSS)', old['peak_rss_mb'], result['peak_rss_mb']))
+        for suffix, old_value, new_value in pairs:
+            ratio = new_value / old_value if old_value else float('inf')
+            mark = ''
+            if not suffix and max(old_value, new_value) < min_seconds:
+                mark = '  (too fast to compare)'
+            elif ratio > 1 + threshold:
+                regressions.append(name + suffix)
+                mark = '  WORSE'
+            elif ratio < 1 - threshold:
+                mark = '  better'
+            print("%-36s %10.4f %10.4f %7.2fx%s" % (name + suffix, old_value, new_value, ratio, mark))
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--corpus', help='OpenCorpora XML file (default: synthetic corpus)')
+    parser.add_argument('--size-mb', type=float, default=20, help='synthetic corpus size')
+    parser.add_argument('--ambiguity', type=float, default=0.2,
+                        help='share of ambiguous words in a synthetic corpus')
+    parser.add_argument('--tags', type=int, default=300,
+                        help='number of morphological tags in a synthetic corpus')
+    parser.add_argument('--categories', type=int, default=100,
+                        help='number of document categories in a synthetic corpus')
+    parser.add_argument('--seed', type=int, default=0, help='synthetic corpus seed')
+    parser.add_argument('-k', dest='patterns', action='append',
+                        help='run only scenarios which names contain this string')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='save results to a JSON file')
+    parser.add_argument('--compare', help='compare with results from a JSON file')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slowdown reported as a regression')
+    parser.add_argument('--list', action='store_true', help='list scenarios and exit')
+    args = parser.parse_args()
+
+    names = [name for name in SCENARIOS
+             if not args.patterns or any(p in name for p in args.patterns)]
+    if args.list:
+        print("\n".join(names))
+        return 0
+
+    temp_dir = tempfile.mkdtemp()
+    try:
+        filename = args.corpus
+        corpus_info = OrderedDict()
+        if filename is None:
+            filename = os.path.join(temp_dir, 'synthetic.xml')
+            params = OrderedDict([
+                ('size_mb', args.size_mb), ('seed', args.seed), ('ambiguity', args.ambiguity),
+                ('num_tags', args.tags), ('num_categories', args.categories),
+            ])
+            generate(filename, args.size_mb, seed=args.seed, ambiguity=args.ambiguity,
+                     num_tags=args.tags, num_categories=args.categories)
+            corpus_info['synthetic'] = params
+        else:
+            corpus_info['file'] = os.path.abspath(filename)
+
+        ctx = Context(filename, temp_dir)
+        corpus_info['size_mb'] = os.path.getsize(filename) / 1024 / 1024
+        corpus_info['documents'] = len(ctx.fileids)
+        corpus_info['tokens'] = ctx.num_tokens
+        print("Corpus: %0.1f MB, %d documents, %d tokens" % (
+            corpus_info['size_mb'], len(ctx.fileids), ctx.num_tokens))
+
+        results = OrderedDict()
+        try:
+            for name in names:
+                result = results[name] = run_scenario(ctx, name, args.repeat)
+                line = "%-36s %9.4fs %12.0f %s/s" % (
+                    name, result['seconds'], result['items_per_second'] or 0, result['unit'])
+                if 'peak_rss_mb' in result:
+                    line += "   peak RSS %0.1f MB" % result['peak_rss_mb']
+                print(line)
+        finally:
+            ctx.close()
+    finally:
+        shutil.rmtree(temp_dir)
+
+    report = OrderedDict([
+        ('format', FORMAT_VERSION),
+        ('environment', environment()),
+        ('corpus', corpus_info),
+        ('results', results),
+    ])
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline.get('corpus', {}).get('synthetic') != corpus_info.get('synthetic'):
+            print("warning: baseline corpus differs from the current one")
+        regressions = compare(results, baseline['results'], args.threshold)
+        if regressions:
+            print("\n%d scenario(s) are slower: %s" % (len(regressions), ", ".join(regressions)))
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,177 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""
+Generate a synthetic OpenCorpora corpus (annot.opcorpora.xml format).
+
+Usage::
+
+    $ python benchmarks/synthetic.py corpus.xml --size-mb 500 --ambiguity 0.3
+
+Output is deterministic: the same options and seed give the same file.
+Words, lemmas and tags are random, but documents have the usual
+structure (document tags, paragraphs, sentences, tokens with one or
+more parses) and parent documents without text, like real sources.
+"""
+from __future__ import absolute_import, print_function, division
+import io
+import os
+import sys
+import random
+import argparse
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), '..'))
+
+from xml.sax.saxutils import quoteattr
+
+from opencorpora.grammemes import GRAMMEMES
+
+LETTERS = 'абвгдеёжзийклмнопрстуфхцчшщъыьэюя'
+POS = GRAMMEMES[:17]
+FEATURES = [g for g in GRAMMEMES[25:] if g[0].islower()]
+PUNCTUATION = [',', '.', '—', '«', '»', ':', '?', '!', '&']
+CATEGORY_TYPES = ['Автор', 'Год', 'Тема:ЧасКор', 'Тип', 'url']
+
+
+def _escape(text):
+    return quoteattr(text)[1:-1]
+
+
+class Generator(object):
+    """
+    Synthetic corpus generator.
+
+    ``ambiguity`` is a share of words with several parses; ``num_tags``
+    is a number of distinct morphological tags, ``num_categories`` is
+    a number of distinct document tags (categories);
+    ``vocabulary`` is a number of distinct words.
+    """
+
+    def __init__(self, seed=0, ambiguity=0.2, num_tags=300, num_categories=100,
+                 vocabulary=20000, doc_sentences=(5, 80), sentence_tokens=(3, 30)):
+        self.rng = random.Random(seed)
+        self.doc_sentences = doc_sentences
+        self.sentence_tokens = sentence_tokens
+        self.tags = [self._tag() for _ in range(num_tags)]
+        self.categories = [
+            '%s:%s %d' % (self.rng.choice(CATEGORY_TYPES), self._word(4, 8), i)
+            for i in range(num_categories)
+        ]
+        self.words = [self._entry(i, ambiguity) for i in range(vocabulary)]
+        self.punctuation = [
+            (p, '<v><l id="0" t="%s"><g v="PNCT"/></l></v>' % _escape(p))
+            for p in PUNCTUATION
+        ]
+        self.doc_id = self.par_id = self.sent_id = self.token_id = 0
+
+    def _word(self, min_length=2, max_length=12):
+        length = self.rng.randint(min_length, max_length)
+        return ''.join(self.rng.choice(LETTERS) for _ in range(length))
+
+    def _tag(self):
+        features = self.rng.sample(FEATURES, self.rng.randint(0, 5))
+        return [self.rng.choice(POS)] + features
+
+    def _entry(self, index, ambiguity):
+        form = self._word()
+        num_parses = 1
+        if self.rng.random() < ambiguity:
+            num_parses = self.rng.randint(2, 4)
+        parses = []
+        for _ in range(num_parses):
+            lemma = form[:max(2, len(form) - self.rng.randint(0, 3))]
+            grammemes = ''.join('<g v="%s"/>' % g for g in self.rng.choice(self.tags))
+            parses.append('<v><l id="%d" t="%s">%s</l></v>' % (
+                index + 1, lemma, grammemes))
+        return form, ''.join(parses)
+
+    def document(self, parent=None):
+        """ Return XML of a next document (a parent document if parent is None). """
+        self.doc_id += 1
+        rng = self.rng
+        lines = ['  <text id="%d" parent="%d" name="%s %d">' % (
+            self.doc_id, parent or 0, self._word(5, 10), self.doc_id)]
+        lines.append('    <tags>')
+        for category in rng.sample(self.categories, rng.randint(1, min(5, len(self.categories)))):
+            lines.append('      <tag>%s</tag>' % _escape(category))
+        lines.append('    </tags>')
+        lines.append('    <paragraphs>')
+        num_sentences = 0 if parent is None else rng.randint(*self.doc_sentences)
+        while num_sentences > 0:
+            self.par_id += 1
+            lines.append('      <paragraph id="%d">' % self.par_id)
+            for _ in range(min(num_sentences, rng.randint(1, 6))):
+                lines.extend(self._sentence())
+                num_sentences -= 1
+            lines.append('      </paragraph>')
+        lines.append('    </paragraphs>')
+        lines.append('  </text>')
+        return '\n'.join(lines) + '\n'
+
+    def _sentence(self):
+        rng = self.rng
+        self.sent_id += 1
+        tokens = [rng.choice(self.words) for _ in range(rng.randint(*self.sentence_tokens))]
+        tokens.append(rng.choice(self.punctuation))
+        lines = [
+            '        <sentence id="%d">' % self.sent_id,
+            '          <source>%s</source>' % _escape(' '.join(form for form, _ in tokens)),
+            '          <tokens>',
+        ]
+        for form, parses in tokens:
+            self.token_id += 1
+            lines.append(
+                '            <token id="%d" text="%s"><tfr rev_id="%d" t="%s">%s</tfr></token>' % (
+                    self.token_id, _escape(form), self.token_id + 1000000, _escape(form), parses))
+        lines.append('          </tokens>')
+        lines.append('        </sentence>')
+        return lines
+
+
+def generate(path, size_mb=10, revision=1, children=20, **kwargs):
+    """
+    Write a synthetic corpus of about ``size_mb`` megabytes to ``path``.
+    Every parent document has ``children`` child documents.
+    Other keyword arguments are passed to :class:`Generator`.
+    Return the number of tokens.
+    """
+    generator = Generator(**kwargs)
+    limit = size_mb * 1024 * 1024
+    with io.open(path, 'w', encoding='utf8') as out:
+        out.write('<?xml version="1.0" encoding="utf-8" standalone="yes"?>\n')
+        out.write('<annotation version="0.12" revision="%d">\n' % revision)
+        size = 0
+        while size < limit:
+            parent = generator.doc_id + 1
+            doc = generator.document()
+            size += len(doc.encode('utf8'))
+            out.write(doc)
+            for _ in range(children):
+                if size >= limit:
+                    break
+                doc = generator.document(parent)
+                size += len(doc.encode('utf8'))
+                out.write(doc)
+        out.write('</annotation>\n')
+    return generator.token_id
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('output', help='output XML file')
+    parser.add_argument('--size-mb', type=float, default=10, help='approximate file size')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ambiguity', type=float, default=0.2,
+                        help='share of words with several parses')
+    parser.add_argument('--tags', type=int, default=300,
+                        help='number of distinct morphological tags')
+    parser.add_argument('--categories', type=int, default=100,
+                        help='number of distinct document categories')
+    args = parser.parse_args()
+    num_tokens = generate(args.output, args.size_mb, seed=args.seed, ambiguity=args.ambiguity,
+                          num_tags=args.tags, num_categories=args.categories)
+    print("%s: %d tokens, %0.1f MB" % (
+        args.output, num_tokens, os.path.getsize(args.output) / 1024 / 1024))
+
+
+if __name__ == '__main__':
+    sys.exit(main())
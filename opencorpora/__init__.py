@@ -1,4 +1,5 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
 from .reader import CorpusReader
+from .parallel import ParallelCorpusReader
 from .reader_lxml import load
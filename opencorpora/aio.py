@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+"""
+asyncio facade for CorpusReader.
+
+Blocking work (reading and parsing XML) is done in a thread pool,
+or in worker processes with ``processes=True``; the event loop only
+waits for results::
+
+    async with AsyncCorpusReader('annot.opcorpora.xml', max_in_flight=16) as corpus:
+        doc = await corpus.get_document(44)
+        docs = await corpus.get_documents(['44', '45', '46'])
+        async for sent in corpus.iter_tagged_sents(categories='Год:2010'):
+            ...
+
+All tasks share the wrapped reader, so the document index, the sentence
+index and the document cache (``document_cache_size`` and
+``document_cache_bytes`` reader options) are loaded once.
+"""
+from __future__ import absolute_import
+import asyncio
+import collections
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from opencorpora import compat, compressed, parallel, streaming
+from opencorpora.reader import CorpusReader, Document
+
+DEFAULT_MAX_IN_FLIGHT = 8
+
+
+def _parse_document(bounds):
+    """ Parse a document in a worker process (ElementTrees are picklable). """
+    chunk = parallel._worker_source.chunk(bounds)
+    try:
+        return compat.ElementTree.XML(chunk)
+    finally:
+        chunk.release()
+
+
+def _async_view(doc_method):
+    def method(self, fileids=None, categories=None):
+        return AsyncView(self, doc_method, fileids, categories)
+    method.__name__ = str(doc_method)
+    method.__doc__ = "Async iterator over ``CorpusReader.%s`` results." % doc_method
+    return method
+
+
+class AsyncCorpusReader(object):
+    """
+    Wrapper for a CorpusReader (or a corpus file name; other keyword
+    arguments are passed to CorpusReader) with coroutine methods.
+
+    ``executor`` is a thread pool to use; by default a pool of
+    ``max_workers`` threads is created. With ``processes=True``
+    documents are read and parsed in ``max_workers`` processes instead.
+    At most ``max_in_flight`` blocking calls are submitted at a time;
+    views fetch up to this number of documents ahead.
+    """
+
+    def __init__(self, reader, executor=None, max_workers=None, processes=False,
+                 max_in_flight=DEFAULT_MAX_IN_FLIGHT, **reader_kwargs):
+        self._owns_reader = not isinstance(reader, CorpusReader)
+        if self._owns_reader:
+            reader = CorpusReader(reader, **reader_kwargs)
+        self.reader = reader
+        self.max_workers = max_workers
+        self.processes = processes and executor is None
+        self.max_in_flight = max_in_flight
+        self._owns_executor = executor is None
+        self._executor = executor
+        self._semaphore = None
+        self._prepared = set()
+        self._prepare_lock = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def close(self):
+        """ Shut down the executor (if it was created here) and close the reader. """
+        if self._owns_executor and self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        if self._owns_reader:
+            self.reader.close()
+
+    def _get_executor(self):
+        if self._executor is None:
+            if self.processes:
+                self._executor = ProcessPoolExecutor(
+                    self.max_workers, initializer=parallel._init_worker,
+                    initargs=(self.reader.filename, self.reader._block_index_filename()))
+            else:
+                self._executor = ThreadPoolExecutor(self.max_workers)
+        return self._executor
+
+    async def _call(self, func, *args):
+        """ Run a blocking function in the executor. """
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        async with self._semaphore:
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(self._get_executor(), func, *args)
+
+    async def _prepare(self, name, func):
+        """
+        Run ``func`` once in a thread before other calls which need it:
+        lazy index loading in CorpusReader is not thread-safe.
+        """
+        if name in self._prepared:
+            return
+        if self._prepare_lock is None:
+            self._prepare_lock = asyncio.Lock()
+        async with self._prepare_lock:
+            if name not in self._prepared:
+                loop = asyncio.get_event_loop()
+                await loop.run_in_executor(None, func)
+                self._prepared.add(name)
+
+    def _prepare_documents(self):
+        self.reader._get_meta()
+        source = self.reader._get_source()
+        if isinstance(source, compressed.Bz2BlockFile):
+            # build the block index once instead of in every worker
+            source.ensure_index()
+
+    async def get_document(self, doc_id):
+        """ Return a Document for a given doc_id (see CorpusReader.get_document). """
+        await self._prepare('documents', self._prepare_documents)
+        if not self.processes:
+            return await self._call(self.reader.get_document, doc_id)
+
+        reader, doc_id = self.reader, str(doc_id)
+        bounds = reader._get_meta()[doc_id].bounds
+        if reader.document_cache is not None:
+            doc = reader.document_cache.get(doc_id)
+            if doc is not None:
+                return doc
+        doc = Document(await self._call(_parse_document, bounds), reader.stats)
+        if reader.document_cache is not None:
+            reader.document_cache.put(doc_id, doc, bounds.byte_end - bounds.byte_start)
+        return doc
+
+    async def get_documents(self, doc_ids):
+        """
+        Return a list of Documents. In threads this is a single
+        CorpusReader.get_documents call with coalesced reads;
+        worker processes fetch documents concurrently.
+        """
+        if not self.processes:
+            await self._prepare('documents', self._prepare_documents)
+            return await self._call(self.reader.get_documents, list(doc_ids))
+        return list(await asyncio.gather(*[self.get_document(doc_id) for doc_id in doc_ids]))
+
+    async def get_sentence(self, sent_id):
+        """ Return a Sentence for a given OpenCorpora sentence id. """
+        await self._prepare('documents', self._prepare_documents)
+        await self._prepare('sentences', self.reader._get_sentence_index)
+        if self.processes:
+            # sentences are small: parse them in a thread
+            loop = asyncio.get_event_loop()
+            return await loop.run_in_executor(None, self.reader.get_sentence, sent_id)
+        return await self._call(self.reader.get_sentence, sent_id)
+
+    async def fileids(self, categories=None):
+        return await self._filter_ids(None, categories)
+
+    async def _filter_ids(self, fileids, categories):
+        await self._prepare('documents', self._prepare_documents)
+        return list(self.reader._filter_ids(fileids, categories))
+
+    async def _document_view(self, doc_id, doc_method):
+        if not self.processes:
+            return await self._call(self.reader._document_view, doc_id, doc_method)
+        bounds = self.reader._get_meta()[doc_id].bounds
+        results = await self._call(parallel._process_document, (bounds, doc_method))
+        if doc_method in streaming.VIEWS:
+            results = self.reader._convert_tags(results, doc_method)
+        return results
+
+    iter_paras = _async_view('iter_paras')
+    iter_raw_paras = _async_view('iter_raw_paras')
+    iter_tagged_paras = _async_view('iter_tagged_paras')
+    iter_parsed_paras = _async_view('iter_parsed_paras')
+    iter_sents = _async_view('iter_sents')
+    iter_raw_sents = _async_view('iter_raw_sents')
+    iter_tagged_sents = _async_view('iter_tagged_sents')
+    iter_parsed_sents = _async_view('iter_parsed_sents')
+    iter_words = _async_view('iter_words')
+    iter_tagged_words = _async_view('iter_tagged_words')
+    iter_parsed_words = _async_view('iter_parsed_words')
+
+
+class AsyncView(object):
+    """
+    Async iterator over results of a CorpusReader view. Documents are
+    processed in the executor, up to ``max_in_flight`` documents ahead
+    of the consumer; results are returned in document order.
+    """
+
+    def __init__(self, areader, doc_method, fileids, categories):
+        self._areader = areader
+        self._doc_method = doc_method
+        self._fileids = fileids
+        self._categories = categories
+        self._doc_ids = None
+        self._pending = collections.deque()
+        self._results = iter(())
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        while True:
+            for res in self._results:
+                return res
+            if self._doc_ids is None:
+                self._doc_ids = iter(await self._areader._filter_ids(
+                    self._fileids, self._categories))
+            self._schedule()
+            if not self._pending:
+                raise StopAsyncIteration
+            self._results = iter(await self._pending.popleft())
+
+    def _schedule(self):
+        while len(self._pending) < self._areader.max_in_flight:
+            doc_id = next(self._doc_ids, None)
+            if doc_id is None:
+                return
+            self._pending.append(asyncio.ensure_future(
+                self._areader._document_view(doc_id, self._doc_method)))
+
+    def cancel(self):
+        """ Cancel documents which are being fetched ahead. """
+        while self._pending:
+            self._pending.popleft().cancel()
@@ -0,0 +1,240 @@
+# -*- coding: utf-8 -*-
+"""
+Batches of padded integer features for training taggers.
+
+Sentences are encoded with a shared :class:`FeatureVocabulary` and grouped
+into :class:`Batch` tuples of flat row-major ``array`` buffers, which can be
+wrapped by NumPy without copying::
+
+    >>> vocab = FeatureVocabulary()
+    >>> for batch in batches(corpus.iter_parsed_sents(), vocab, batch_size=64):
+    ...     n = len(batch.lengths)
+    ...     forms = numpy.frombuffer(batch.forms, dtype=numpy.uint32).reshape(n, -1)
+    ...     grammemes = numpy.frombuffer(batch.grammemes, dtype=numpy.uint8).reshape(
+    ...         n, batch.max_length, batch.num_grammemes)  # doctest: +SKIP
+
+Features of a token are taken from its first parse. The fastest source
+is a :class:`~opencorpora.columnar.ColumnarCorpus`: its integer arrays
+are translated to vocabulary ids with lookup tables, strings
+are not decoded for every token.
+"""
+from __future__ import absolute_import
+import io
+import json
+import array
+import random
+import itertools
+from collections import namedtuple
+
+from opencorpora.grammemes import GrammemeRegistry
+from opencorpora.columnar import ColumnarCorpus
+
+# ``forms`` and ``lemmas`` are vocabulary ids of shape
+# (sentences, max_length); ``grammemes`` is a multi-hot byte array of shape
+# (sentences, max_length, num_grammemes); padding is 0.
+Batch = namedtuple('Batch', 'forms lemmas grammemes lengths max_length num_grammemes')
+
+
+class Vocabulary(object):
+    """
+    Mapping of strings to integer ids. Id 0 is reserved for padding and
+    id 1 for unknown strings; new strings get new ids unless
+    the vocabulary is frozen.
+    """
+    PADDING, UNKNOWN = 0, 1
+
+    def __init__(self, strings=(), frozen=False):
+        self.strings = [None, None]
+        self._ids = {}
+        self.frozen = False
+        for string in strings:
+            self.id(string)
+        self.frozen = frozen
+
+    def __len__(self):
+        return len(self.strings)
+
+    def __contains__(self, string):
+        return string in self._ids
+
+    def id(self, string):
+        """ Return id of a string, registering it if the vocabulary isn't frozen. """
+        try:
+            return self._ids[string]
+        except KeyError:
+            if self.frozen:
+                return self.UNKNOWN
+            self._ids[string] = len(self.strings)
+            self.strings.append(string)
+            return self._ids[string]
+
+    def string(self, string_id):
+        """ Return a string for an id (None for padding and unknown ids). """
+        return self.strings[string_id]
+
+
+class FeatureVocabulary(object):
+    """
+    Vocabularies of forms, lemmas and tags plus a fixed grammeme inventory
+    for multi-hot vectors. Grammemes registered in ``registry`` after
+    the vocabulary is created are not encoded.
+
+    Share one instance between training and inference; use :meth:`save`
+    and :meth:`load` to store it.
+    """
+
+    def __init__(self, forms=None, lemmas=None, registry=None, tags=()):
+        self.forms = forms if forms is not None else Vocabulary()
+        self.lemmas = lemmas if lemmas is not None else Vocabulary()
+        self.registry = registry if registry is not None else GrammemeRegistry()
+        self.num_grammemes = len(self.registry)
+        self.tags = Vocabulary()
+        self._rows = [b'\0' * self.num_grammemes] * 2
+        for tag in tags:
+            self.tag_id(tag)
+
+    def freeze(self):
+        """ Stop adding new forms and lemmas (they are encoded as unknown). """
+        self.forms.frozen = self.lemmas.frozen = True
+
+    def tag_id(self, tag):
+        """ Return id of a tag string; all tags get ids, even when frozen. """
+        tag_id = self.tags.id(tag)
+        if tag_id == len(self._rows):
+            row = bytearray(self.num_grammemes)
+            for grammeme in self.registry.tag(tag).grammemes:
+                bit = self.registry.bit(grammeme)
+                if bit < self.num_grammemes:
+                    row[bit] = 1
+            self._rows.append(bytes(row))
+        return tag_id
+
+    def grammeme_row(self, tag_id):
+        """ Multi-hot grammeme vector (bytes) for a tag id. """
+        return self._rows[tag_id]
+
+    def save(self, path):
+        data = {
+            'forms': self.forms.strings[2:],
+            'lemmas': self.lemmas.strings[2:],
+            'tags': self.tags.strings[2:],
+            'grammemes': self.registry.grammemes[:self.num_grammemes],
+        }
+        with io.open(path, 'wb') as f:
+            f.write(json.dumps(data, ensure_ascii=False).encode('utf8'))
+
+    @classmethod
+    def load(cls, path, frozen=True):
+        with io.open(path, 'rb') as f:
+            data = json.loads(f.read().decode('utf8'))
+        vocab = cls(Vocabulary(data['forms']), Vocabulary(data['lemmas']),
+                    GrammemeRegistry(data['grammemes']), data['tags'])
+        if frozen:
+            vocab.freeze()
+        return vocab
+
+
+def batches(sentences, vocab, batch_size=32, max_length=None,
+            shuffle_buffer=0, seed=None, drop_last=False):
+    """
+    Yield :class:`Batch` tuples of up to ``batch_size`` sentences.
+
+    ``sentences`` is a ColumnarCorpus or an iterable of parsed sentences
+    (lists of ``(form, [(lemma, tag), ...])`` tuples, like
+    ``CorpusReader.iter_parsed_sents()``). Sentences are padded to the
+    longest sentence in a batch, or truncated and padded to ``max_length``
+    if it is given. With ``shuffle_buffer`` sentences are shuffled using
+    a buffer of this size (a larger buffer gives a more uniform order).
+    """
+    if isinstance(sentences, ColumnarCorpus):
+        encoded = encode_columnar(sentences, vocab)
+    else:
+        encoded = encode_sentences(sentences, vocab)
+    if shuffle_buffer:
+        encoded = _shuffled(encoded, shuffle_buffer, random.Random(seed))
+
+    while True:
+        chunk = list(itertools.islice(encoded, batch_size))
+        if not chunk or (drop_last and len(chunk) < batch_size):
+            return
+        yield _make_batch(chunk, vocab, max_length)
+
+
+def encode_sentences(sentences, vocab):
+    """
+    Yield (form ids, lemma ids, tag ids) arrays for parsed sentences.
+    """
+    form_id, lemma_id, tag_id = vocab.forms.id, vocab.lemmas.id, vocab.tag_id
+    for sent in sentences:
+        forms, lemmas, tags = array.array('I'), array.array('I'), array.array('I')
+        for form, parses in sent:
+            forms.append(form_id(form))
+            if parses:
+                lemma, tag = parses[0]
+                lemmas.append(lemma_id(lemma))
+                tags.append(tag_id(tag))
+            else:
+                lemmas.append(Vocabulary.UNKNOWN)
+                tags.append(Vocabulary.UNKNOWN)
+        yield forms, lemmas, tags
+
+
+def encode_columnar(store, vocab, fileids=None):
+    """
+    Yield (form ids, lemma ids, tag ids) arrays for sentences
+    of a ColumnarCorpus ``store``.
+    """
+    form_map = array.array('I', [vocab.forms.id(s) for s in store.strings('form_vocab')])
+    lemma_map = array.array('I', [vocab.lemmas.id(s) for s in store.strings('lemma_vocab')])
+    tag_map = array.array('I', [vocab.tag_id(s) for s in store.strings('tag_vocab')])
+    forms, lemmas, tags = store.forms, store.lemmas, store.tags
+    parse_offsets = store.parse_offsets
+    unknown = Vocabulary.UNKNOWN
+    for start, end in store.iter_sent_ranges(fileids):
+        # a token without parses has equal start and end parse offsets
+        parse_ranges = list(zip(parse_offsets[start:end], parse_offsets[start + 1:end + 1]))
+        yield (
+            array.array('I', [form_map[form] for form in forms[start:end]]),
+            array.array('I', [lemma_map[lemmas[p]] if p != q else unknown
+                              for p, q in parse_ranges]),
+            array.array('I', [tag_map[tags[p]] if p != q else unknown
+                              for p, q in parse_ranges]),
+        )
+
+
+def _shuffled(items, buffer_size, rng):
+    buf = []
+    for item in items:
+        if len(buf) < buffer_size:
+            buf.append(item)
+            continue
+        index = rng.randrange(buffer_size)
+        yield buf[index]
+        buf[index] = item
+    rng.shuffle(buf)
+    for item in buf:
+        yield item
+
+
+def _make_batch(sentences, vocab, max_length):
+    lengths = array.array('I', [len(forms) for forms, _, _ in sentences])
+    if max_length is None:
+        width = max(lengths)
+    else:
+        width = max_length
+        lengths = array.array('I', [min(length, width) for length in lengths])
+
+    padding = array.array('I', [Vocabulary.PADDING]) * width
+    row_padding = b'\0' * vocab.num_grammemes
+    rows = vocab._rows
+    forms, lemmas, grammemes = array.array('I'), array.array('I'), []
+    for (sent_forms, sent_lemmas, sent_tags), length in zip(sentences, lengths):
+        forms.extend(sent_forms[:length])
+        forms.extend(padding[length:])
+        lemmas.extend(sent_lemmas[:length])
+        lemmas.extend(padding[length:])
+        grammemes.extend(rows[tag] for tag in sent_tags[:length])
+        grammemes.append(row_padding * (width - length))
+
+    return Batch(forms, lemmas, array.array('B', b''.join(grammemes)),
+                 lengths, width, vocab.num_grammemes)
@@ -0,0 +1,171 @@
+# -*- coding: utf-8 -*-
+"""
+Simple versioned binary container format used for on-disk indexes.
+
+A file consists of a fixed prefix (magic, format version, header length),
+a JSON header and a number of named sections. Each section is a
+fixed-width array stored in native byte order and aligned to 8 bytes,
+so it can be used directly from a memory-mapped file via memoryview.
+"""
+from __future__ import absolute_import
+import os
+import sys
+import json
+import mmap
+import array
+import struct
+import tempfile
+from opencorpora import compat
+
+_PREFIX = struct.Struct('<8sII')
+_ALIGN = 8
+
+
+class FormatError(ValueError):
+    """ File is not a valid index file of the expected kind and version. """
+
+
+def string_table(strings):
+    """
+    Encode a list of unicode strings as (offsets, data) arrays.
+    String ``i`` is ``data[offsets[i]:offsets[i+1]]``.
+    """
+    offsets = array.array('Q', [0])
+    data = bytearray()
+    for s in strings:
+        data += s.encode('utf8')
+        offsets.append(len(data))
+    return offsets, array.array('B', bytes(data))
+
+
+def write(filename, magic, version, meta, sections):
+    """
+    Write a binary file atomically. ``sections`` is a list
+    of (name, array.array) pairs; string tables should be added
+    as two sections named ``<name>.offsets`` and ``<name>.data``.
+    """
+    layout = {}
+    offset = 0
+    for name, values in sections:
+        size = len(values) * values.itemsize
+        layout[name] = [values.typecode, offset, len(values)]
+        offset += _aligned(size)
+
+    header = json.dumps({
+        'byteorder': sys.byteorder,
+        'meta': meta,
+        'sections': layout,
+    }).encode('utf8')
+    header_size = _aligned(_PREFIX.size + len(header)) - _PREFIX.size
+
+    dirname = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_name = tempfile.mkstemp(dir=dirname, prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(_PREFIX.pack(magic, version, header_size))
+            f.write(header.ljust(header_size, b' '))
+            for name, values in sections:
+                data = values.tobytes()
+                f.write(data)
+                f.write(b'\0' * (_aligned(len(data)) - len(data)))
+        compat.replace_file(tmp_name, filename)
+    except Exception:
+        os.remove(tmp_name)
+        raise
+
+
+class SectionFile(object):
+    """
+    Read-only memory-mapped binary file written by :func:`write`.
+    Opening a file only reads its header; sections are
+    accessed lazily as memoryviews.
+    """
+
+    def __init__(self, filename, magic, version):
+        with open(filename, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file
+                raise FormatError("%s is empty" % filename)
+        self._views = {}
+        try:
+            self._read_header(filename, magic, version)
+        except Exception:
+            self.close()
+            raise
+
+    def _read_header(self, filename, magic, version):
+        if len(self._mmap) < _PREFIX.size:
+            raise FormatError("%s is too short" % filename)
+        file_magic, file_version, header_size = _PREFIX.unpack_from(self._mmap)
+        if file_magic != magic:
+            raise FormatError("%s is not a %r file" % (filename, magic))
+        if file_version != version:
+            raise FormatError("%s has format version %s, expected %s" % (
+                filename, file_version, version))
+        start = _PREFIX.size
+        try:
+            header = json.loads(self._mmap[start:start + header_size].decode('utf8'))
+        except ValueError:
+            raise FormatError("%s has a broken header" % filename)
+        if header['byteorder'] != sys.byteorder:
+            raise FormatError("%s has a wrong byte order" % filename)
+        self.meta = header['meta']
+        self._sections = header['sections']
+        self._data_start = start + header_size
+
+    def __contains__(self, name):
+        return name in self._sections
+
+    def array(self, name):
+        """ Return a section as a memoryview of the stored typecode. """
+        if name not in self._views:
+            typecode, offset, length = self._sections[name]
+            start = self._data_start + offset
+            size = length * array.array(typecode).itemsize
+            view = memoryview(self._mmap)[start:start + size]
+            self._views[name] = view.cast(str(typecode))
+        return self._views[name]
+
+    def strings(self, name):
+        return StringTable(self.array(name + '.offsets'), self.array(name + '.data'))
+
+    def close(self):
+        if self._mmap is None:
+            return
+        for view in self._views.values():
+            view.release()
+        self._views.clear()
+        self._mmap.close()
+        self._mmap = None
+
+    @property
+    def closed(self):
+        return self._mmap is None
+
+
+class StringTable(object):
+    """ Sequence of strings stored in (offsets, data) arrays. """
+
+    def __init__(self, offsets, data):
+        self.offsets = offsets
+        self.data = data
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, index):
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError(index)
+        start, end = self.offsets[index], self.offsets[index + 1]
+        return self.data[start:end].tobytes().decode('utf8')
+
+    def __iter__(self):
+        for index in range(len(self)):
+            yield self[index]
+
+
+def _aligned(size):
+    return (size + _ALIGN - 1) // _ALIGN * _ALIGN
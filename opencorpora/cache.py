@@ -0,0 +1,71 @@
+# -*- coding: utf-8 -*-
+"""
+Thread-safe LRU cache bounded by number of entries and/or total size.
+"""
+from __future__ import absolute_import
+import threading
+from collections import OrderedDict, namedtuple
+
+CacheInfo = namedtuple('CacheInfo', 'hits misses evictions entries size')
+
+
+class LRUCache(object):
+    """
+    LRU cache. ``max_entries`` limits the number of entries and ``max_size``
+    limits the sum of entry sizes (passed to :meth:`put`); None means
+    "no limit". An entry larger than ``max_size`` is not cached.
+    """
+
+    def __init__(self, max_entries=None, max_size=None):
+        self.max_entries = max_entries
+        self.max_size = max_size
+        self._data = OrderedDict()  # key -> (value, size)
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def get(self, key, default=None):
+        with self._lock:
+            try:
+                value, size = self._data.pop(key)
+            except KeyError:
+                self.misses += 1
+                return default
+            self._data[key] = value, size
+            self.hits += 1
+            return value
+
+    def put(self, key, value, size=1):
+        with self._lock:
+            if key in self._data:
+                self._size -= self._data.pop(key)[1]
+            if self.max_size is not None and size > self.max_size:
+                return
+            self._data[key] = value, size
+            self._size += size
+            self._evict()
+
+    def _evict(self):
+        while self._data and (
+                (self.max_entries is not None and len(self._data) > self.max_entries) or
+                (self.max_size is not None and self._size > self.max_size)):
+            key, (value, size) = self._data.popitem(last=False)
+            self._size -= size
+            self.evictions += 1
+
+    def __contains__(self, key):
+        return key in self._data
+
+    def __len__(self):
+        return len(self._data)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._size = 0
+
+    def info(self):
+        """ Return CacheInfo with hit/miss counters and current size. """
+        with self._lock:
+            return CacheInfo(self.hits, self.misses, self.evictions,
+                             len(self._data), self._size)
@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+Category -> documents inverted index and category queries.
+
+Glob patterns are compiled once and matched against the set of distinct
+categories, not against every document. Queries can be combined
+with ``&``, ``|`` and ``~``::
+
+    >>> query = Category('Автор:*') & ~Category('Год:2008')
+
+"""
+from __future__ import absolute_import
+import re
+import fnmatch
+import functools
+from opencorpora import compat
+
+# maximum number of compiled glob patterns kept in memory
+PATTERN_CACHE_SIZE = 256
+
+
+@functools.lru_cache(maxsize=PATTERN_CACHE_SIZE)
+def compile_pattern(pattern):
+    """ Return a compiled regex for a fnmatch-style glob pattern. """
+    return re.compile(fnmatch.translate(pattern))
+
+
+class Query(object):
+    """ Base class for category queries. """
+
+    def __and__(self, other):
+        return And(self, as_query(other))
+
+    def __or__(self, other):
+        return Or(self, as_query(other))
+
+    def __invert__(self):
+        return Not(self)
+
+    def positions(self, index):
+        """ Return a set of matching document positions. """
+        raise NotImplementedError()
+
+
+class Category(Query):
+    """ Documents with a category matching a glob ``pattern``. """
+
+    def __init__(self, pattern):
+        self.pattern = pattern
+
+    def positions(self, index):
+        return index.match(self.pattern)
+
+    def __repr__(self):
+        return "Category(%r)" % self.pattern
+
+
+class And(Query):
+    def __init__(self, *queries):
+        self.queries = queries
+
+    def positions(self, index):
+        result = self.queries[0].positions(index)
+        for query in self.queries[1:]:
+            result &= query.positions(index)
+        return result
+
+    def __repr__(self):
+        return "(%s)" % " & ".join(map(repr, self.queries))
+
+
+class Or(Query):
+    def __init__(self, *queries):
+        self.queries = queries
+
+    def positions(self, index):
+        result = set()
+        for query in self.queries:
+            result |= query.positions(index)
+        return result
+
+    def __repr__(self):
+        return "(%s)" % " | ".join(map(repr, self.queries))
+
+
+class Not(Query):
+    def __init__(self, query):
+        self.query = query
+
+    def positions(self, index):
+        return set(range(len(index.doc_ids))) - self.query.positions(index)
+
+    def __repr__(self):
+        return "~%r" % (self.query,)
+
+
+def as_query(categories):
+    """
+    Convert ``categories`` argument of CorpusReader methods to a Query:
+    a pattern or a list of patterns means "any of them matches".
+    """
+    if isinstance(categories, Query):
+        return categories
+    if isinstance(categories, compat.string_types):
+        return Category(categories)
+    return Or(*[Category(pattern) for pattern in categories])
+
+
+class CategoryIndex(object):
+    """
+    Inverted index: category -> positions of documents (in file order).
+    """
+
+    def __init__(self, doc_ids, categories, postings):
+        self.doc_ids = doc_ids
+        self.categories = categories
+        self._postings = postings
+        self._positions = None
+
+    @classmethod
+    def from_meta(cls, meta):
+        """ Build the index from document metadata mapping. """
+        postings = {}
+        doc_ids = []
+        for pos, (doc_id, doc_meta) in enumerate(meta.items()):
+            doc_ids.append(doc_id)
+            for cat in doc_meta.categories:
+                postings.setdefault(cat, []).append(pos)
+        categories = sorted(postings)
+        return cls(doc_ids, categories, [postings[cat] for cat in categories])
+
+    def postings(self, cat_id):
+        """ Positions of documents with category ``categories[cat_id]``. """
+        return self._postings[cat_id]
+
+    def match(self, pattern):
+        """ Return a set of positions of documents matching a pattern. """
+        regex = compile_pattern(pattern)
+        result = set()
+        for cat_id, cat in enumerate(self.categories):
+            if regex.match(cat):
+                result.update(self.postings(cat_id))
+        return result
+
+    def position(self, doc_id):
+        if self._positions is None:
+            self._positions = dict(
+                (doc_id, pos) for pos, doc_id in enumerate(self.doc_ids))
+        return self._positions[doc_id]
+
+    def select(self, categories, fileids=None):
+        """
+        Return ids of documents matching ``categories`` query
+        (a pattern, a list of patterns or a Query). Ids are returned
+        in file order or in ``fileids`` order if it is passed.
+        """
+        positions = as_query(categories).positions(self)
+        if fileids is None:
+            return [self.doc_ids[pos] for pos in sorted(positions)]
+        return [doc_id for doc_id in fileids if self.position(doc_id) in positions]
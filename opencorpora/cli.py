@@ -2,14 +2,23 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, division
 import sys
-import bz2
 import argparse
+from collections import Counter
+from opencorpora import diff
 from opencorpora.compat import urlopen
+from opencorpora.download import download as download_file
+from opencorpora.indexing import DocumentMeta
+from opencorpora.reader import CorpusReader
+from opencorpora.instrumentation import clock
 
 FULL_CORPORA_URL_BZ2 = 'http://opencorpora.org/files/export/annot/annot.opcorpora.xml.bz2'
 DISAMBIGUATED_CORPORA_URL_BZ2 = 'http://opencorpora.org/files/export/annot/annot.opcorpora.no_ambig.xml.bz2'
 DEFAULT_OUT_FILE = 'annot.opcorpora.xml.bz2'
 CHUNK_SIZE = 256*1024
+DEFAULT_JOBS = 4
+STATS_VIEWS = ['iter_words', 'iter_tagged_words', 'iter_parsed_words',
+               'iter_sents', 'iter_tagged_sents', 'iter_parsed_sents', 'iter_raw_sents',
+               'iter_paras', 'iter_tagged_paras', 'iter_parsed_paras', 'iter_raw_paras']
 
 parser = argparse.ArgumentParser(
     description='opencorpora.org interface',
@@ -26,25 +35,57 @@ parser_download.add_argument('-d', '--disambig', help='download disambiguated co
 parser_download.add_argument('--url', help='download url', default=FULL_CORPORA_URL_BZ2)
 parser_download.add_argument('--no-decompress',  help='do not decompress data', action='store_true')
 parser_download.add_argument('-q', '--quiet', help='be less noisy', action='store_true')
+parser_download.add_argument('-j', '--jobs', type=int, help='number of concurrent connections', default=DEFAULT_JOBS)
+parser_download.add_argument('--sha256', help='expected SHA-256 digest of the downloaded file')
 
-
-def _download_file(url, out_fp, decompress=True, chunk_size=CHUNK_SIZE, on_chunk=lambda:None):
-    decompressor = bz2.BZ2Decompressor()
-    fp = urlopen(url, timeout=30)
-
-    while 1:
-        data = fp.read(chunk_size)
-        if not data:
-            break
-
-        if decompress:
-            out_fp.write(decompressor.decompress(data))
-        else:
-            out_fp.write(data)
-        on_chunk()
-
-
-def _download(out_file, decompress, disambig, url, verbose=True):
+parser_diff = subparsers.add_parser('diff',
+    help='show documents, sentences and tokens changed between two corpus revisions',
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter
+)
+parser_diff.add_argument('old', help='old corpus XML file')
+parser_diff.add_argument('new', help='new corpus XML file')
+parser_diff.add_argument('--kinds', help='comma-separated list of item kinds to report '
+                                         '(document, sentence, token)')
+parser_diff.add_argument('--summary', help='only print the number of changes', action='store_true')
+
+parser_stats = subparsers.add_parser('stats',
+    help='read a corpus and show where the time goes (I/O, parsing, view extraction)',
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter
+)
+parser_stats.add_argument('corpus', help='corpus XML file')
+parser_stats.add_argument('--view', default='iter_tagged_words', choices=STATS_VIEWS,
+                          help='CorpusReader view to iterate over')
+parser_stats.add_argument('--categories', help='only read documents from these categories')
+parser_stats.add_argument('--tree', action='store_true',
+                          help='build ElementTrees instead of using the streaming parser')
+parser_stats.add_argument('--no-cache', action='store_true', help='do not use index files')
+
+parser_concordance = subparsers.add_parser('concordance',
+    help='show keyword-in-context lines for a lemma, word form and/or grammemes',
+    formatter_class=argparse.ArgumentDefaultsHelpFormatter
+)
+parser_concordance.add_argument('corpus', help='corpus XML file')
+parser_concordance.add_argument('-l', '--lemma', help='lemma')
+parser_concordance.add_argument('-f', '--form', help='word form')
+parser_concordance.add_argument('-g', '--grammemes', help='comma-separated grammemes, e.g. NOUN,plur')
+parser_concordance.add_argument('--categories', help='only search documents from these categories')
+parser_concordance.add_argument('-w', '--width', type=int, default=5, help='context size (words)')
+parser_concordance.add_argument('-n', '--limit', type=int, default=20,
+                                help='max number of lines (0 means no limit)')
+parser_concordance.add_argument('--no-cache', action='store_true', help='do not use index files')
+
+
+def _print_progress(done, total):
+    if total:
+        sys.stdout.write('\r%5.1f%% (%.1f of %.1f MB)' % (
+            done * 100 / total, done / 2**20, total / 2**20))
+    else:
+        sys.stdout.write('\r%.1f MB' % (done / 2**20))
+    sys.stdout.flush()
+
+
+def _download(out_file, decompress, disambig, url, verbose=True, jobs=DEFAULT_JOBS,
+              sha256=None):
     if decompress and out_file == DEFAULT_OUT_FILE:
         out_file = DEFAULT_OUT_FILE[:-4]
 
@@ -54,24 +95,123 @@ def _download(out_file, decompress, disambig, url, verbose=True):
     if verbose:
         print('Creating %s from %s' % (out_file, url))
 
-    with open(out_file, 'wb') as out:
-        if verbose:
-            def on_chunk():
-                sys.stdout.write('.')
-                sys.stdout.flush()
-        else:
-            on_chunk = lambda: None
-        _download_file(url, out, decompress, on_chunk=on_chunk)
+    # urlopen is looked up here so that it can be replaced in tests
+    download_file(url, out_file, decompress, jobs=jobs, sha256=sha256,
+                  on_progress=_print_progress if verbose else None,
+                  opener=urlopen, chunk_size=CHUNK_SIZE)
 
     if verbose:
         print('\nDone.')
 
 
 def download(args):
-    _download(args.output, not args.no_decompress, args.disambig, args.url, not args.quiet)
+    _download(args.output, not args.no_decompress, args.disambig, args.url, not args.quiet,
+              getattr(args, 'jobs', DEFAULT_JOBS), getattr(args, 'sha256', None))
 parser_download.set_defaults(func=download)
 
 
+def _format_diff_value(value):
+    if value is None:
+        return '-'
+    if isinstance(value, diff.TokenInfo):
+        return '%s rev:%s %s' % (value.text, value.rev_id, ' | '.join(
+            '%s %s' % parse for parse in value.parses))
+    if isinstance(value, DocumentMeta):
+        return '%s [%s]' % (value.title, ', '.join(value.categories))
+    return value
+
+
+def _diff(old_file, new_file, kinds=None, summary=False, out=None):
+    out = out or sys.stdout
+    with CorpusReader(old_file) as old, CorpusReader(new_file) as new:
+        out.write('revision %s -> %s\n' % (
+            old.get_annotation_info()['revision'],
+            new.get_annotation_info()['revision']))
+        counts = Counter()
+        for change in diff.diff(old, new):
+            if kinds and change.kind not in kinds:
+                continue
+            counts[change.kind, change.action] += 1
+            if not summary:
+                line = '%s\t%s\t%s\t%s\t%s\t%s\n' % (
+                    change.action, change.kind, change.id, change.doc_id,
+                    _format_diff_value(change.old), _format_diff_value(change.new))
+                out.write(line)
+        if summary:
+            for (kind, action), count in sorted(counts.items()):
+                out.write('%s %s: %d\n' % (kind, action, count))
+    return counts
+
+
+def diff_command(args):
+    kinds = args.kinds.split(',') if args.kinds else None
+    _diff(args.old, args.new, kinds, args.summary)
+parser_diff.set_defaults(func=diff_command)
+
+
+def _stats(filename, view='iter_tagged_words', categories=None, tree=False,
+           use_cache=True, out=None):
+    """
+    Iterate over a corpus view with instrumentation enabled and print
+    time spent in each stage; return the stats snapshot.
+    """
+    out = out or sys.stdout
+    with CorpusReader(filename, use_cache=use_cache, stats=True) as corpus:
+        start = clock()
+        num_items = 0
+        if tree:
+            for doc in corpus.iter_documents(categories=categories, _destroy=True):
+                for _ in getattr(doc, view)():
+                    num_items += 1
+        else:
+            for _ in getattr(corpus, view)(categories=categories):
+                num_items += 1
+        total = clock() - start
+        snapshot = corpus.stats.snapshot()
+
+    out.write('%s: %d items in %.3fs\n' % (view, num_items, total))
+    stages = sorted(snapshot['stages'].items(), key=lambda item: -item[1]['seconds'])
+    other = total
+    for stage, info in stages:
+        other -= info['seconds']
+        out.write('  %-16s %9.3fs %6.1f%% %9d calls\n' % (
+            stage, info['seconds'], 100 * info['seconds'] / total if total else 0, info['calls']))
+    out.write('  %-16s %9.3fs %6.1f%%\n' % (
+        'other', other, 100 * other / total if total else 0))
+    for name, value in sorted(snapshot['counters'].items()):
+        out.write('  %-24s %d\n' % (name, value))
+    return snapshot
+
+
+def stats_command(args):
+    _stats(args.corpus, args.view, args.categories, args.tree, not args.no_cache)
+parser_stats.set_defaults(func=stats_command)
+
+
+def _concordance(filename, lemma=None, form=None, grammemes=None, categories=None,
+                 width=5, limit=20, use_cache=True, out=None):
+    """ Print keyword-in-context lines; return the number of lines. """
+    out = out or sys.stdout
+    with CorpusReader(filename, use_cache=use_cache) as corpus:
+        lines = corpus.concordance(lemma, form, grammemes, categories=categories,
+                                   width=width, limit=limit or None)
+    left_width = max([len(' '.join(line.left)) for line in lines] or [0])
+    for line in lines:
+        text = '%s\t%s\t%s [%s] %s\n' % (
+            line.doc_id, line.sent_id, ' '.join(line.left).rjust(left_width),
+            line.word, ' '.join(line.right))
+        out.write(text)
+    return len(lines)
+
+
+def concordance_command(args):
+    if not (args.lemma or args.form or args.grammemes):
+        parser_concordance.error('one of --lemma, --form or --grammemes is required')
+    _concordance(args.corpus, args.lemma, args.form, args.grammemes, args.categories,
+                 args.width, args.limit, not args.no_cache)
+parser_concordance.set_defaults(func=concordance_command)
+
+
 def main():
     if len(sys.argv) == 1:
         sys.argv.append('--help')
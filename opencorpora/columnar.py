@@ -0,0 +1,227 @@
+# -*- coding: utf-8 -*-
+"""
+Columnar token store: the whole corpus as contiguous integer arrays.
+
+Token forms, lemmas and tags (grammeme sets) are interned and stored
+as integer ids; offset arrays mark parse, sentence, paragraph and document
+boundaries. The file is memory-mapped on load and arrays are exposed
+as memoryviews, so they can be wrapped by NumPy without copying::
+
+    forms = numpy.frombuffer(store.forms, dtype=numpy.uint32)
+
+"""
+from __future__ import absolute_import
+import array
+import itertools
+
+from opencorpora import binfile, streaming
+from opencorpora.reader import non_iterative, make_iterable
+
+MAGIC = b'OCCOLUMN'
+VERSION = 1
+
+
+class _Vocabulary(object):
+    def __init__(self):
+        self.ids = {}
+        self.strings = []
+
+    def __getitem__(self, string):
+        try:
+            return self.ids[string]
+        except KeyError:
+            self.ids[string] = len(self.strings)
+            self.strings.append(string)
+            return self.ids[string]
+
+
+def export(reader, path, fileids=None, categories=None):
+    """ Write documents from CorpusReader ``reader`` to a columnar file. """
+    forms, lemmas, tags = _Vocabulary(), _Vocabulary(), _Vocabulary()
+    arrays = dict(
+        doc_ids=array.array('Q'),
+        forms=array.array('I'),
+        parse_offsets=array.array('Q', [0]),
+        lemmas=array.array('I'),
+        tags=array.array('I'),
+        sent_offsets=array.array('Q', [0]),
+        para_offsets=array.array('Q', [0]),
+        doc_offsets=array.array('Q', [0]),
+    )
+    token_forms, parse_offsets = arrays['forms'], arrays['parse_offsets']
+    parse_lemmas, parse_tags = arrays['lemmas'], arrays['tags']
+    sent_offsets, para_offsets = arrays['sent_offsets'], arrays['para_offsets']
+
+    for doc_id in reader._filter_ids(fileids, categories):
+        chunk = reader._document_chunk(doc_id)
+        try:
+            events = streaming.parse_events(chunk, streaming.PARSED)
+        finally:
+            chunk.release()
+
+        para_open = False
+        for event, sent in events:
+            if event == streaming.PARAGRAPH:
+                if para_open:
+                    para_offsets.append(len(sent_offsets) - 1)
+                para_open = True
+                continue
+            for form, parses in sent:
+                token_forms.append(forms[form])
+                for lemma, tag in parses:
+                    parse_lemmas.append(lemmas[lemma])
+                    parse_tags.append(tags[tag])
+                parse_offsets.append(len(parse_lemmas))
+            sent_offsets.append(len(token_forms))
+        if para_open:
+            para_offsets.append(len(sent_offsets) - 1)
+
+        arrays['doc_ids'].append(int(doc_id))
+        arrays['doc_offsets'].append(len(para_offsets) - 1)
+
+    sections = [(name, arrays[name]) for name in sorted(arrays)]
+    for name, vocab in [('form_vocab', forms), ('lemma_vocab', lemmas), ('tag_vocab', tags)]:
+        offsets, data = binfile.string_table(vocab.strings)
+        sections.extend([(name + '.offsets', offsets), (name + '.data', data)])
+
+    info = reader.get_annotation_info() or {}
+    binfile.write(path, MAGIC, VERSION, {'revision': info.get('revision')}, sections)
+
+
+def load(path):
+    """ Memory-map a columnar file written by :func:`export`. """
+    return ColumnarCorpus(path)
+
+
+class ColumnarCorpus(object):
+    """
+    Memory-mapped columnar corpus. Array attributes (memoryviews):
+
+    * ``forms`` - form id for each token;
+    * ``parse_offsets`` - parses of token ``i`` are
+      ``parse_offsets[i]:parse_offsets[i+1]``;
+    * ``lemmas``, ``tags`` - lemma id and tag id for each parse;
+    * ``sent_offsets`` - token offsets of sentences;
+    * ``para_offsets`` - sentence offsets of paragraphs;
+    * ``doc_offsets`` - paragraph offsets of documents;
+    * ``doc_ids`` - document ids.
+
+    Vocabularies (``form_vocab``, ``lemma_vocab``, ``tag_vocab``) map ids
+    back to strings; :meth:`strings` returns them decoded.
+    """
+
+    def __init__(self, path):
+        self._file = binfile.SectionFile(path, MAGIC, VERSION)
+        self.revision = self._file.meta.get('revision')
+        for name in ['forms', 'parse_offsets', 'lemmas', 'tags', 'sent_offsets',
+                     'para_offsets', 'doc_offsets', 'doc_ids']:
+            setattr(self, name, self._file.array(name))
+        self.form_vocab = self._file.strings('form_vocab')
+        self.lemma_vocab = self._file.strings('lemma_vocab')
+        self.tag_vocab = self._file.strings('tag_vocab')
+        self._decoded = {}
+        self._positions = None
+
+    def close(self):
+        for name in ['forms', 'parse_offsets', 'lemmas', 'tags', 'sent_offsets',
+                     'para_offsets', 'doc_offsets', 'doc_ids']:
+            setattr(self, name, None)
+        self.form_vocab = self.lemma_vocab = self.tag_vocab = None
+        self._decoded.clear()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def fileids(self):
+        return [str(doc_id) for doc_id in self.doc_ids]
+
+    def strings(self, name):
+        """ Decoded vocabulary (e.g. ``'form_vocab'``), cached as a list. """
+        if name not in self._decoded:
+            self._decoded[name] = list(getattr(self, name))
+        return self._decoded[name]
+
+    def _doc_positions(self, fileids):
+        if fileids is None:
+            return range(len(self.doc_ids))
+        if self._positions is None:
+            self._positions = dict(
+                (str(doc_id), pos) for pos, doc_id in enumerate(self.doc_ids))
+        return [self._positions[str(doc_id)] for doc_id in make_iterable(fileids)]
+
+    def _iter_para_ranges(self, fileids):
+        """ Yield (first_sentence, last_sentence + 1) for paragraphs. """
+        doc_offsets, para_offsets = self.doc_offsets, self.para_offsets
+        for pos in self._doc_positions(fileids):
+            for para in range(doc_offsets[pos], doc_offsets[pos + 1]):
+                yield para_offsets[para], para_offsets[para + 1]
+
+    def iter_sent_ranges(self, fileids=None):
+        """ Yield (first_token, last_token + 1) for sentences. """
+        offsets = self.sent_offsets
+        for start, end in self._iter_para_ranges(fileids):
+            for sent in range(start, end):
+                yield offsets[sent], offsets[sent + 1]
+
+    def iter_sents(self, fileids=None):
+        vocab, forms = self.strings('form_vocab'), self.forms
+        for start, end in self.iter_sent_ranges(fileids):
+            yield [vocab[form] for form in forms[start:end]]
+
+    def iter_tagged_sents(self, fileids=None):
+        vocab, forms = self.strings('form_vocab'), self.forms
+        tag_vocab, tags = self.strings('tag_vocab'), self.tags
+        parse_offsets = self.parse_offsets
+        for start, end in self.iter_sent_ranges(fileids):
+            # tokens without parses get an empty tag
+            yield [
+                (vocab[forms[tok]], tag_vocab[tags[parse_offsets[tok]]]
+                 if parse_offsets[tok] != parse_offsets[tok + 1] else '')
+                for tok in range(start, end)
+            ]
+
+    def iter_parsed_sents(self, fileids=None):
+        vocab, forms = self.strings('form_vocab'), self.forms
+        tag_vocab, tags = self.strings('tag_vocab'), self.tags
+        lemma_vocab, lemmas = self.strings('lemma_vocab'), self.lemmas
+        parse_offsets = self.parse_offsets
+        for start, end in self.iter_sent_ranges(fileids):
+            yield [
+                (vocab[forms[tok]], [
+                    (lemma_vocab[lemmas[p]], tag_vocab[tags[p]])
+                    for p in range(parse_offsets[tok], parse_offsets[tok + 1])
+                ])
+                for tok in range(start, end)
+            ]
+
+    def iter_paras(self, fileids=None):
+        sents = self.iter_sents(fileids)
+        for start, end in self._iter_para_ranges(fileids):
+            yield list(itertools.islice(sents, end - start))
+
+    def iter_tagged_paras(self, fileids=None):
+        sents = self.iter_tagged_sents(fileids)
+        for start, end in self._iter_para_ranges(fileids):
+            yield list(itertools.islice(sents, end - start))
+
+    def iter_words(self, fileids=None):
+        return itertools.chain.from_iterable(self.iter_sents(fileids))
+
+    def iter_tagged_words(self, fileids=None):
+        return itertools.chain.from_iterable(self.iter_tagged_sents(fileids))
+
+    def iter_parsed_words(self, fileids=None):
+        return itertools.chain.from_iterable(self.iter_parsed_sents(fileids))
+
+    sents = non_iterative(iter_sents)
+    paras = non_iterative(iter_paras)
+    tagged_paras = non_iterative(iter_tagged_paras)
+    tagged_sents = non_iterative(iter_tagged_sents)
+    parsed_sents = non_iterative(iter_parsed_sents)
+    words = non_iterative(iter_words)
+    tagged_words = non_iterative(iter_tagged_words)
+    parsed_words = non_iterative(iter_parsed_words)
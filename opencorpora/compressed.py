@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+"""
+Reading OpenCorpora XML directly from compressed files.
+
+* ``.bz2`` files get a block index: bit offsets of bzip2 blocks in
+  the compressed file and offsets of their data in the uncompressed one.
+  Every block can be decompressed on its own (it is re-wrapped into
+  a single-block bzip2 stream), so random access to a document only
+  decompresses the blocks it spans. Sequential reads decompress blocks
+  ahead in a thread pool (bz2 releases the GIL).
+* ``.gz`` and ``.zst`` files (the latter requires ``zstandard`` package)
+  are read sequentially; moving backwards restarts decompression,
+  so they are only efficient for reading documents in file order.
+"""
+from __future__ import absolute_import
+import os
+import bz2
+import gzip
+import array
+import bisect
+import threading
+from collections import OrderedDict
+
+from opencorpora import binfile, xml_utils
+
+BLOCK_INDEX_MAGIC = b'OCBZ2IDX'
+BLOCK_INDEX_VERSION = 1
+
+READ_SIZE = 4*1024*1024
+
+_BLOCK_MAGIC = 0x314159265359
+_EOS_MAGIC = 0x177245385090
+
+
+def compression(filename):
+    """ Return compression format name based on file extension, or None. """
+    ext = os.path.splitext(filename)[1].lower()
+    return {'.bz2': 'bz2', '.gz': 'gz', '.zst': 'zst'}.get(ext)
+
+
+def open_stream(filename, parallel=False):
+    """
+    Open a (possibly compressed) file for reading uncompressed data.
+
+    If ``parallel`` is True then bzip2 blocks are decompressed ahead
+    in a thread pool; this needs a pass over the compressed file
+    to find the blocks, so use it only for reading the whole file.
+    """
+    kind = compression(filename)
+    if kind == 'bz2':
+        if parallel:
+            return _Bz2Stream(filename)
+        return bz2.BZ2File(filename, 'rb')
+    if kind == 'gz':
+        return gzip.GzipFile(filename, 'rb')
+    if kind == 'zst':
+        return _ZstdStream(filename)
+    return open(filename, 'rb')
+
+
+def open_source(filename, index_filename=None, threads=None):
+    """
+    Return an object for random access to chunks of uncompressed data:
+    it has ``chunk(bounds)`` method returning a memoryview
+    and ``close()`` method.
+
+    ``index_filename`` is a file name for the bzip2 block index;
+    if it is None then the index is not saved. ``threads`` is the number
+    of bzip2 decompression threads (the number of CPUs by default).
+    """
+    kind = compression(filename)
+    if kind == 'bz2':
+        return Bz2BlockFile(filename, index_filename, threads)
+    if kind is not None:
+        return SequentialFile(filename)
+    return xml_utils.MappedFile(filename)
+
+
+class _ZstdStream(object):
+    def __init__(self, filename):
+        try:
+            import zstandard
+        except ImportError:
+            raise ImportError("zstandard package is required to read .zst files")
+        self._fp = open(filename, 'rb')
+        self._reader = zstandard.ZstdDecompressor().stream_reader(self._fp)
+
+    def read(self, size=-1):
+        return self._reader.read(size)
+
+    def close(self):
+        self._reader.close()
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SequentialFile(object):
+    """ Chunk access for compressed files without random access support. """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.closed = False
+        self._stream = None
+        self._pos = 0
+        self._lock = threading.Lock()
+
+    def chunk(self, bounds):
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        with self._lock:
+            if self._stream is None or bounds.byte_start < self._pos:
+                self._reopen()
+            self._skip(bounds.byte_start - self._pos)
+            data = self._stream.read(bounds.byte_end - bounds.byte_start)
+            self._pos += len(data)
+        return memoryview(data)
+
+    def _reopen(self):
+        if self._stream is not None:
+            self._stream.close()
+        self._stream = open_stream(self.filename)
+        self._pos = 0
+
+    def _skip(self, size):
+        while size > 0:
+            data = self._stream.read(min(size, READ_SIZE))
+            if not data:
+                break
+            size -= len(data)
+            self._pos += len(data)
+
+    def close(self):
+        if self._stream is not None:
+            self._stream.close()
+            self._stream = None
+        self.closed = True
+
+
+def find_bz2_blocks(fp, read_size=READ_SIZE):
+    """
+    Find bzip2 block and end-of-stream magic numbers in a compressed file;
+    return a list of (bit_start, bit_end, block_crc) for every block.
+    """
+    magics = _find_magics(fp, read_size)
+    blocks = []
+    for index, (bit_offset, is_block) in enumerate(magics):
+        if not is_block:
+            continue
+        if index + 1 == len(magics):
+            raise ValueError("bzip2 stream is truncated")
+        blocks.append((bit_offset, magics[index + 1][0]))
+
+    result = []
+    for start, end in blocks:
+        fp.seek((start + 48) // 8)
+        crc_bits, _ = _read_bits(fp, start + 48, start + 80)
+        result.append((start, end, crc_bits))
+    return result
+
+
+def _magic_patterns(magic):
+    """
+    For each bit shift yield (shift, pattern, first_mask, first_byte,
+    last_mask, last_byte): ``pattern`` is the fully determined part
+    of a shifted magic number; first/last bytes are partially determined.
+    """
+    for shift in range(8):
+        if shift == 0:
+            yield shift, magic.to_bytes(6, 'big'), 0, 0, 0, 0
+            continue
+        data = (magic << (8 - shift)).to_bytes(7, 'big')
+        first_mask = 0xFF >> shift
+        last_mask = (0xFF << (8 - shift)) & 0xFF
+        yield shift, data[1:6], first_mask, data[0], last_mask, data[6]
+
+
+def _find_magics(fp, read_size):
+    patterns = [
+        (is_block, pattern)
+        for is_block, magic in [(True, _BLOCK_MAGIC), (False, _EOS_MAGIC)]
+        for pattern in _magic_patterns(magic)
+    ]
+    found = set()
+    fp.seek(0)
+    base = 0
+    tail = b''
+    while True:
+        data = fp.read(read_size)
+        if not data:
+            break
+        buf = tail + data
+        buf_base = base - len(tail)
+        for is_block, (shift, pattern, first_mask, first, last_mask, last) in patterns:
+            pos = buf.find(pattern)
+            while pos != -1:
+                if shift == 0:
+                    found.add(((buf_base + pos) * 8, is_block))
+                elif (0 < pos and pos + 5 < len(buf) and
+                        buf[pos - 1] & first_mask == first and
+                        buf[pos + 5] & last_mask == last):
+                    found.add(((buf_base + pos - 1) * 8 + shift, is_block))
+                pos = buf.find(pattern, pos + 1)
+        base += len(data)
+        tail = buf[-7:]
+    return sorted(found)
+
+
+def _read_bits(fp, bit_start, bit_end):
+    """ Read bits [bit_start, bit_end) from file; return (int, nbits). """
+    first, last = bit_start // 8, (bit_end + 7) // 8
+    fp.seek(first)
+    value = int.from_bytes(fp.read(last - first), 'big')
+    value >>= last * 8 - bit_end
+    nbits = bit_end - bit_start
+    return value & ((1 << nbits) - 1), nbits
+
+
+def decompress_block(fp, bit_start, bit_end, crc):
+    """
+    Decompress a single bzip2 block: the block is wrapped into a valid
+    single-block bzip2 stream (its combined CRC is the block CRC).
+    """
+    value, nbits = _read_bits(fp, bit_start, bit_end)
+    value = (value << 80) | (_EOS_MAGIC << 32) | crc
+    nbits += 80
+    padding = -nbits % 8
+    stream = b'BZh9' + (value << padding).to_bytes((nbits + padding) // 8, 'big')
+    return bz2.decompress(stream)
+
+
+def _decompress_block_file(args):
+    filename, bit_start, bit_end, crc = args
+    with open(filename, 'rb') as fp:
+        return decompress_block(fp, bit_start, bit_end, crc)
+
+
+class Bz2BlockFile(object):
+    """
+    Random access to uncompressed data of a bzip2 file using
+    a block index. ``threads`` is the number of threads used to
+    decompress blocks ahead for sequential reads; ``cache_blocks`` is
+    the number of decompressed blocks kept in memory.
+
+    Finding blocks only scans the compressed data, but uncompressed
+    offsets of blocks are known only after the blocks before them are
+    decompressed. Without a saved block index, :meth:`chunk` decompresses
+    blocks from the start of the file up to the requested data.
+    """
+
+    def __init__(self, filename, index_filename=None, threads=None, cache_blocks=None):
+        self.filename = filename
+        self.index_filename = index_filename
+        self.threads = threads or os.cpu_count() or 1
+        self.cache_blocks = cache_blocks or max(8, self.threads * 2)
+        self.closed = False
+        self._blocks = None     # list of (bit_start, bit_end, crc)
+        self._offsets = None    # uncompressed offsets, len(blocks) + 1 items
+        self._known_offsets = [0]  # offsets computed so far by chunk()
+        self._offsets_lock = threading.Lock()
+        self._cache = OrderedDict()  # block number -> Future or data
+        self._executor = None
+        self._lock = threading.Lock()
+        self._fp = open(filename, 'rb')
+
+    # === block index ===
+
+    def _file_info(self):
+        stat = os.stat(self.filename)
+        return {'size': stat.st_size, 'mtime': stat.st_mtime}
+
+    def _load_index(self):
+        if self.index_filename is None:
+            return False
+        try:
+            f = binfile.SectionFile(self.index_filename, BLOCK_INDEX_MAGIC,
+                                    BLOCK_INDEX_VERSION)
+        except (IOError, OSError, binfile.FormatError):
+            return False
+        try:
+            if f.meta != self._file_info():
+                return False
+            bits = f.array('blocks').tolist()
+            self._blocks = [tuple(bits[i:i + 3]) for i in range(0, len(bits), 3)]
+            self._offsets = f.array('offsets').tolist()
+            return True
+        finally:
+            f.close()
+
+    def _save_index(self):
+        if self.index_filename is None:
+            return
+        blocks = array.array('Q', [value for block in self._blocks for value in block])
+        try:
+            binfile.write(self.index_filename, BLOCK_INDEX_MAGIC, BLOCK_INDEX_VERSION,
+                          self._file_info(), [
+                              ('blocks', blocks),
+                              ('offsets', array.array('Q', self._offsets)),
+                          ])
+        except (IOError, OSError):
+            pass
+
+    def _ensure_blocks(self):
+        if self._blocks is None and not self._load_index():
+            self._blocks = find_bz2_blocks(self._fp)
+
+    def ensure_index(self):
+        """ Make sure uncompressed offsets of blocks are known. """
+        self._ensure_blocks()
+        if self._offsets is None:
+            for _ in self._iter_blocks():
+                pass
+
+    @property
+    def num_blocks(self):
+        self._ensure_blocks()
+        return len(self._blocks)
+
+    # === decompression ===
+
+    def _get_executor(self):
+        if self._executor is None:
+            from concurrent.futures import ThreadPoolExecutor
+            self._executor = ThreadPoolExecutor(self.threads)
+        return self._executor
+
+    def _decompress(self, number):
+        start, end, crc = self._blocks[number]
+        with open(self.filename, 'rb') as fp:
+            return decompress_block(fp, start, end, crc)
+
+    def _block(self, number, read_ahead=0):
+        """ Return uncompressed data of a block. """
+        with self._lock:
+            for num in range(number, min(number + read_ahead + 1, len(self._blocks))):
+                if num in self._cache:
+                    self._cache[num] = self._cache.pop(num)
+                else:
+                    self._cache[num] = self._get_executor().submit(self._decompress, num)
+            while len(self._cache) > max(self.cache_blocks, read_ahead + 1):
+                self._cache.popitem(last=False)
+            block = self._cache[number]
+
+        if not isinstance(block, bytes):
+            block = block.result()
+            with self._lock:
+                if number in self._cache:
+                    self._cache[number] = block
+        return block
+
+    def _iter_blocks(self):
+        """
+        Yield uncompressed blocks in order; offsets are computed
+        (and the index saved) if they are not known yet.
+        """
+        self._ensure_blocks()
+        offsets = [0]
+        for number in range(len(self._blocks)):
+            data = self._block(number, read_ahead=self.threads)
+            offsets.append(offsets[-1] + len(data))
+            yield data
+        if self._offsets is None:
+            self._offsets = offsets
+            self._save_index()
+
+    def _offsets_until(self, position):
+        """
+        Return uncompressed offsets of blocks; blocks are decompressed
+        in order until offsets after ``position`` are known.
+        """
+        if self._offsets is not None:
+            return self._offsets
+        self._ensure_blocks()
+        with self._offsets_lock:
+            offsets = self._known_offsets
+            while offsets[-1] <= position and len(offsets) <= len(self._blocks):
+                data = self._block(len(offsets) - 1, read_ahead=self.threads)
+                offsets.append(offsets[-1] + len(data))
+            if len(offsets) == len(self._blocks) + 1 and self._offsets is None:
+                self._offsets = offsets
+                self._save_index()
+        return offsets
+
+    def stream(self):
+        """
+        Return a file-like object for reading uncompressed data
+        sequentially; blocks are decompressed in parallel.
+        """
+        return _BlockStream(self._iter_blocks())
+
+    def chunk(self, bounds):
+        """ Return a memoryview of a chunk of uncompressed data. """
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        start, end = bounds.byte_start, bounds.byte_end
+        offsets = self._offsets_until(end - 1)
+        first = bisect.bisect_right(offsets, start) - 1
+        parts = []
+        number = first
+        while number < len(self._blocks) and offsets[number] < end:
+            data = self._block(number, read_ahead=1)
+            block_start = offsets[number]
+            parts.append(data[max(start - block_start, 0):end - block_start])
+            number += 1
+        return memoryview(b''.join(parts))
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
+        self._cache.clear()
+        self._fp.close()
+        self.closed = True
+
+
+class _BlockStream(object):
+    """ File-like object over an iterator of data blocks. """
+
+    def __init__(self, blocks):
+        self._blocks = blocks
+        self._buf = b''
+
+    def read(self, size=-1):
+        while size < 0 or len(self._buf) < size:
+            block = next(self._blocks, None)
+            if block is None:
+                break
+            self._buf += block
+        if size < 0:
+            data, self._buf = self._buf, b''
+        else:
+            data, self._buf = self._buf[:size], self._buf[size:]
+        return data
+
+    def close(self):
+        # a partial pass doesn't save the block index
+        self._blocks.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class _Bz2Stream(_BlockStream):
+    """ Sequential reads from a bzip2 file using Bz2BlockFile. """
+
+    def __init__(self, filename):
+        self._source = Bz2BlockFile(filename)
+        super(_Bz2Stream, self).__init__(self._source._iter_blocks())
+
+    def close(self):
+        super(_Bz2Stream, self).close()
+        self._source.close()
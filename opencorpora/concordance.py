@@ -0,0 +1,336 @@
+# -*- coding: utf-8 -*-
+"""
+Inverted index of word forms, lemmas and grammemes for concordance
+(keyword-in-context) queries::
+
+    >>> for line in corpus.concordance(lemma='стать', grammemes='VERB,past', limit=3):
+    ...     print(' '.join(line.left), '[%s]' % line.word, ' '.join(line.right))  # doctest: +SKIP
+
+Postings are token positions in the corpus file (as numbered by the
+sentence index), so a match is mapped to sentence bounds without
+reading documents; only matching sentences are fetched and parsed.
+
+Postings lists are sorted and split into blocks of ``BLOCK_SIZE``
+positions. The first position of every block is stored in a skip array,
+the rest are stored as varint-encoded deltas. Intersections decode only
+blocks which may contain candidates from the shortest list.
+
+The index is token-level: all conditions are checked again on the
+fetched sentence, so a lemma and grammemes have to belong to the same
+parse of a token. Forms and lemmas are matched case-insensitively.
+"""
+from __future__ import absolute_import
+import array
+import bisect
+import itertools
+from collections import namedtuple
+
+from opencorpora import binfile, streaming, xml_utils
+from opencorpora.compat import string_types
+
+MAGIC = b'OCCONCRD'
+VERSION = 1
+
+BLOCK_SIZE = 128
+FIELDS = ('forms', 'lemmas', 'grammemes')
+
+# ``left`` and ``right`` are lists of context words of the sentence
+Line = namedtuple('Line', 'doc_id sent_id position left word right')
+
+
+def encode_varints(values, out):
+    """
+    Append varint-encoded non-negative integers to bytearray ``out``.
+
+    >>> out = bytearray()
+    >>> encode_varints([1, 127, 128, 300], out)
+    >>> list(out)
+    [1, 127, 128, 1, 172, 2]
+    >>> decode_varints(out)
+    [1, 127, 128, 300]
+    """
+    for value in values:
+        while value >= 0x80:
+            out.append((value & 0x7f) | 0x80)
+            value >>= 7
+        out.append(value)
+
+
+def decode_varints(data):
+    """ Decode a buffer of varint-encoded integers to a list. """
+    values = []
+    value = shift = 0
+    for byte in bytearray(data):
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+        else:
+            values.append(value)
+            value = shift = 0
+    return values
+
+
+def build(meta, source, sentence_index):
+    """
+    Return a dict of arrays for :class:`ConcordanceIndex`. ``meta`` is
+    the document metadata mapping, ``source`` is a MappedFile and
+    ``sentence_index`` is the SentenceIndex of the same file.
+    """
+    postings = dict((field, {}) for field in FIELDS)
+    forms, lemmas, grammemes = [postings[field] for field in FIELDS]
+
+    def add(terms, term, token_pos):
+        try:
+            terms[term].append(token_pos)
+        except KeyError:
+            terms[term] = array.array('I', [token_pos])
+
+    for doc_pos, doc_meta in enumerate(meta.values()):
+        chunk = source.chunk(doc_meta.bounds)
+        try:
+            events = streaming.parse_events(chunk, streaming.PARSED)
+        finally:
+            chunk.release()
+        sent_pos = sentence_index.document_sentence_range(doc_pos)[0]
+        for event, sent in events:
+            if event != streaming.SENTENCE:
+                continue
+            token_pos = sentence_index.sentence_token_range(sent_pos, sent_pos + 1)[0]
+            for form, parses in sent:
+                add(forms, form.lower(), token_pos)
+                for lemma in set(lemma.lower() for lemma, _ in parses):
+                    add(lemmas, lemma, token_pos)
+                for grammeme in set(g for _, tag in parses for g in tag.split(',') if g):
+                    add(grammemes, grammeme, token_pos)
+                token_pos += 1
+            sent_pos += 1
+    return encode(postings)
+
+
+def encode(postings):
+    """
+    Encode ``{field: {term: sorted positions}}`` dicts
+    to a dict of arrays for :class:`ConcordanceIndex`.
+    """
+    arrays = {}
+    skip_values, skip_offsets = array.array('Q'), array.array('Q')
+    data = bytearray()
+    for field in FIELDS:
+        terms = sorted(postings[field])
+        counts, term_blocks = array.array('Q'), array.array('Q', [len(skip_values)])
+        for term in terms:
+            positions = postings[field][term]
+            for start in range(0, len(positions), BLOCK_SIZE):
+                block = positions[start:start + BLOCK_SIZE]
+                skip_values.append(block[0])
+                skip_offsets.append(len(data))
+                deltas = [b - a for a, b in zip(block, block[1:])]
+                if not deltas or max(deltas) < 0x80:
+                    data.extend(bytearray(deltas))
+                else:
+                    encode_varints(deltas, data)
+            counts.append(len(positions))
+            term_blocks.append(len(skip_values))
+        arrays[field] = binfile.string_table(terms)
+        arrays[field + '.counts'] = counts
+        arrays[field + '.blocks'] = term_blocks
+    skip_offsets.append(len(data))
+    arrays['skip_values'] = skip_values
+    arrays['skip_offsets'] = skip_offsets
+    arrays['postings'] = array.array('B', bytes(data))
+    return arrays
+
+
+def write(filename, arrays, file_info):
+    sections = []
+    for name, values in sorted(arrays.items()):
+        if name in FIELDS:
+            offsets, data = values
+            sections.extend([(name + '.offsets', offsets), (name + '.data', data)])
+        else:
+            sections.append((name, values))
+    binfile.write(filename, MAGIC, VERSION, file_info, sections)
+
+
+class ConcordanceIndex(object):
+    """
+    Term -> token positions index. It is created either from
+    a dict of arrays (see :func:`build`) or from a file.
+    """
+
+    def __init__(self, arrays, file=None):
+        self._arrays = dict(arrays)
+        for field in FIELDS:
+            if not isinstance(self._arrays[field], binfile.StringTable):
+                self._arrays[field] = binfile.StringTable(*self._arrays[field])
+        self._file = file
+        self.file_info = file.meta if file is not None else None
+
+    @classmethod
+    def load(cls, filename):
+        f = binfile.SectionFile(filename, MAGIC, VERSION)
+        arrays = dict((name, f.array(name)) for name in [
+            'skip_values', 'skip_offsets', 'postings'])
+        for field in FIELDS:
+            arrays[field] = f.strings(field)
+            arrays[field + '.counts'] = f.array(field + '.counts')
+            arrays[field + '.blocks'] = f.array(field + '.blocks')
+        return cls(arrays, f)
+
+    def postings(self, field, term):
+        """ Return a PostingList of a term (empty for unknown terms). """
+        terms = self._arrays[field]
+        index = bisect.bisect_left(terms, term)
+        if index == len(terms) or terms[index] != term:
+            return PostingList(self._arrays, 0, 0, 0)
+        blocks = self._arrays[field + '.blocks']
+        return PostingList(self._arrays, blocks[index], blocks[index + 1],
+                           self._arrays[field + '.counts'][index])
+
+    def terms(self, field):
+        """ Return a list of (term, number of tokens) pairs. """
+        return list(zip(self._arrays[field], self._arrays[field + '.counts']))
+
+    def close(self):
+        self._arrays = None
+        if self._file is not None:
+            self._file.close()
+
+
+class PostingList(object):
+    """ Sorted token positions of a term, decoded block by block. """
+
+    def __init__(self, arrays, first_block, last_block, count):
+        self._skip_values = arrays['skip_values']
+        self._skip_offsets = arrays['skip_offsets']
+        self._data = arrays['postings']
+        self.first_block = first_block
+        self.last_block = last_block
+        self.count = count
+
+    def __len__(self):
+        return self.count
+
+    def __iter__(self):
+        for number in range(self.first_block, self.last_block):
+            for value in self.block(number):
+                yield value
+
+    def block(self, number):
+        """ Return a list of positions in a block. """
+        start, end = self._skip_offsets[number], self._skip_offsets[number + 1]
+        size = min(BLOCK_SIZE, self.count - (number - self.first_block) * BLOCK_SIZE)
+        data = self._data[start:end]
+        # every delta fits in a single byte: no need to decode varints
+        deltas = bytearray(data) if end - start == size - 1 else decode_varints(data)
+        value = self._skip_values[number]
+        values = [value]
+        for delta in deltas:
+            value += delta
+            values.append(value)
+        return values
+
+    def filter(self, candidates):
+        """ Yield items of a sorted iterable ``candidates`` which are in the list. """
+        lo, hi = self.first_block, self.last_block
+        number, block = None, None
+        for value in candidates:
+            found = bisect.bisect_right(self._skip_values, value, lo, hi) - 1
+            if found < lo:
+                continue
+            if found != number:
+                number, block = found, self.block(found)
+                lo = found
+            index = bisect.bisect_left(block, value)
+            if index < len(block) and block[index] == value:
+                yield value
+
+
+def intersect(posting_lists):
+    """ Yield positions which are in all posting lists, in ascending order. """
+    posting_lists = sorted(posting_lists, key=len)
+    if not posting_lists or not len(posting_lists[0]):
+        return iter(())
+    positions = iter(posting_lists[0])
+    for postings in posting_lists[1:]:
+        positions = postings.filter(positions)
+    return positions
+
+
+def parse_grammemes(grammemes):
+    """ Convert "NOUN,plur" or a list of grammemes to a list. """
+    if grammemes is None:
+        return []
+    if isinstance(grammemes, string_types):
+        grammemes = grammemes.split(',')
+    return [g.strip() for g in grammemes if g.strip()]
+
+
+def query_terms(lemma=None, form=None, grammemes=None):
+    """ Return a list of (field, term) pairs for query conditions. """
+    terms = []
+    if form is not None:
+        terms.append(('forms', form.lower()))
+    if lemma is not None:
+        terms.append(('lemmas', lemma.lower()))
+    terms.extend(('grammemes', grammeme) for grammeme in parse_grammemes(grammemes))
+    if not terms:
+        raise ValueError("at least one of lemma, form or grammemes is required")
+    return terms
+
+
+def token_matches(token, lemma=None, form=None, grammemes=None):
+    """
+    Check if a parsed token ``(form, [(lemma, tag), ...])`` matches
+    the query; lemma and grammemes should be in the same parse.
+    """
+    text, parses = token
+    if form is not None and text.lower() != form.lower():
+        return False
+    grammemes = set(parse_grammemes(grammemes))
+    if lemma is None and not grammemes:
+        return True
+    lemma = lemma.lower() if lemma is not None else None
+    return any(
+        (lemma is None or parse_lemma.lower() == lemma) and grammemes.issubset(tag.split(','))
+        for parse_lemma, tag in parses
+    )
+
+
+def filter_ranges(positions, ranges):
+    """ Yield sorted ``positions`` which are in sorted (start, end) ``ranges``. """
+    ranges = iter(ranges)
+    current = next(ranges, None)
+    for position in positions:
+        while current is not None and position >= current[1]:
+            current = next(ranges, None)
+        if current is None:
+            return
+        if position >= current[0]:
+            yield position
+
+
+def kwic_lines(positions, sentence_index, source, doc_id_at, query, width):
+    """
+    Yield Lines for token ``positions``; sentences are fetched from
+    ``source`` and tokens which don't match ``query`` (a dict of
+    :func:`token_matches` arguments) are skipped.
+    """
+    by_sentence = itertools.groupby(positions, lambda pos: sentence_index.token_at(pos)[0])
+    for sent_pos, sent_positions in by_sentence:
+        sent_id, doc_pos, start, end = sentence_index.sentence_at(sent_pos)
+        first_token = sentence_index.sentence_token_range(sent_pos, sent_pos + 1)[0]
+        chunk = source.chunk(xml_utils.Bounds(None, None, start, end))
+        try:
+            events = streaming.parse_events(chunk, streaming.PARSED)
+        finally:
+            chunk.release()
+        tokens = events[0][1]
+        words = [text for text, _ in tokens]
+        for pos in sent_positions:
+            position = pos - first_token
+            if not token_matches(tokens[position], **query):
+                continue
+            yield Line(doc_id_at(doc_pos), str(sent_id), position,
+                       words[max(0, position - width):position], words[position],
+                       words[position + 1:position + 1 + width])
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Differences between two revisions of OpenCorpora corpus.
+
+Documents are matched by id using document indexes; documents with
+equal XML digests are skipped without parsing, so only changed documents
+are loaded, one at a time. Changes are reported as a stream of
+:class:`Change` tuples::
+
+    >>> for change in diff(CorpusReader('old.xml'), CorpusReader('new.xml')):
+    ...     print(change.action, change.kind, change.id)  # doctest: +SKIP
+    changed token 2
+
+Tokens are compared by their text and annotation, including
+the annotation revision id (``<tfr rev_id="...">``).
+"""
+from __future__ import absolute_import
+from collections import namedtuple, OrderedDict
+
+from opencorpora.compat import text_type
+
+DOCUMENT, SENTENCE, TOKEN = 'document', 'sentence', 'token'
+ADDED, REMOVED, CHANGED = 'added', 'removed', 'changed'
+
+# ``old`` and ``new`` are document metadata (DocumentMeta), sentence
+# source texts or TokenInfo tuples for documents, sentences and tokens;
+# one of them is None for added and removed items.
+Change = namedtuple('Change', 'action kind id doc_id old new')
+
+TokenInfo = namedtuple('TokenInfo', 'text rev_id parses')
+
+
+def diff(old_reader, new_reader):
+    """
+    Yield :class:`Change` tuples describing how ``new_reader``
+    corpus differs from ``old_reader`` corpus: removed documents first,
+    then added and changed documents in file order. For a changed document
+    all changed sentences and tokens are reported after the document itself.
+    """
+    old_meta, new_meta = old_reader._get_meta(), new_reader._get_meta()
+
+    for doc_id in old_meta:
+        if doc_id not in new_meta:
+            yield Change(REMOVED, DOCUMENT, doc_id, doc_id, old_meta[doc_id], None)
+
+    for doc_id in new_meta:
+        new = new_meta[doc_id]
+        if doc_id not in old_meta:
+            yield Change(ADDED, DOCUMENT, doc_id, doc_id, None, new)
+            continue
+        old = old_meta[doc_id]
+        if old.digest == new.digest:
+            continue
+        if (old.title, old.categories, old.parent) != (new.title, new.categories, new.parent):
+            yield Change(CHANGED, DOCUMENT, doc_id, doc_id, old, new)
+        old_sents = _sentences(old_reader._document_xml(doc_id))
+        new_sents = _sentences(new_reader._document_xml(doc_id))
+        for change in _diff_sentences(doc_id, old_sents, new_sents):
+            yield change
+
+
+def _sentences(doc_xml):
+    """
+    Return an OrderedDict sent_id -> (source, OrderedDict token_id -> TokenInfo)
+    for a document XML element.
+    """
+    sentences = OrderedDict()
+    for sent in doc_xml.iter('sentence'):
+        tokens = OrderedDict()
+        for token in sent.iter('token'):
+            tfr = token.find('tfr')
+            parses = [
+                (text_type(l.get('t')),
+                 text_type(',').join(text_type(g.get('v')) for g in l.findall('g')))
+                for l in token.iter('l')
+            ]
+            tokens[token.get('id')] = TokenInfo(
+                text_type(token.get('text')),
+                tfr.get('rev_id') if tfr is not None else None,
+                parses
+            )
+        source = sent.find('source')
+        sentences[sent.get('id')] = (text_type(source.text or ''), tokens)
+    return sentences
+
+
+def _diff_sentences(doc_id, old_sents, new_sents):
+    for sent_id, (source, tokens) in old_sents.items():
+        if sent_id not in new_sents:
+            yield Change(REMOVED, SENTENCE, sent_id, doc_id, source, None)
+            for token_id, token in tokens.items():
+                yield Change(REMOVED, TOKEN, token_id, doc_id, token, None)
+
+    for sent_id, (source, tokens) in new_sents.items():
+        if sent_id not in old_sents:
+            yield Change(ADDED, SENTENCE, sent_id, doc_id, None, source)
+            for token_id, token in tokens.items():
+                yield Change(ADDED, TOKEN, token_id, doc_id, None, token)
+            continue
+
+        old_source, old_tokens = old_sents[sent_id]
+        if old_source != source:
+            yield Change(CHANGED, SENTENCE, sent_id, doc_id, old_source, source)
+        for token_id, old_token in old_tokens.items():
+            if token_id not in tokens:
+                yield Change(REMOVED, TOKEN, token_id, doc_id, old_token, None)
+        for token_id, token in tokens.items():
+            old_token = old_tokens.get(token_id)
+            if old_token is None:
+                yield Change(ADDED, TOKEN, token_id, doc_id, None, token)
+            elif old_token != token:
+                yield Change(CHANGED, TOKEN, token_id, doc_id, old_token, token)
@@ -0,0 +1,413 @@
+# -*- coding: utf-8 -*-
+"""
+Resumable corpus download.
+
+If the server supports HTTP range requests the file is split into
+segments which are fetched by several threads; downloaded data goes to
+a ``<output>.part`` file and the progress is saved to
+``<output>.part.state``, so an interrupted download continues where it
+stopped. Downloaded data is decompressed (and hashed) by a separate
+thread as soon as a contiguous prefix of the file is available.
+The output file is created atomically after all checks pass.
+"""
+from __future__ import absolute_import, division
+import os
+import bz2
+import json
+import time
+import hashlib
+import threading
+from http.client import HTTPException
+
+from opencorpora import compat
+
+CHUNK_SIZE = 256*1024
+SEGMENT_SIZE = 8*1024*1024
+TIMEOUT = 30
+RETRIES = 3
+STATE_SAVE_INTERVAL = 1.0
+
+
+class DownloadError(IOError):
+    pass
+
+
+def download(url, out_file, decompress=True, jobs=4, sha256=None,
+             on_progress=None, opener=None, segment_size=SEGMENT_SIZE,
+             chunk_size=CHUNK_SIZE):
+    """
+    Download ``url`` to ``out_file``, optionally decompressing bzip2 data.
+
+    ``jobs`` is the number of concurrent connections; ``sha256`` is
+    an expected hex digest of the downloaded (compressed) data.
+    ``on_progress(downloaded, total)`` is called after every chunk;
+    ``total`` is None if the size is unknown. ``opener`` is
+    a function with ``urlopen`` interface.
+    """
+    opener = opener or compat.urlopen
+    part_file = out_file + '.part'
+    state_file = part_file + '.state'
+
+    size, ranges, validator = _probe(opener, url)
+    if ranges and size:
+        fetcher = _SegmentedFetcher(opener, url, part_file, state_file, size,
+                                    validator, segment_size, chunk_size, jobs)
+    else:
+        fetcher = _StreamFetcher(opener, url, part_file, size, chunk_size)
+    if on_progress is not None:
+        fetcher.progress.listeners.append(on_progress)
+
+    consumer = _Consumer(fetcher.progress, part_file,
+                         out_file + '.tmp' if decompress else None, chunk_size)
+    consumer_thread = threading.Thread(target=consumer.run)
+    consumer_thread.daemon = True
+    consumer_thread.start()
+    try:
+        try:
+            fetcher.run()
+        finally:
+            # the consumer stops after the last byte or on error
+            fetcher.progress.finish()
+            consumer_thread.join()
+        _check(consumer, size, sha256)
+    except DownloadError:
+        # downloaded data is bad, there is nothing to resume
+        _remove(part_file, state_file, out_file + '.tmp')
+        raise
+    except BaseException:
+        _remove(out_file + '.tmp')
+        raise
+
+    if decompress:
+        compat.replace_file(out_file + '.tmp', out_file)
+        _remove(part_file, state_file)
+    else:
+        compat.replace_file(part_file, out_file)
+        _remove(state_file)
+    return consumer.sha256.hexdigest()
+
+
+def _check(consumer, size, sha256):
+    if consumer.error is not None:
+        raise consumer.error
+    if size is not None and consumer.position != size:
+        raise DownloadError("incomplete download: %d of %d bytes" % (
+            consumer.position, size))
+    digest = consumer.sha256.hexdigest()
+    if sha256 is not None and digest != sha256.lower():
+        raise DownloadError("checksum mismatch: expected %s, got %s" % (sha256, digest))
+
+
+def _remove(*filenames):
+    for filename in filenames:
+        try:
+            os.remove(filename)
+        except OSError:
+            pass
+
+
+def _header_int(value):
+    if isinstance(value, compat.string_types) and value.strip().isdigit():
+        return int(value)
+
+
+def _probe(opener, url):
+    """
+    Return (size, ranges_supported, validator) for ``url``;
+    the validator (ETag or Last-Modified) is used to detect that the file
+    has changed between download attempts.
+    """
+    try:
+        request = compat.Request(url, headers={'Range': 'bytes=0-0'})
+    except ValueError:
+        # not a valid http url; leave it to the opener
+        return None, False, None
+    response = opener(request, timeout=TIMEOUT)
+    try:
+        info = response.info()
+        validator = info.get('ETag') or info.get('Last-Modified')
+        if not isinstance(validator, compat.string_types):
+            validator = None
+        content_range = info.get('Content-Range')
+        if response.getcode() == 206 and isinstance(content_range, compat.string_types):
+            return _header_int(content_range.rpartition('/')[2]), True, validator
+        return _header_int(info.get('Content-Length')), False, validator
+    finally:
+        response.close()
+
+
+class _Progress(object):
+    """
+    Shared download progress: the size of the contiguous downloaded
+    prefix of the file and the total number of downloaded bytes.
+    """
+    def __init__(self, total, done=0):
+        self.total = total
+        self.done = done
+        self.contiguous = 0
+        self.finished = False
+        self.listeners = []
+        self.condition = threading.Condition()
+
+    def update(self, contiguous, added):
+        with self.condition:
+            self.contiguous = contiguous
+            self.done += added
+            self.condition.notify_all()
+        for listener in self.listeners:
+            listener(self.done, self.total)
+
+    def finish(self):
+        with self.condition:
+            self.finished = True
+            self.condition.notify_all()
+
+    def wait(self, position):
+        """
+        Wait until data after ``position`` is available; return the
+        contiguous prefix size (it is equal to ``position`` at the end).
+        """
+        with self.condition:
+            while self.contiguous <= position and not self.finished:
+                self.condition.wait()
+            return self.contiguous
+
+
+class _StreamFetcher(object):
+    """ Download the whole file over a single connection. """
+
+    def __init__(self, opener, url, part_file, size, chunk_size):
+        self.opener = opener
+        self.url = url
+        self.part_file = part_file
+        self.chunk_size = chunk_size
+        self.progress = _Progress(size)
+
+    def run(self):
+        response = self.opener(self.url, timeout=TIMEOUT)
+        position = 0
+        try:
+            with open(self.part_file, 'wb') as out:
+                while True:
+                    data = response.read(self.chunk_size)
+                    if not data:
+                        break
+                    out.write(data)
+                    out.flush()
+                    position += len(data)
+                    self.progress.update(position, len(data))
+        finally:
+            response.close()
+
+
+class _SegmentedFetcher(object):
+    """
+    Download fixed-size segments of the file using range requests
+    in several threads. Segments are taken in file order, so that
+    the contiguous prefix grows steadily.
+    """
+
+    def __init__(self, opener, url, part_file, state_file, size, validator,
+                 segment_size, chunk_size, jobs):
+        self.opener = opener
+        self.url = url
+        self.part_file = part_file
+        self.state_file = state_file
+        self.size = size
+        self.validator = validator
+        self.chunk_size = chunk_size
+        self.jobs = max(jobs, 1)
+        self.lock = threading.Lock()
+        self.errors = []
+        self.next_segment = 0
+        self.saved_at = 0
+        self.segment_size = segment_size
+
+        state = self._load_state()
+        if state is not None and state.get('segment_size') == segment_size:
+            self.done = state['done']
+        else:
+            self.done = [0] * ((size + segment_size - 1) // segment_size)
+            with open(part_file, 'wb') as f:
+                f.truncate(size)
+        self.progress = _Progress(size, sum(self.done))
+        self.progress.contiguous = self._contiguous()
+
+    def _segment_bounds(self, index):
+        start = index * self.segment_size
+        return start, min(start + self.segment_size, self.size)
+
+    def _load_state(self):
+        if not os.path.exists(self.part_file):
+            return None
+        try:
+            with open(self.state_file) as f:
+                state = json.load(f)
+        except (IOError, OSError, ValueError):
+            return None
+        if (state.get('url') != self.url or state.get('size') != self.size or
+                state.get('validator') != self.validator or
+                os.path.getsize(self.part_file) != self.size):
+            return None
+        return state
+
+    def _save_state(self, force=False):
+        # called with self.lock held
+        now = time.time()
+        if not force and now - self.saved_at < STATE_SAVE_INTERVAL:
+            return
+        self.saved_at = now
+        state = {
+            'url': self.url,
+            'size': self.size,
+            'validator': self.validator,
+            'segment_size': self.segment_size,
+            'done': self.done,
+        }
+        tmp_name = self.state_file + '.tmp'
+        with open(tmp_name, 'w') as f:
+            json.dump(state, f)
+        compat.replace_file(tmp_name, self.state_file)
+
+    def _contiguous(self):
+        position = 0
+        for index, done in enumerate(self.done):
+            start, end = self._segment_bounds(index)
+            position = start + done
+            if position < end:
+                break
+        return position
+
+    def _take_segment(self):
+        with self.lock:
+            while self.next_segment < len(self.done) and not self.errors:
+                index = self.next_segment
+                self.next_segment += 1
+                start, end = self._segment_bounds(index)
+                if start + self.done[index] < end:
+                    return index
+
+    def run(self):
+        threads = [threading.Thread(target=self._worker)
+                   for _ in range(min(self.jobs, len(self.done)))]
+        for thread in threads:
+            thread.daemon = True
+            thread.start()
+        for thread in threads:
+            thread.join()
+        with self.lock:
+            self._save_state(force=True)
+        if self.errors:
+            raise self.errors[0]
+
+    def _worker(self):
+        try:
+            with open(self.part_file, 'r+b') as out:
+                while True:
+                    index = self._take_segment()
+                    if index is None:
+                        return
+                    self._fetch_segment(index, out)
+        except Exception as e:
+            with self.lock:
+                self.errors.append(e)
+            self.progress.finish()
+
+    def _fetch_segment(self, index, out):
+        start, end = self._segment_bounds(index)
+        for attempt in range(RETRIES):
+            try:
+                self._fetch_range(index, start, end, out)
+                return
+            except (IOError, OSError, HTTPException) as e:
+                if isinstance(e, DownloadError) or attempt == RETRIES - 1:
+                    raise
+
+    def _fetch_range(self, index, start, end, out):
+        position = start + self.done[index]
+        request = compat.Request(self.url, headers={
+            'Range': 'bytes=%d-%d' % (position, end - 1)
+        })
+        response = self.opener(request, timeout=TIMEOUT)
+        try:
+            if response.getcode() != 206:
+                raise DownloadError("server ignored a range request")
+            while position < end:
+                data = response.read(min(self.chunk_size, end - position))
+                if not data:
+                    raise IOError("connection closed at byte %d" % position)
+                out.seek(position)
+                out.write(data)
+                out.flush()
+                position += len(data)
+                with self.lock:
+                    self.done[index] = position - start
+                    contiguous = self._contiguous()
+                    self._save_state(force=position == end)
+                self.progress.update(contiguous, len(data))
+        finally:
+            response.close()
+
+
+class _Consumer(object):
+    """
+    Read the contiguous downloaded prefix of the part file, hash it and
+    (if ``out_file`` is not None) decompress it to ``out_file``.
+    """
+
+    def __init__(self, progress, part_file, out_file, chunk_size):
+        self.progress = progress
+        self.part_file = part_file
+        self.out_file = out_file
+        self.chunk_size = chunk_size
+        self.position = 0
+        self.sha256 = hashlib.sha256()
+        self.error = None
+
+    def run(self):
+        try:
+            self._run()
+        except Exception as e:
+            self.error = e
+
+    def _run(self):
+        out = open(self.out_file, 'wb') if self.out_file else None
+        decompressor = bz2.BZ2Decompressor()
+        try:
+            part = None
+            while True:
+                available = self.progress.wait(self.position)
+                if available <= self.position:
+                    break
+                if part is None:
+                    # unbuffered: a read-ahead buffer could hold stale data
+                    part = open(self.part_file, 'rb', buffering=0)
+                part.seek(self.position)
+                while self.position < available:
+                    data = part.read(min(self.chunk_size, available - self.position))
+                    if not data:
+                        break
+                    self.position += len(data)
+                    self.sha256.update(data)
+                    if out is not None:
+                        decompressor = self._decompress(decompressor, data, out)
+            if part is not None:
+                part.close()
+        finally:
+            if out is not None:
+                out.close()
+        if out is not None and self.position and not decompressor.eof:
+            raise DownloadError("compressed data is truncated")
+
+    def _decompress(self, decompressor, data, out):
+        # files created by parallel bzip2 tools contain several streams
+        while data:
+            if decompressor.eof:
+                decompressor = bz2.BZ2Decompressor()
+            try:
+                decompressed = decompressor.decompress(data)
+            except (IOError, OSError, EOFError) as e:
+                raise DownloadError("invalid bzip2 data: %s" % e)
+            out.write(decompressed)
+            data = decompressor.unused_data if decompressor.eof else b''
+        return decompressor
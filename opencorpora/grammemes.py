@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""
+Compact tag representation: grammemes are mapped to bit positions
+and tags are interned :class:`Tag` objects with an integer bit mask.
+
+:class:`Tag` is a string subclass equal to the usual comma-joined tag,
+so it can be used anywhere a tag string is expected::
+
+    >>> registry = GrammemeRegistry()
+    >>> tag = registry.tag('NOUN,inan,femn,sing,gent')
+    >>> tag == 'NOUN,inan,femn,sing,gent'
+    True
+    >>> tag is registry.tag('NOUN,inan,femn,sing,gent')
+    True
+    >>> noun_gent = registry.mask('NOUN', 'gent')
+    >>> tag.has_all(noun_gent)
+    True
+    >>> tag.has_all(registry.mask('NOUN', 'nomn'))
+    False
+"""
+from __future__ import absolute_import, unicode_literals
+import threading
+from opencorpora.compat import text_type
+
+# OpenCorpora grammeme inventory (http://opencorpora.org/dict.php?act=gram)
+# plus grammemes used for non-dictionary tokens.
+GRAMMEMES = (
+    # parts of speech
+    'NOUN', 'ADJF', 'ADJS', 'COMP', 'VERB', 'INFN', 'PRTF', 'PRTS', 'GRND',
+    'NUMR', 'ADVB', 'NPRO', 'PRED', 'PREP', 'CONJ', 'PRCL', 'INTJ',
+    # non-dictionary tokens
+    'PNCT', 'NUMB', 'intg', 'real', 'LATN', 'ROMN', 'UNKN', 'SYMB',
+    # animacy, gender, number
+    'anim', 'inan', 'masc', 'femn', 'neut', 'ms-f', 'Ms-f', 'GNdr',
+    'sing', 'plur', 'Sgtm', 'Pltm', 'Fixd',
+    # cases
+    'nomn', 'gent', 'datv', 'accs', 'ablt', 'loct', 'voct',
+    'gen1', 'gen2', 'acc2', 'loc1', 'loc2',
+    # lexical features
+    'Abbr', 'Name', 'Surn', 'Patr', 'Geox', 'Orgn', 'Trad', 'Subx', 'Supr',
+    'Qual', 'Apro', 'Anum', 'Poss', 'V-ey', 'V-oy', 'Cmp2', 'V-ej',
+    # verbs
+    'perf', 'impf', 'tran', 'intr', 'Impe', 'Impx', 'Mult', 'Refl',
+    '1per', '2per', '3per', 'pres', 'past', 'futr', 'indc', 'impr',
+    'incl', 'excl', 'actv', 'pssv',
+    # misc
+    'Infr', 'Slng', 'Arch', 'Litr', 'Erro', 'Dist', 'Ques', 'Dmns', 'Prnt',
+    'V-be', 'V-en', 'V-ie', 'V-bi', 'Fimp', 'Prdx', 'Coun', 'Coll', 'V-sh',
+    'Af-p', 'Inmx', 'Vpre', 'Anph', 'Init', 'Adjx', 'Hypo',
+)
+
+
+class Tag(text_type):
+    """
+    Interned tag. It is a string (comma-separated grammemes)
+    with an extra ``mask`` attribute: a bit mask of its grammemes.
+    Create tags with :meth:`GrammemeRegistry.tag`.
+    """
+    mask = 0
+
+    @property
+    def grammemes(self):
+        return tuple(self.split(',')) if self else ()
+
+    def has_all(self, mask):
+        """ True if the tag has all grammemes from ``mask``. """
+        return self.mask & mask == mask
+
+    def has_any(self, mask):
+        """ True if the tag has any grammeme from ``mask``. """
+        return bool(self.mask & mask)
+
+    def __reduce__(self):
+        # unpickle as a plain string: masks are registry-specific
+        return text_type, (text_type(self),)
+
+
+class GrammemeRegistry(object):
+    """
+    Mapping of grammemes to bit positions. Grammemes from ``grammemes``
+    get fixed bits; unknown grammemes are registered on the fly.
+    The registry also interns :class:`Tag` objects. It is thread-safe.
+    """
+
+    def __init__(self, grammemes=GRAMMEMES):
+        self._bits = {}
+        self._tags = {}
+        self._masks = {}
+        self._lock = threading.Lock()
+        for grammeme in grammemes:
+            self.bit(grammeme)
+
+    def __len__(self):
+        return len(self._bits)
+
+    @property
+    def grammemes(self):
+        """ Registered grammemes, ordered by bit position. """
+        return sorted(self._bits, key=self._bits.__getitem__)
+
+    def bit(self, grammeme):
+        """ Return bit position of a grammeme, registering it if needed. """
+        try:
+            return self._bits[grammeme]
+        except KeyError:
+            with self._lock:
+                return self._bits.setdefault(grammeme, len(self._bits))
+
+    def mask(self, *grammemes):
+        """ Return bit mask for grammemes. """
+        mask = 0
+        for grammeme in grammemes:
+            mask |= 1 << self.bit(grammeme)
+        return mask
+
+    def tag(self, string):
+        """ Return interned Tag for a comma-separated tag string. """
+        try:
+            return self._tags[string]
+        except KeyError:
+            pass
+        tag = Tag(string)
+        tag.mask = self.mask(*tag.grammemes)
+        with self._lock:
+            tag = self._tags.setdefault(text_type(string), tag)
+            self._masks.setdefault(tag.mask, tag)
+        return tag
+
+    def to_string(self, mask):
+        """
+        Convert a bit mask back to a tag string. Grammeme order is taken
+        from the first interned tag with this mask; otherwise
+        grammemes are sorted by bit position.
+        """
+        if mask in self._masks:
+            return text_type(self._masks[mask])
+        return ','.join(g for g in self.grammemes if mask & (1 << self._bits[g]))
@@ -0,0 +1,617 @@
+# -*- coding: utf-8 -*-
+"""
+Single-pass document index builder for OpenCorpora XML files.
+
+The scanner reads the file once, from start to end, and finds ``<text>``
+elements with plain byte searches. Only the ``<tags>`` block of each
+document is parsed; token trees are skipped.
+
+Large files can also be split into byte ranges at ``<text>`` boundaries
+and scanned by several worker processes.
+
+Computed metadata is stored in a memory-mapped binary index
+(see :class:`DocumentIndex`). Every document has a digest of its XML;
+when the corpus file changes, the whole file is scanned and hashed
+again, but metadata and sentence offsets of documents with unchanged
+digests are taken from the previous index instead of parsing these
+documents again.
+"""
+from __future__ import absolute_import
+import os
+import re
+import array
+import bisect
+import struct
+import hashlib
+from collections import namedtuple
+from collections.abc import Mapping
+
+from opencorpora import xml_utils, binfile
+from opencorpora.categories import CategoryIndex
+from opencorpora.compat import ElementTree, text_type
+
+READ_SIZE = 4*1024*1024
+
+INDEX_MAGIC = b'OCDOCIDX'
+INDEX_VERSION = 3
+
+SENTENCE_INDEX_MAGIC = b'OCSNTIDX'
+SENTENCE_INDEX_VERSION = 2
+
+_ATTR_RE = re.compile(br'([\w:-]+)="([^"]*)"')
+_ID_RE = re.compile(br'\sid="(\d+)"')
+_TOKEN_ID_RE = re.compile(br'<token\s[^>]*?\bid="(\d+)"')
+
+DocumentMeta = namedtuple('DocumentMeta', 'title bounds categories parent digest')
+
+
+def document_digest(data):
+    """ Return a 64-bit fingerprint of document XML. """
+    return struct.unpack('<Q', hashlib.sha1(data).digest()[:8])[0]
+
+
+class DocumentScanner(object):
+    """
+    Scan a binary file object for ``<text>`` elements.
+
+    ``offset`` is the absolute byte offset of the current ``fp`` position;
+    it must point to the beginning of a line. Line numbers reported
+    by the scanner are counted from this position.
+
+    ``previous`` is an optional mapping doc_id -> DocumentMeta from
+    a previous scan: metadata of documents with the same digest
+    is reused without parsing.
+    """
+
+    def __init__(self, fp, offset=0, read_size=READ_SIZE, previous=None):
+        self.fp = fp
+        self.previous = previous
+        self.reused = 0
+        self.read_size = read_size
+        self.buf = bytearray()
+        self.base = offset  # absolute offset of buf[0]
+        self.lines = 0      # number of newlines before buf[counted]
+        self.counted = 0
+        self.eof = False
+
+    def documents(self, end=None):
+        """
+        Yield (doc_id, title, parent, categories, Bounds, digest) tuples
+        for documents which start before ``end`` byte offset.
+        """
+        pos = 0
+        while True:
+            tag_start = self._find(b'<text ', pos)
+            if tag_start == -1:
+                return
+
+            start = self.buf.rfind(b'\n', 0, tag_start) + 1
+            if end is not None and self.base + start >= end:
+                return
+
+            line_start = self._count_lines(start)
+            tag_end = self._find(b'>', tag_start)
+            attrs = dict(_ATTR_RE.findall(bytes(self.buf[tag_start:tag_end])))
+
+            close = self._find(b'</text>', tag_end)
+            if close == -1:
+                raise ValueError("Unterminated <text> element at byte %d" % (
+                    self.base + start))
+            line_end = self._count_lines(close)
+
+            stop = self._find(b'\n', close)
+            stop = len(self.buf) if stop == -1 else stop + 1
+
+            doc_id = attrs[b'id'].decode('ascii')
+            with memoryview(self.buf) as view:
+                digest = document_digest(view[start:stop])
+            old = self.previous.get(doc_id) if self.previous is not None else None
+            if old is not None and old.digest == digest:
+                categories = old.categories
+                self.reused += 1
+            else:
+                categories = self._categories(tag_end, close)
+
+            yield (
+                doc_id,
+                xml_utils.unescape_attribute(attrs.get(b'name', b'').decode('utf8')),
+                attrs.get(b'parent', b'').decode('ascii') or None,
+                categories,
+                xml_utils.Bounds(line_start, line_end,
+                                 self.base + start, self.base + stop),
+                digest,
+            )
+
+            self._count_lines(stop)
+            self._discard(stop)
+            pos = 0
+
+    def lines_before(self, offset):
+        """ Return the number of lines before absolute ``offset``. """
+        while self.base + len(self.buf) < offset and self._fill():
+            pass
+        return self._count_lines(min(offset - self.base, len(self.buf)))
+
+    def _categories(self, start, stop):
+        tags_start = self.buf.find(b'<tags>', start, stop)
+        if tags_start == -1:
+            return []
+        tags_end = self.buf.find(b'</tags>', tags_start, stop)
+        tags = ElementTree.XML(bytes(self.buf[tags_start:tags_end + len(b'</tags>')]))
+        return [text_type(tag.text) for tag in tags.findall('.//tag')]
+
+    def _count_lines(self, index):
+        self.lines += self.buf.count(b'\n', self.counted, index)
+        self.counted = index
+        return self.lines
+
+    def _discard(self, index):
+        del self.buf[:index]
+        self.base += index
+        self.counted -= index
+
+    def _fill(self):
+        if self.eof:
+            return False
+        data = self.fp.read(self.read_size)
+        if not data:
+            self.eof = True
+            return False
+        self.buf += data
+        return True
+
+    def _find(self, sub, start):
+        while True:
+            index = self.buf.find(sub, start)
+            if index != -1:
+                return index
+            start = max(start, len(self.buf) - len(sub) + 1)
+            if not self._fill():
+                return -1
+
+
+def scan_documents(filename, workers=1, parts=None, previous=None):
+    """
+    Read OpenCorpora XML file once and yield
+    (doc_id, title, parent, categories, Bounds, digest) tuples.
+
+    When ``workers`` > 1 the file is split into ``parts`` byte ranges
+    (4 per worker by default) which are scanned in parallel
+    by a pool of worker processes; results are yielded in file order.
+
+    ``previous`` is a :class:`DocumentIndex` of a previous version
+    of the file; metadata of unchanged documents is reused.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 and parts is None:
+        with open(filename, 'rb') as f:
+            for doc in DocumentScanner(f, previous=previous).documents():
+                yield doc
+        return
+
+    # workers open the previous index file themselves
+    previous_filename = previous.filename if previous is not None else None
+    offsets = split_offsets(filename, parts or workers*4)
+    tasks = [
+        (filename, start, end, previous_filename)
+        for start, end in zip(offsets, offsets[1:] + [None])
+    ]
+
+    if workers <= 1:
+        results = map(_scan_range, tasks)
+        for doc in _merge_ranges(results):
+            yield doc
+        return
+
+    import multiprocessing
+    pool = multiprocessing.Pool(workers)
+    try:
+        for doc in _merge_ranges(pool.imap(_scan_range, tasks)):
+            yield doc
+    finally:
+        pool.terminate()
+
+
+def split_offsets(filename, parts):
+    """
+    Return a sorted list of byte offsets which split the file into
+    at most ``parts`` ranges. Each offset except the first one is
+    the beginning of a ``<text>`` line.
+    """
+    size = os.path.getsize(filename)
+    offsets = [0]
+    with open(filename, 'rb') as f:
+        for index in range(1, parts):
+            approx = size * index // parts
+            if approx <= offsets[-1]:
+                continue
+            offset = _next_document_offset(f, approx)
+            if offset is None:
+                break
+            if offset > offsets[-1]:
+                offsets.append(offset)
+    return offsets
+
+
+def _next_document_offset(f, offset):
+    f.seek(offset)
+    if offset:
+        offset += len(f.readline())  # skip to the beginning of a line
+    for line in f:
+        if line.lstrip().startswith(b'<text '):
+            return offset
+        offset += len(line)
+    return None
+
+
+def _scan_range(args):
+    filename, start, end, previous_filename = args
+    previous = DocumentIndex(previous_filename) if previous_filename else None
+    try:
+        with open(filename, 'rb') as f:
+            f.seek(start)
+            scanner = DocumentScanner(f, offset=start, previous=previous)
+            docs = list(scanner.documents(end))
+            num_lines = scanner.lines_before(end) if end is not None else None
+    finally:
+        if previous is not None:
+            previous.close()
+    return docs, num_lines
+
+
+def _merge_ranges(results):
+    """ Shift per-range line numbers so that they are global. """
+    line_offset = 0
+    for docs, num_lines in results:
+        for doc_id, title, parent, categories, bounds, digest in docs:
+            yield doc_id, title, parent, categories, bounds._replace(
+                line_start=bounds.line_start + line_offset,
+                line_end=bounds.line_end + line_offset,
+            ), digest
+        if num_lines is not None:
+            line_offset += num_lines
+
+
+def write_document_index(filename, meta, file_info):
+    """
+    Write document metadata (an ordered mapping doc_id -> DocumentMeta)
+    to a binary index file. ``file_info`` is a dict with information
+    about the indexed file which is used to detect stale indexes.
+    """
+    categories = sorted(set(
+        cat for doc_meta in meta.values() for cat in doc_meta.categories
+    ))
+    category_ids = dict((cat, index) for index, cat in enumerate(categories))
+
+    doc_ids = array.array('Q')
+    parents = array.array('q')
+    bounds = array.array('Q')
+    digests = array.array('Q')
+    doc_categories = array.array('I')
+    doc_categories_offsets = array.array('Q', [0])
+    titles = []
+
+    for doc_id, doc_meta in meta.items():
+        doc_ids.append(int(doc_id))
+        parents.append(-1 if doc_meta.parent is None else int(doc_meta.parent))
+        bounds.extend(doc_meta.bounds)
+        digests.append(doc_meta.digest)
+        doc_categories.extend(category_ids[cat] for cat in doc_meta.categories)
+        doc_categories_offsets.append(len(doc_categories))
+        titles.append(doc_meta.title)
+
+    category_index = CategoryIndex.from_meta(meta)
+    postings = array.array('I')
+    postings_offsets = array.array('Q', [0])
+    for cat_id in range(len(category_index.categories)):
+        postings.extend(category_index.postings(cat_id))
+        postings_offsets.append(len(postings))
+
+    order = sorted(range(len(doc_ids)), key=doc_ids.__getitem__)
+    sorted_ids = array.array('Q', [doc_ids[pos] for pos in order])
+    sorted_positions = array.array('Q', order)
+
+    titles_offsets, titles_data = binfile.string_table(titles)
+    cat_offsets, cat_data = binfile.string_table(categories)
+
+    binfile.write(filename, INDEX_MAGIC, INDEX_VERSION, file_info, [
+        ('doc_ids', doc_ids),
+        ('parents', parents),
+        ('bounds', bounds),
+        ('digests', digests),
+        ('doc_categories', doc_categories),
+        ('doc_categories.offsets', doc_categories_offsets),
+        ('sorted_ids', sorted_ids),
+        ('sorted_positions', sorted_positions),
+        ('titles.offsets', titles_offsets),
+        ('titles.data', titles_data),
+        ('categories.offsets', cat_offsets),
+        ('categories.data', cat_data),
+        ('category_postings', postings),
+        ('category_postings.offsets', postings_offsets),
+    ])
+
+
+class DocumentIndex(Mapping):
+    """
+    Read-only ordered mapping doc_id -> DocumentMeta backed by
+    a memory-mapped index file. Opening the index only reads its header;
+    lookups are done lazily (binary search over sorted ids).
+    """
+
+    def __init__(self, filename):
+        self.filename = filename
+        self._file = binfile.SectionFile(filename, INDEX_MAGIC, INDEX_VERSION)
+        self.file_info = self._file.meta
+        self._doc_ids = self._file.array('doc_ids')
+        self._sorted_ids = self._file.array('sorted_ids')
+        self._sorted_positions = self._file.array('sorted_positions')
+        self._categories = None
+
+    def position(self, doc_id):
+        """ Return position of a document in file order. """
+        try:
+            key = int(doc_id)
+        except ValueError:
+            raise KeyError(doc_id)
+        index = bisect.bisect_left(self._sorted_ids, key)
+        if index == len(self._sorted_ids) or self._sorted_ids[index] != key:
+            raise KeyError(doc_id)
+        return self._sorted_positions[index]
+
+    def meta_at(self, pos):
+        """ Return DocumentMeta for a document at position ``pos``. """
+        f = self._file
+        bounds = f.array('bounds')[pos*4:pos*4 + 4]
+        start, end = f.array('doc_categories.offsets')[pos:pos + 2]
+        parent = f.array('parents')[pos]
+        return DocumentMeta(
+            title=f.strings('titles')[pos],
+            bounds=xml_utils.Bounds(*bounds.tolist()),
+            categories=[self.category(cat_id)
+                        for cat_id in f.array('doc_categories')[start:end]],
+            parent=None if parent == -1 else str(parent),
+            digest=f.array('digests')[pos],
+        )
+
+    def category(self, cat_id):
+        if self._categories is None:
+            self._categories = self._file.strings('categories')
+        return self._categories[cat_id]
+
+    def category_index(self):
+        """ Return CategoryIndex backed by stored postings lists. """
+        return _StoredCategoryIndex(
+            list(self), list(self._file.strings('categories')),
+            self._file.array('category_postings'),
+            self._file.array('category_postings.offsets'))
+
+    def __getitem__(self, doc_id):
+        return self.meta_at(self.position(doc_id))
+
+    def __contains__(self, doc_id):
+        try:
+            self.position(doc_id)
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for doc_id in self._doc_ids:
+            yield str(doc_id)
+
+    def __len__(self):
+        return len(self._doc_ids)
+
+    def close(self):
+        self._doc_ids = self._sorted_ids = self._sorted_positions = None
+        self._categories = None
+        self._file.close()
+
+
+class _StoredCategoryIndex(CategoryIndex):
+    def __init__(self, doc_ids, categories, postings, offsets):
+        super(_StoredCategoryIndex, self).__init__(doc_ids, categories, postings)
+        self._offsets = offsets
+
+    def postings(self, cat_id):
+        start, end = self._offsets[cat_id], self._offsets[cat_id + 1]
+        return self._postings[start:end].tolist()
+
+
+def scan_sentences(data, offset=0):
+    """
+    Find ``<sentence>`` elements in a document XML chunk ``data``
+    (which starts at byte ``offset`` of the file); yield
+    (sentence_id, byte_start, byte_end, token_ids) tuples.
+    """
+    pos = 0
+    while True:
+        start = data.find(b'<sentence ', pos)
+        if start == -1:
+            return
+        tag_end = data.find(b'>', start)
+        sent_id = int(_ID_RE.search(data, start, tag_end).group(1))
+        end = data.find(b'</sentence>', tag_end)
+        if end == -1:
+            raise ValueError("Unterminated <sentence> element at byte %d" % (
+                offset + start))
+        end += len(b'</sentence>')
+        token_ids = [int(m.group(1))
+                     for m in _TOKEN_ID_RE.finditer(data, tag_end, end)]
+        yield sent_id, offset + start, offset + end, token_ids
+        pos = end
+
+
+def build_sentence_index(meta, source, previous=None):
+    """
+    Return a dict of arrays for :class:`SentenceIndex`. ``meta`` is
+    the document metadata mapping and ``source`` is a MappedFile.
+    ``previous`` is a SentenceIndex for a previous version of the file;
+    sentences of unchanged documents are copied from it.
+    """
+    arrays = dict(
+        doc_ids=array.array('Q'),
+        doc_digests=array.array('Q'),
+        doc_starts=array.array('Q'),
+        doc_sents=array.array('Q', [0]),
+        sent_ids=array.array('Q'),
+        sent_docs=array.array('I'),
+        sent_bounds=array.array('Q'),
+        sent_tokens=array.array('Q', [0]),
+        token_ids=array.array('Q'),
+        token_sents=array.array('I'),
+        token_positions=array.array('I'),
+    )
+    for doc_pos, (doc_id, doc_meta) in enumerate(meta.items()):
+        start = doc_meta.bounds.byte_start
+        sentences = None
+        if previous is not None:
+            sentences = previous.document_sentences(doc_id, doc_meta.digest, start)
+        if sentences is None:
+            chunk = source.chunk(doc_meta.bounds)
+            try:
+                data = chunk.tobytes()
+            finally:
+                chunk.release()
+            sentences = scan_sentences(data, start)
+
+        arrays['doc_ids'].append(int(doc_id))
+        arrays['doc_digests'].append(doc_meta.digest)
+        arrays['doc_starts'].append(start)
+        for sent_id, start, end, token_ids in sentences:
+            sent_pos = len(arrays['sent_ids'])
+            arrays['sent_ids'].append(sent_id)
+            arrays['sent_docs'].append(doc_pos)
+            arrays['sent_bounds'].extend([start, end])
+            arrays['token_ids'].extend(token_ids)
+            arrays['token_sents'].extend([sent_pos] * len(token_ids))
+            arrays['token_positions'].extend(range(len(token_ids)))
+            arrays['sent_tokens'].append(len(arrays['token_ids']))
+        arrays['doc_sents'].append(len(arrays['sent_ids']))
+
+    for kind, positions in [('sent', 'sent'), ('token', 'token')]:
+        ids = arrays[kind + '_ids']
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        arrays['sorted_%s_ids' % kind] = array.array('Q', [ids[i] for i in order])
+        arrays['sorted_%s_positions' % kind] = array.array('Q', order)
+    return arrays
+
+
+def write_sentence_index(filename, arrays, file_info):
+    binfile.write(filename, SENTENCE_INDEX_MAGIC, SENTENCE_INDEX_VERSION,
+                  file_info, sorted(arrays.items()))
+
+
+class SentenceIndex(object):
+    """
+    Sentence and token lookup index: byte bounds of every sentence,
+    and token id -> (sentence, position in sentence) mapping.
+    It is created either from a dict of arrays or from a file.
+    """
+
+    def __init__(self, arrays, file=None):
+        self._arrays = arrays
+        self._file = file
+        self._doc_positions = None
+        self.file_info = file.meta if file is not None else None
+
+    @classmethod
+    def load(cls, filename):
+        f = binfile.SectionFile(filename, SENTENCE_INDEX_MAGIC, SENTENCE_INDEX_VERSION)
+        arrays = dict((name, f.array(name)) for name in [
+            'doc_ids', 'doc_digests', 'doc_starts', 'doc_sents',
+            'sent_ids', 'sent_docs', 'sent_bounds', 'sent_tokens', 'token_ids',
+            'token_sents', 'token_positions', 'sorted_sent_ids',
+            'sorted_sent_positions', 'sorted_token_ids', 'sorted_token_positions',
+        ])
+        return cls(arrays, f)
+
+    def __len__(self):
+        return len(self._arrays['sent_ids'])
+
+    def _lookup(self, kind, item_id):
+        ids = self._arrays['sorted_%s_ids' % kind]
+        try:
+            key = int(item_id)
+        except ValueError:
+            raise KeyError(item_id)
+        index = bisect.bisect_left(ids, key)
+        if index == len(ids) or ids[index] != key:
+            raise KeyError(item_id)
+        return self._arrays['sorted_%s_positions' % kind][index]
+
+    def sentence(self, sent_id):
+        """ Return (doc_position, byte_start, byte_end) for a sentence. """
+        pos = self._lookup('sent', sent_id)
+        bounds = self._arrays['sent_bounds']
+        return self._arrays['sent_docs'][pos], bounds[pos*2], bounds[pos*2 + 1]
+
+    def token(self, token_id):
+        """ Return (sentence_id, position in sentence) for a token. """
+        pos = self._lookup('token', token_id)
+        sent_pos = self._arrays['token_sents'][pos]
+        return self._arrays['sent_ids'][sent_pos], self._arrays['token_positions'][pos]
+
+    def sentence_at(self, sent_pos):
+        """ Return (sentence_id, doc_position, byte_start, byte_end) of a sentence. """
+        bounds = self._arrays['sent_bounds']
+        return (self._arrays['sent_ids'][sent_pos], self._arrays['sent_docs'][sent_pos],
+                bounds[sent_pos*2], bounds[sent_pos*2 + 1])
+
+    def token_at(self, token_pos):
+        """
+        Return (sentence position, position in sentence) for a token
+        given its position in the file.
+        """
+        sent_tokens = self._arrays['sent_tokens']
+        sent_pos = bisect.bisect_right(sent_tokens, token_pos) - 1
+        return sent_pos, token_pos - sent_tokens[sent_pos]
+
+    def sentence_token_range(self, first, last):
+        """ Return the range of token positions of sentences ``first:last``. """
+        sent_tokens = self._arrays['sent_tokens']
+        return sent_tokens[first], sent_tokens[last]
+
+    def document_sentence_range(self, doc_pos):
+        """ Return the range of sentence positions of a document. """
+        doc_sents = self._arrays['doc_sents']
+        return doc_sents[doc_pos], doc_sents[doc_pos + 1]
+
+    def document_position(self, doc_id):
+        """ Return position of a document in the file, or None. """
+        if self._doc_positions is None:
+            self._doc_positions = dict(
+                (doc, pos) for pos, doc in enumerate(self._arrays['doc_ids']))
+        return self._doc_positions.get(int(doc_id))
+
+    def document_sentences(self, doc_id, digest, byte_start):
+        """
+        Return a list of (sentence_id, byte_start, byte_end, token_ids)
+        tuples for a document if its digest matches the stored one,
+        shifting offsets to the new document position ``byte_start``;
+        return None otherwise.
+        """
+        pos = self.document_position(doc_id)
+        if pos is None or self._arrays['doc_digests'][pos] != digest:
+            return None
+
+        shift = byte_start - self._arrays['doc_starts'][pos]
+        bounds = self._arrays['sent_bounds']
+        sent_tokens = self._arrays['sent_tokens']
+        token_ids = self._arrays['token_ids']
+        first, last = self._arrays['doc_sents'][pos:pos + 2]
+        return [
+            (self._arrays['sent_ids'][sent_pos],
+             bounds[sent_pos*2] + shift, bounds[sent_pos*2 + 1] + shift,
+             token_ids[sent_tokens[sent_pos]:sent_tokens[sent_pos + 1]].tolist())
+            for sent_pos in range(first, last)
+        ]
+
+    def close(self):
+        self._arrays = None
+        self._doc_positions = None
+        if self._file is not None:
+            self._file.close()
@@ -0,0 +1,112 @@
+# -*- coding: utf-8 -*-
+"""
+Opt-in counters and per-stage timings for CorpusReader.
+
+Pass ``stats=True`` (or a shared :class:`ReaderStats` instance)
+to CorpusReader::
+
+    >>> corpus = CorpusReader('annot.opcorpora.xml', stats=True)  # doctest: +SKIP
+    >>> words = corpus.words()  # doctest: +SKIP
+    >>> corpus.stats.snapshot()['stages']['view']  # doctest: +SKIP
+    {'calls': 3489, 'seconds': 41.2}
+
+Stages:
+
+* ``read`` - reading document XML from the corpus file
+  (counters: ``bytes_read``, ``chunks_read``);
+* ``parse`` - building ElementTrees (``documents_parsed``);
+* ``view`` - extracting words/sentences/paragraphs from documents,
+  including streaming extraction (``documents_streamed``);
+* ``index``, ``sentence_index``, ``statistics``, ``concordance`` -
+  building indexes and statistics (``index_loads``/``index_builds``,
+  ``sentence_index_loads``/``sentence_index_builds``,
+  ``statistics_loads``/``statistics_builds``,
+  ``concordance_loads``/``concordance_builds`` counters tell if a file
+  was loaded from disk or built).
+
+The document cache reports ``document_cache_hits`` and
+``document_cache_misses``. When stats are disabled (the default)
+the reader only checks that ``stats`` is None.
+"""
+from __future__ import absolute_import
+import threading
+from timeit import default_timer as clock
+
+READ, PARSE, VIEW = 'read', 'parse', 'view'
+INDEX, SENTENCE_INDEX = 'index', 'sentence_index'
+STATISTICS, CONCORDANCE = 'statistics', 'concordance'
+
+
+class ReaderStats(object):
+    """
+    Thread-safe counters and cumulative stage timings.
+    ``callbacks`` are called as ``callback(stage, seconds, counters)``
+    after every recorded event; ``stage`` is None for counter-only events.
+    """
+
+    def __init__(self, callbacks=()):
+        self.callbacks = list(callbacks)
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self._stages = {}
+            self._counters = {}
+
+    def record(self, stage, seconds=0.0, **counters):
+        """ Add a stage call which took ``seconds`` and increment ``counters``. """
+        with self._lock:
+            if stage is not None:
+                calls, total = self._stages.get(stage, (0, 0.0))
+                self._stages[stage] = calls + 1, total + seconds
+            for name, value in counters.items():
+                self._counters[name] = self._counters.get(name, 0) + value
+        for callback in self.callbacks:
+            callback(stage, seconds, counters)
+
+    def timed_iter(self, stage, iterable):
+        """
+        Yield items from ``iterable``, recording time spent
+        in producing them as a single ``stage`` call.
+        """
+        iterator = iter(iterable)
+        elapsed = 0.0
+        try:
+            while True:
+                start = clock()
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    elapsed += clock() - start
+                    return
+                elapsed += clock() - start
+                yield item
+        finally:
+            self.record(stage, elapsed)
+
+    def snapshot(self):
+        """
+        Return a copy of the current values::
+
+            {'stages': {stage: {'calls': int, 'seconds': float}},
+             'counters': {name: int}}
+
+        """
+        with self._lock:
+            return {
+                'stages': dict(
+                    (stage, {'calls': calls, 'seconds': seconds})
+                    for stage, (calls, seconds) in self._stages.items()
+                ),
+                'counters': dict(self._counters),
+            }
+
+
+def make_stats(stats):
+    """ Convert a ``stats`` constructor argument to ReaderStats or None. """
+    if stats is True:
+        return ReaderStats()
+    if not stats:
+        return None
+    return stats
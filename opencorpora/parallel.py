@@ -0,0 +1,160 @@
+# -*- coding: utf-8 -*-
+"""
+CorpusReader which fetches and parses documents in a pool
+of worker processes.
+"""
+from __future__ import absolute_import
+import os
+import queue
+import itertools
+from collections import deque
+
+from opencorpora import compat, streaming, compressed, statistics
+from opencorpora.reader import CorpusReader, Document
+
+_worker_source = None
+
+# number of documents in a statistics task
+STATISTICS_TASK_SIZE = 32
+
+
+def _init_worker(filename, index_filename):
+    global _worker_source
+    # workers already run in parallel, so they decompress bzip2 blocks
+    # in a single thread
+    _worker_source = compressed.open_source(filename, index_filename, threads=1)
+
+
+def _process_document(task):
+    bounds, doc_method = task
+    chunk = _worker_source.chunk(bounds)
+    try:
+        if doc_method in streaming.VIEWS:
+            return streaming.document_view(chunk, doc_method)
+        doc = Document(compat.ElementTree.XML(chunk))
+    finally:
+        chunk.release()
+    return list(getattr(doc, doc_method)())
+
+
+def _documents_statistics(docs):
+    builder = statistics.StatisticsBuilder()
+    for doc_id, bounds in docs:
+        chunk = _worker_source.chunk(bounds)
+        try:
+            builder.add_document(doc_id, chunk)
+        finally:
+            chunk.release()
+    return builder
+
+
+class _Failure(object):
+    def __init__(self, exc):
+        self.exc = exc
+
+
+def imap_bounded(pool, func, iterable, max_pending, ordered=True):
+    """
+    Like ``pool.imap`` / ``pool.imap_unordered``, but at most
+    ``max_pending`` tasks are submitted and not yet consumed at any time,
+    so a slow consumer doesn't make results pile up in memory.
+    """
+    if ordered:
+        pending = deque()
+        for item in iterable:
+            pending.append(pool.apply_async(func, (item,)))
+            if len(pending) >= max_pending:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+        return
+
+    done = queue.Queue()
+    on_error = lambda exc: done.put(_Failure(exc))
+
+    def get():
+        result = done.get()
+        if isinstance(result, _Failure):
+            raise result.exc
+        return result
+
+    in_flight = 0
+    for item in iterable:
+        pool.apply_async(func, (item,), callback=done.put, error_callback=on_error)
+        in_flight += 1
+        if in_flight >= max_pending:
+            in_flight -= 1
+            yield get()
+    while in_flight:
+        in_flight -= 1
+        yield get()
+
+
+class ParallelCorpusReader(CorpusReader):
+    """
+    OpenCorpora corpus reader which parses documents in ``workers``
+    processes. All ``iter_*`` views (words, tagged_sents, paras, etc.)
+    are computed by workers; documents are passed to them as byte bounds.
+
+    With ``ordered=False`` results are returned document-by-document
+    in completion order. ``max_pending`` limits the number of documents
+    which are being processed or waiting to be consumed.
+    ``stats`` only cover work done in the main process.
+    """
+
+    def __init__(self, filename, cache_filename=None, use_cache=True,
+                 index_workers=1, tag_registry=None, workers=None,
+                 ordered=True, max_pending=None, stats=None):
+        super(ParallelCorpusReader, self).__init__(
+            filename, cache_filename, use_cache, index_workers, tag_registry,
+            stats=stats)
+        self.workers = workers or os.cpu_count() or 1
+        self.ordered = ordered
+        self.max_pending = max_pending or self.workers * 4
+        self._pool = None
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.terminate()
+            self._pool.join()
+            self._pool = None
+        super(ParallelCorpusReader, self).close()
+
+    def _get_pool(self):
+        if self._pool is None:
+            source = self._get_source()
+            if isinstance(source, compressed.Bz2BlockFile):
+                # build the block index once instead of in every worker
+                source.ensure_index()
+            import multiprocessing
+            self._pool = multiprocessing.Pool(
+                self.workers, _init_worker,
+                (self.filename, self._block_index_filename()))
+        return self._pool
+
+    def _compute_statistics(self):
+        """ Compute statistics of groups of documents in workers and merge them. """
+        meta = self._get_meta()
+        docs = ((doc_id, meta[doc_id].bounds) for doc_id in self._filter_ids())
+        tasks = iter(lambda: list(itertools.islice(docs, STATISTICS_TASK_SIZE)), [])
+        builder = statistics.StatisticsBuilder()
+        for part in imap_bounded(self._get_pool(), _documents_statistics, tasks,
+                                 self.max_pending):
+            builder.merge(part)
+        return builder
+
+    def _doc_iterator(self, fileids, categories, doc_method):
+        meta = self._get_meta()
+        tasks = (
+            (meta[doc_id].bounds, doc_method)
+            for doc_id in self._filter_ids(fileids, categories)
+        )
+        results = imap_bounded(self._get_pool(), _process_document, tasks,
+                               self.max_pending, self.ordered)
+        for doc_results in results:
+            # tags are interned here, so that all of them
+            # come from the same registry
+            if doc_method in streaming.VIEWS:
+                doc_results = self._convert_tags(doc_results, doc_method)
+            for res in doc_results:
+                yield res
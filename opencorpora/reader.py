@@ -3,10 +3,22 @@ from __future__ import absolute_import
 import os
 import functools
 import itertools
-import fnmatch
-from collections import namedtuple, OrderedDict
-from opencorpora import compat, xml_utils
+from collections import OrderedDict
+from opencorpora import (compat, xml_utils, indexing, binfile, streaming, compressed,
+                         statistics, concordance)
+from opencorpora.instrumentation import (make_stats, clock, READ, PARSE, VIEW,
+                                         INDEX, SENTENCE_INDEX, STATISTICS,
+                                         CONCORDANCE)
 from opencorpora.compat import imap, text_type
+from opencorpora.categories import CategoryIndex, compile_pattern
+from opencorpora.cache import LRUCache
+
+# get_documents: documents closer than this are read together...
+BULK_MAX_GAP = 256 * 1024
+# ...with reads of at most this size
+BULK_MAX_SPAN = 32 * 1024 * 1024
+# iter_documents fetches documents in groups of this size
+BULK_BATCH_SIZE = 16
 
 
 def make_iterable(obj, default=None):
@@ -18,14 +30,6 @@ def make_iterable(obj, default=None):
     return obj
 
 
-def some_items_match(items, patterns):
-    return any(
-        fnmatch.fnmatchcase(item, pattern)
-        for item in items
-        for pattern in patterns
-    )
-
-
 def _sentence_source(sent_elem):
     return text_type(sent_elem.find('source').text)
 
@@ -62,6 +66,16 @@ def _grammemes(l_element):
             for grammeme in list(l_element)]
 
 
+def _timed_view(func):
+    """ Record time spent in a Document view if the document has stats. """
+    @functools.wraps(func)
+    def method(self):
+        if self.stats is None:
+            return func(self)
+        return self.stats.timed_iter(VIEW, func(self))
+    return method
+
+
 def non_iterative(func):
     @functools.wraps(func)
     def res(*args, **kwargs):
@@ -72,9 +86,11 @@ def non_iterative(func):
 class Document(object):
     """
     Single OpenCorpora document.
+    ``stats`` is a ReaderStats instance for recording view timings.
     """
-    def __init__(self, xml):
+    def __init__(self, xml, stats=None):
         self.root = xml
+        self.stats = stats
 
     def _xml_sents(self):
         return self.root.findall('*//sentence')
@@ -82,30 +98,38 @@ class Document(object):
     def _xml_paras(self):
         return self.root.findall('*//paragraph')
 
+    @_timed_view
     def iter_sents(self):
         return imap(_sentence_words, self._xml_sents())
 
+    @_timed_view
     def iter_raw_sents(self):
         return imap(_sentence_source, self._xml_sents())
 
+    @_timed_view
     def iter_tagged_sents(self):
         return imap(_sentence_tagged_words, self._xml_sents())
 
+    @_timed_view
     def iter_parsed_sents(self):
         return imap(_sentence_parsed_words, self._xml_sents())
 
+    @_timed_view
     def iter_paras(self):
         for para_elem in self._xml_paras():
             yield [_sentence_words(s) for s in para_elem.findall('sentence')]
 
+    @_timed_view
     def iter_raw_paras(self):
         for para_elem in self._xml_paras():
             yield " ".join(_sentence_source(s) for s in para_elem.findall('sentence'))
 
+    @_timed_view
     def iter_tagged_paras(self):
         for para_elem in self._xml_paras():
             yield [_sentence_tagged_words(s) for s in para_elem.findall('sentence')]
 
+    @_timed_view
     def iter_parsed_paras(self):
         for para_elem in self._xml_paras():
             yield [_sentence_parsed_words(s) for s in para_elem.findall('sentence')]
@@ -141,7 +165,6 @@ class Document(object):
     def raw(self):
         return "\n\n".join(self.iter_raw_paras())
 
-    @compat.utf8_for_PY2
     def __repr__(self):
         return "%s: %s" % (self.__class__.__name__, self.title())
 
@@ -149,7 +172,35 @@ class Document(object):
         self.root.clear()
 
 
-_DocumentMeta = namedtuple('_DocumentMeta', 'title bounds categories')
+class Sentence(object):
+    """
+    Single OpenCorpora sentence.
+    """
+    def __init__(self, xml, doc_id=None):
+        self.root = xml
+        self.doc_id = doc_id
+
+    @property
+    def id(self):
+        return text_type(self.root.get('id'))
+
+    def words(self):
+        return _sentence_words(self.root)
+
+    def tagged_words(self):
+        return _sentence_tagged_words(self.root)
+
+    def parsed_words(self):
+        return _sentence_parsed_words(self.root)
+
+    def raw(self):
+        return _sentence_source(self.root)
+
+    def __repr__(self):
+        return "%s %s: %s" % (self.__class__.__name__, self.id, self.raw())
+
+
+_DocumentMeta = indexing.DocumentMeta
 
 
 def _from_documents(doc_method_name):
@@ -165,21 +216,79 @@ class CorpusReader(object):
     documents without loading and parsing the whole XML.
     It is capable of iterating over individual paragraphs,
     sentences and tokens without loading all data to memory.
+
+    Pass ``stats=True`` (or a shared ``ReaderStats`` instance) to record
+    counters and per-stage timings in ``self.stats``;
+    see :mod:`opencorpora.instrumentation`.
     """
 
-    def __init__(self, filename, cache_filename=None, use_cache=True):
+    def __init__(self, filename, cache_filename=None, use_cache=True,
+                 index_workers=1, tag_registry=None,
+                 document_cache_size=None, document_cache_bytes=None,
+                 stats=None):
         self.filename = filename
         self.use_cache = use_cache
+        self.index_workers = index_workers
+        self.tag_registry = tag_registry
+        self.document_cache = None
+        if document_cache_size or document_cache_bytes:
+            self.document_cache = LRUCache(document_cache_size, document_cache_bytes)
+        self.stats = make_stats(stats)
         self._document_meta = None
+        self._category_index = None
+        self._sentence_index = None
+        self._statistics = None
+        self._concordance_index = None
+        self._doc_ids = None
+        self._source = None
         self._cache_filename = cache_filename or filename + '.~'
 
+    def close(self):
+        """
+        Release the memory-mapped corpus file and index.
+        They are reopened if the reader is used again.
+        """
+        if self._source is not None:
+            self._source.close()
+            self._source = None
+        if self.document_cache is not None:
+            self.document_cache.clear()
+        if self._sentence_index is not None:
+            self._sentence_index.close()
+            self._sentence_index = None
+        if self._statistics is not None:
+            self._statistics.close()
+            self._statistics = None
+        if self._concordance_index is not None:
+            self._concordance_index.close()
+            self._concordance_index = None
+        if isinstance(self._document_meta, indexing.DocumentIndex):
+            self._document_meta.close()
+            self._document_meta = None
+            self._category_index = None
+            self._doc_ids = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
     def iter_documents(self, fileids=None, categories=None, _destroy=False):
-        """ Return an iterator over corpus documents. """
-        doc_ids = self._filter_ids(fileids, categories)
-        for doc in imap(self.get_document, doc_ids):
-            yield doc
-            if _destroy:
-                doc.destroy()
+        """
+        Return an iterator over corpus documents. Documents are
+        read in small groups, as in :meth:`get_documents`.
+        """
+        doc_ids = iter(self._filter_ids(fileids, categories))
+        while True:
+            group = list(itertools.islice(doc_ids, BULK_BATCH_SIZE))
+            if not group:
+                return
+            for doc in self._bulk_documents(group):
+                yield doc
+                # cached documents may be in use by other callers
+                if _destroy and self.document_cache is None:
+                    doc.destroy()
 
     def iter_documents_raw(self, fileids=None, categories=None):
         for doc in self.iter_documents(fileids, categories, _destroy=True):
@@ -216,11 +325,49 @@ class CorpusReader(object):
         return "\n\n\n".join(self.iter_documents_raw(fileids, categories))
 
     def _doc_iterator(self, fileids, categories, doc_method):
+        if doc_method in streaming.VIEWS:
+            # fast path: extract data without building ElementTrees
+            for doc_id in self._filter_ids(fileids, categories):
+                for res in self._document_view(doc_id, doc_method):
+                    yield res
+            return
+
         for doc in self.iter_documents(fileids, categories, _destroy=True):
             meth = getattr(doc, doc_method)
             for res in meth():
                 yield res
 
+    def _document_view(self, doc_id, doc_method):
+        """ Return results of ``Document.<doc_method>()`` for a single document. """
+        if doc_method not in streaming.VIEWS:
+            doc = self.get_document(doc_id)
+            try:
+                return list(getattr(doc, doc_method)())
+            finally:
+                if self.document_cache is None:
+                    doc.destroy()
+
+        chunk = self._document_chunk(doc_id)
+        try:
+            if self.stats is None:
+                results = streaming.document_view(chunk, doc_method)
+            else:
+                start = clock()
+                results = streaming.document_view(chunk, doc_method)
+                self.stats.record(VIEW, clock() - start, documents_streamed=1)
+        finally:
+            chunk.release()
+        return self._convert_tags(results, doc_method)
+
+    def _convert_tags(self, results, doc_method):
+        """
+        Replace tag strings with interned Tag objects
+        if ``tag_registry`` is set.
+        """
+        if self.tag_registry is None:
+            return results
+        return streaming.map_tags(results, doc_method, self.tag_registry.tag)
+
     def fileids(self, categories=None):
         return list(self._filter_ids(None, categories))
 
@@ -235,9 +382,9 @@ class CorpusReader(object):
         ))
 
         if patterns:
-            patterns = make_iterable(patterns)
+            regexes = [compile_pattern(p) for p in make_iterable(patterns)]
             result = [cat for cat in result
-                      if some_items_match([cat], patterns)]
+                      if any(regex.match(cat) for regex in regexes)]
 
         return result
 
@@ -254,105 +401,502 @@ class CorpusReader(object):
         """
         Return Document object for a given doc_id.
         This is also available as corpus[doc_id] and corpus.documents(doc_id).
+
+        If the reader is created with ``document_cache_size`` (max number of
+        documents) or ``document_cache_bytes`` (max total XML size of
+        documents) then parsed documents are kept in a LRU cache
+        (``corpus.document_cache``); cached documents are shared,
+        don't modify or destroy them.
+        """
+        if self.document_cache is None:
+            return Document(self._document_xml(doc_id), self.stats)
+
+        doc_id = str(doc_id)
+        doc = self.document_cache.get(doc_id)
+        if self.stats is not None:
+            if doc is None:
+                self.stats.record(None, document_cache_misses=1)
+            else:
+                self.stats.record(None, document_cache_hits=1)
+        if doc is None:
+            doc = Document(self._document_xml(doc_id), self.stats)
+            bounds = self._get_meta()[doc_id].bounds
+            self.document_cache.put(doc_id, doc, bounds.byte_end - bounds.byte_start)
+        return doc
+
+    def get_documents(self, doc_ids, max_gap=BULK_MAX_GAP, max_span=BULK_MAX_SPAN):
+        """
+        Return a list of Document objects for ``doc_ids`` (in the same order).
+
+        Documents are read in file order: documents less than ``max_gap``
+        bytes apart are read with a single sequential read of up to
+        ``max_span`` bytes. This is much faster than :meth:`get_document`
+        calls for many documents, e.g. for category-filtered exports
+        from network storage. The document cache is used
+        as in :meth:`get_document`.
         """
-        return Document(self._document_xml(doc_id))
+        return list(self._bulk_documents(doc_ids, max_gap, max_span))
+
+    def _bulk_documents(self, doc_ids, max_gap=BULK_MAX_GAP, max_span=BULK_MAX_SPAN):
+        """
+        Yield Documents for ``doc_ids``. XML of all documents is read
+        beforehand; documents are parsed one by one when they are requested,
+        so that only consumed ElementTrees are kept in memory.
+        """
+        doc_ids = [str(doc_id) for doc_id in doc_ids]
+        cache = self.document_cache
+        cached = {}
+        if cache is not None:
+            for doc_id in doc_ids:
+                if doc_id not in cached:
+                    cached[doc_id] = cache.get(doc_id)
+            if self.stats is not None:
+                hits = sum(1 for doc_id in doc_ids if cached[doc_id] is not None)
+                self.stats.record(None, document_cache_hits=hits,
+                                  document_cache_misses=len(doc_ids) - hits)
+
+        chunks = self._read_documents(
+            [doc_id for doc_id in OrderedDict.fromkeys(doc_ids) if cached.get(doc_id) is None],
+            max_gap, max_span)
+        try:
+            for doc_id in doc_ids:
+                doc = cached.get(doc_id)
+                if doc is None:
+                    chunk = chunks[doc_id]
+                    doc = Document(self._parse(chunk), self.stats)
+                    if cache is not None:
+                        # repeated ids share a document, like cached documents do
+                        cached[doc_id] = doc
+                        cache.put(doc_id, doc, len(chunk))
+                yield doc
+        finally:
+            for chunk in chunks.values():
+                chunk.release()
+
+    def _read_documents(self, doc_ids, max_gap, max_span):
+        """
+        Return a dict of document XML memoryviews; documents are
+        read with coalesced reads (see :meth:`get_documents`).
+        """
+        meta = self._get_meta()
+        bounds = [meta[doc_id].bounds for doc_id in doc_ids]
+        source = self._get_source()
+        read = getattr(source, 'read', source.chunk)
+        chunks = {}
+        for start, end, indices in xml_utils.coalesce_bounds(bounds, max_gap, max_span):
+            if self.stats is not None:
+                started = clock()
+            span = read(xml_utils.Bounds(None, None, start, end))
+            if self.stats is not None:
+                self.stats.record(READ, clock() - started, bytes_read=len(span), chunks_read=1)
+            for index in indices:
+                doc_bounds = bounds[index]
+                chunks[doc_ids[index]] = span[doc_bounds.byte_start - start:
+                                              doc_bounds.byte_end - start]
+        return chunks
+
+    def get_sentence(self, sent_id):
+        """
+        Return Sentence object for a given OpenCorpora sentence id.
+        Only the sentence XML is loaded and parsed.
+
+        A sentence index is built on first access to sentences or tokens
+        and saved to "<cache name>.sents" file.
+        """
+        doc_pos, start, end = self._get_sentence_index().sentence(sent_id)
+        chunk = self._get_source().chunk(xml_utils.Bounds(None, None, start, end))
+        try:
+            xml = compat.ElementTree.XML(chunk)
+        finally:
+            chunk.release()
+        return Sentence(xml, self._doc_id_at(doc_pos))
+
+    def get_token(self, token_id):
+        """
+        Return (word, [(lemma, tag), ...]) tuple for a given
+        OpenCorpora token id.
+        """
+        sent_id, position = self._get_sentence_index().token(token_id)
+        return self.get_sentence(sent_id).parsed_words()[position]
+
+    def token_location(self, token_id):
+        """
+        Return (doc_id, sentence_id, position in sentence) for a given
+        OpenCorpora token id.
+        """
+        index = self._get_sentence_index()
+        sent_id, position = index.token(token_id)
+        doc_pos = index.sentence(sent_id)[0]
+        return self._doc_id_at(doc_pos), str(sent_id), position
+
+    def statistics(self):
+        """
+        Return precomputed CorpusStatistics: paragraph, sentence and token
+        counts of documents and frequencies of forms, lemmas, tags and
+        grammemes (see :mod:`opencorpora.statistics`).
+
+        Statistics are computed on first access (a single pass over
+        documents) and saved to "<cache name>.stats" file. Frequencies
+        are corpus-wide, so after the corpus file changes statistics are
+        recomputed from all documents; only the document and sentence
+        indexes reuse data of unchanged documents.
+        """
+        if self._statistics is not None:
+            return self._statistics
+
+        filename = self._cache_filename + '.stats'
+        if self.use_cache:
+            self._statistics, previous = self._load_index(
+                statistics.CorpusStatistics.load, filename)
+            # a stale file has nothing per-document to reuse
+            if previous is not None:
+                previous.close()
+        if self._statistics is None:
+            start = clock()
+            arrays = self._compute_statistics().arrays()
+            if self.use_cache:
+                try:
+                    statistics.write(filename, arrays, self._file_info())
+                except (IOError, OSError):
+                    pass
+            self._statistics = statistics.CorpusStatistics(arrays)
+            if self.stats is not None:
+                self.stats.record(STATISTICS, clock() - start, statistics_builds=1)
+        elif self.stats is not None:
+            self.stats.record(None, statistics_loads=1)
+        return self._statistics
+
+    def counts(self, fileids=None, categories=None):
+        """
+        Return Counts(paragraphs, sentences, tokens) for documents
+        (all documents by default) using precomputed statistics.
+        """
+        stats = self.statistics()
+        if fileids is None and categories is None:
+            return stats.totals()
+        return stats.totals(self._filter_ids(fileids, categories))
+
+    def _compute_statistics(self):
+        """ Return a StatisticsBuilder for all documents. """
+        builder = statistics.StatisticsBuilder()
+        for doc_id in self._filter_ids():
+            chunk = self._document_chunk(doc_id)
+            try:
+                builder.add_document(doc_id, chunk)
+            finally:
+                chunk.release()
+        return builder
+
+    def iter_concordance(self, lemma=None, form=None, grammemes=None,
+                         fileids=None, categories=None, width=5):
+        """
+        Yield keyword-in-context lines for tokens with a given ``lemma``
+        and/or word ``form`` and/or ``grammemes`` ("NOUN,plur" or a list):
+        ``Line(doc_id, sent_id, position, left, word, right)`` tuples
+        where ``left`` and ``right`` are up to ``width`` words of the
+        sentence. Lemma and grammemes should belong to the same parse.
+
+        A concordance index is built on first access and saved to
+        "<cache name>.conc" file; queries only read matching sentences
+        (see :mod:`opencorpora.concordance`). Postings are corpus-wide
+        token positions, so after the corpus file changes the index is
+        rebuilt from all documents.
+        """
+        terms = concordance.query_terms(lemma, form, grammemes)
+        conc_index = self._get_concordance_index()
+        sentence_index = self._get_sentence_index()
+        positions = concordance.intersect(
+            [conc_index.postings(field, term) for field, term in terms])
+        if fileids is not None or categories is not None:
+            ranges = []
+            for doc_id in self._filter_ids(fileids, categories):
+                doc_pos = sentence_index.document_position(doc_id)
+                ranges.append(sentence_index.sentence_token_range(
+                    *sentence_index.document_sentence_range(doc_pos)))
+            positions = concordance.filter_ranges(positions, sorted(ranges))
+        query = {'lemma': lemma, 'form': form, 'grammemes': grammemes}
+        return concordance.kwic_lines(positions, sentence_index, self._get_source(),
+                                      self._doc_id_at, query, width)
+
+    def concordance(self, lemma=None, form=None, grammemes=None,
+                    fileids=None, categories=None, width=5, limit=None):
+        """ Return a list of up to ``limit`` lines (see :meth:`iter_concordance`). """
+        lines = self.iter_concordance(lemma, form, grammemes, fileids, categories, width)
+        return list(itertools.islice(lines, limit))
+
+    def export_columnar(self, path, fileids=None, categories=None):
+        """
+        Export documents to a columnar token store file
+        (see :mod:`opencorpora.columnar`).
+        """
+        from opencorpora import columnar
+        columnar.export(self, path, fileids, categories)
+
+    @staticmethod
+    def load_columnar(path):
+        """
+        Memory-map a columnar token store created by
+        :meth:`export_columnar`; return ColumnarCorpus.
+        """
+        from opencorpora import columnar
+        return columnar.load(path)
 
     def readme(self):
         return self.__doc__
 
     def get_annotation_info(self):
-        for el in xml_utils.iterparse(self.filename, 'annotation', clear=True,
-                                      events=('start',)):
-            return {
-                'version': el.get('version'),
-                'revision': el.get('revision'),
-            }
+        with compressed.open_stream(self.filename) as f:
+            for el in xml_utils.iterparse(f, 'annotation', clear=True,
+                                          events=('start',)):
+                return {
+                    'version': el.get('version'),
+                    'revision': el.get('revision'),
+                }
 
     def _filter_ids(self, fileids=None, categories=None):
         meta = self._get_meta()
-        fileids = make_iterable(fileids, meta.keys())
 
         if categories is None:
-            return imap(str, fileids)
-
-        category_patterns = make_iterable(categories)
-        return (doc_id for doc_id in fileids
-                if some_items_match(
-                    meta[doc_id].categories, category_patterns))
+            return imap(str, make_iterable(fileids, meta.keys()))
+
+        if fileids is not None:
+            fileids = [str(doc_id) for doc_id in make_iterable(fileids)]
+        return iter(self._get_category_index().select(categories, fileids))
+
+    def _doc_id_at(self, pos):
+        """ Return id of a document at position ``pos`` in file. """
+        if self._doc_ids is None:
+            self._doc_ids = list(self._get_meta().keys())
+        return self._doc_ids[pos]
+
+    def _get_sentence_index(self):
+        if self._sentence_index is not None:
+            return self._sentence_index
+
+        filename = self._cache_filename + '.sents'
+        previous = None
+        if self.use_cache:
+            self._sentence_index, previous = self._load_index(
+                indexing.SentenceIndex.load, filename)
+        if self._sentence_index is None:
+            meta, start = self._get_meta(), clock()
+            try:
+                arrays = indexing.build_sentence_index(meta, self._get_source(), previous)
+            finally:
+                if previous is not None:
+                    previous.close()
+            self._sentence_index = indexing.SentenceIndex(arrays)
+            if self.use_cache:
+                try:
+                    indexing.write_sentence_index(filename, arrays, self._file_info())
+                except (IOError, OSError):
+                    pass
+            if self.stats is not None:
+                self.stats.record(SENTENCE_INDEX, clock() - start, sentence_index_builds=1)
+        elif self.stats is not None:
+            self.stats.record(None, sentence_index_loads=1)
+        return self._sentence_index
+
+    def _get_concordance_index(self):
+        if self._concordance_index is not None:
+            return self._concordance_index
+
+        filename = self._cache_filename + '.conc'
+        if self.use_cache:
+            self._concordance_index, previous = self._load_index(
+                concordance.ConcordanceIndex.load, filename)
+            # postings of a stale file point to old token positions
+            if previous is not None:
+                previous.close()
+        if self._concordance_index is None:
+            meta, sentence_index, start = self._get_meta(), self._get_sentence_index(), clock()
+            arrays = concordance.build(meta, self._get_source(), sentence_index)
+            if self.use_cache:
+                try:
+                    concordance.write(filename, arrays, self._file_info())
+                except (IOError, OSError):
+                    pass
+            self._concordance_index = concordance.ConcordanceIndex(arrays)
+            if self.stats is not None:
+                self.stats.record(CONCORDANCE, clock() - start, concordance_builds=1)
+        elif self.stats is not None:
+            self.stats.record(None, concordance_loads=1)
+        return self._concordance_index
+
+    def _get_category_index(self):
+        """ Return category -> documents inverted index. """
+        if self._category_index is None:
+            meta = self._get_meta()
+            if isinstance(meta, indexing.DocumentIndex):
+                self._category_index = meta.category_index()
+            else:
+                self._category_index = CategoryIndex.from_meta(meta)
+        return self._category_index
 
     def _get_meta(self):
-
+        previous = None
         if self._document_meta is None and self.use_cache:
-            self._load_meta_cache()
+            previous = self._load_meta_cache()
+            if self.stats is not None and self._document_meta is not None:
+                self.stats.record(None, index_loads=1)
 
         if self._document_meta is None:
-            self._document_meta = self._compute_document_meta()
+            start = clock()
+            try:
+                self._document_meta = self._compute_document_meta(previous)
+            finally:
+                # the stale index file is going to be replaced
+                if previous is not None:
+                    previous.close()
             if self.use_cache:
                 self._create_meta_cache()
+            if self.stats is not None:
+                self.stats.record(INDEX, clock() - start, index_builds=1)
 
         return self._document_meta
 
     def _create_meta_cache(self):
-        """ Try to dump metadata to a file. """
+        """ Try to dump metadata to a binary index file. """
         try:
-            with open(self._cache_filename, 'wb') as f:
-                compat.pickle.dump(self._document_meta, f, 1)
-        except (IOError, compat.pickle.PickleError):
+            indexing.write_document_index(self._cache_filename,
+                                          self._document_meta,
+                                          self._file_info())
+        except (IOError, OSError):
             pass
 
     def _load_meta_cache(self):
-        """ Try to load metadata from file. """
+        """
+        Try to load metadata from a binary index file. A stale index
+        is returned: it is used for an incremental update.
+        """
+        self._document_meta, previous = self._load_index(
+            indexing.DocumentIndex, self._cache_filename)
+        return previous
+
+    def _load_index(self, load, filename):
+        """
+        Try to load an index file using ``load`` function; return
+        an ``(index, stale_index)`` pair where one or both items are None.
+        A stale index (built for a previous version of the corpus file)
+        can be used to avoid re-parsing unchanged documents.
+        """
         try:
-            if self._should_invalidate_cache():
-                os.remove(self._cache_filename)
-            else:
-                with open(self._cache_filename, 'rb') as f:
-                    self._document_meta = compat.pickle.load(f)
-        except (OSError, IOError, compat.pickle.PickleError,
-                ImportError, AttributeError):
-            pass
+            index = load(filename)
+        except (OSError, IOError, binfile.FormatError):
+            return None, None
 
-    def _should_invalidate_cache(self):
-        data_mtime = os.path.getmtime(self.filename)
-        cache_mtime = os.path.getmtime(self._cache_filename)
-        return data_mtime > cache_mtime
+        if self._should_invalidate_cache(index, filename):
+            return None, index
+        return index, None
+
+    def _file_info(self):
+        """
+        Return information about the corpus file which is stored
+        in the index and used to reject stale or foreign indexes.
+        """
+        info = self.get_annotation_info() or {}
+        return {
+            'size': os.path.getsize(self.filename),
+            'revision': info.get('revision'),
+        }
 
-    def _compute_document_meta(self):
+    def _should_invalidate_cache(self, index, filename):
+        data_mtime = os.path.getmtime(self.filename)
+        cache_mtime = os.path.getmtime(filename)
+        if data_mtime > cache_mtime:
+            return True
+        # check the size first: it doesn't require reading the file
+        if index.file_info.get('size') != os.path.getsize(self.filename):
+            return True
+        return index.file_info != self._file_info()
+
+    def _compute_document_meta(self, previous=None):
         """
         Return documents meta information that can
         be used for fast document lookups. Meta information
-        consists of documents titles, categories and positions
-        in file.
+        consists of documents titles, categories, parent ids,
+        positions in file and digests of document XML. The file is
+        read only once; pass ``index_workers`` > 1 to the constructor
+        to scan it in several processes (``None`` means "use all CPUs").
+        Compressed files are always scanned in a single pass
+        over decompressed data.
+
+        ``previous`` is a stale DocumentIndex; metadata of documents
+        which haven't changed is copied from it.
         """
         meta = OrderedDict()
-
-        bounds_iter = xml_utils.bounds(self.filename,
-                            start_re=r'\s*<text id="(\d+)"[^>]*name="([^"]*)"',
-                            end_re=r'\s*</text>')
-
-        for match, bounds in bounds_iter:
-            doc_id, title = str(match.group(1)), match.group(2)
-            title = xml_utils.unescape_attribute(title)
-
-            # cache categories
-            xml_data = xml_utils.load_chunk(self.filename, bounds)
-            doc = Document(compat.ElementTree.XML(xml_data.encode('utf8')))
-
-            meta[doc_id] = _DocumentMeta(title, bounds, doc.categories())
+        if compressed.compression(self.filename):
+            docs = self._scan_compressed(previous)
+        else:
+            docs = indexing.scan_documents(self.filename, self.index_workers,
+                                           previous=previous)
+        for doc_id, title, parent, categories, bounds, digest in docs:
+            meta[doc_id] = _DocumentMeta(title, bounds, categories, parent, digest)
         return meta
 
+    def _scan_compressed(self, previous):
+        source = self._get_source()
+        if isinstance(source, compressed.Bz2BlockFile):
+            # block offsets are computed during the same pass
+            stream = source.stream()
+        else:
+            stream = compressed.open_stream(self.filename)
+        with stream:
+            scanner = indexing.DocumentScanner(stream, previous=previous)
+            for doc in scanner.documents():
+                yield doc
+
     def _document_xml(self, doc_id):
         """ Return xml Element for the document document_id. """
-        doc_str = self._get_doc_by_raw_offset(str(doc_id))
-        return compat.ElementTree.XML(doc_str.encode('utf8'))
+        chunk = self._document_chunk(doc_id)
+        try:
+            return self._parse(chunk)
+        finally:
+            chunk.release()
+
+    def _parse(self, chunk):
+        """ Parse document XML. """
+        if self.stats is None:
+            return compat.ElementTree.XML(chunk)
+        start = clock()
+        xml = compat.ElementTree.XML(chunk)
+        self.stats.record(PARSE, clock() - start, documents_parsed=1)
+        return xml
+
+    def _document_chunk(self, doc_id):
+        """
+        Return a zero-copy memoryview of document XML;
+        the caller should release it.
+        """
+        bounds = self._get_meta()[str(doc_id)].bounds
+        if self.stats is None:
+            return self._get_source().chunk(bounds)
+        start = clock()
+        chunk = self._get_source().chunk(bounds)
+        self.stats.record(READ, clock() - start, bytes_read=len(chunk), chunks_read=1)
+        return chunk
+
+    def _get_source(self):
+        if self._source is None:
+            self._source = compressed.open_source(self.filename,
+                                                  self._block_index_filename())
+        return self._source
+
+    def _block_index_filename(self):
+        """ Return a file name for bzip2 block index, or None. """
+        if self.use_cache:
+            return self._cache_filename + '.blocks'
 
     def _get_doc_by_raw_offset(self, doc_id):
         """
         Load document from xml using bytes offset information.
         XXX: this is not tested under Windows.
         """
-        bounds = self._get_meta()[str(doc_id)].bounds
-        return xml_utils.load_chunk(self.filename, bounds)
+        chunk = self._document_chunk(doc_id)
+        try:
+            return chunk.tobytes().decode('utf8')
+        finally:
+            chunk.release()
 
     def _get_doc_by_line_offset(self, doc_id):
         """
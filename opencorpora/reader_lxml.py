@@ -5,10 +5,17 @@ the whole XML corpus in memory and provides a nice API
 using lxml Element wrappers.
 """
 from __future__ import absolute_import
+import re
+import array
+import bisect
+from sys import intern
+from collections.abc import Sequence
 from lxml import etree
 
+from opencorpora.categories import CategoryIndex, as_query
 
-def load(source):
+
+def load(source, lean=False, fileids=None, categories=None):
     """
     Load OpenCorpora corpus.
 
@@ -17,18 +24,110 @@ def load(source):
     - a file name/path
     - a file object
     - a file-like object
-    - a URL using the HTTP or FTP protocol
-
+    - a URL using the HTTP or FTP protocol (only when all documents
+      are loaded and ``lean`` is False)
+
+    Pass ``lean=True`` to use less memory: blank text and ``tfr/@t``
+    attributes (the API doesn't read them) are discarded, and grammemes
+    are stored in a single ``l/@g`` attribute instead of ``<g>`` elements;
+    grammeme and lemma strings are interned. Pass ``fileids`` (a list of document ids) and/or
+    ``categories`` (like in CorpusReader methods) to load only some
+    documents; other documents are dropped right after parsing,
+    so they don't use memory.
+    """
+    if not lean and fileids is None and categories is None:
+        parser = get_xml_parser()
+        return etree.parse(source, parser=parser).getroot()
+
+    if fileids is not None:
+        fileids = set(str(doc_id) for doc_id in fileids)
+
+    fp = None
+    if lean:
+        if not hasattr(source, 'read'):
+            source = fp = open(source, 'rb')
+        source = _LeanSource(source)
+    try:
+        context = etree.iterparse(source, tag='text', remove_blank_text=lean,
+                                  huge_tree=lean)
+        context.set_element_class_lookup(_get_lookup())
+        for _, doc in context:
+            if not _is_selected(doc, fileids, categories):
+                doc.getparent().remove(doc)
+        return context.root
+    finally:
+        if fp is not None:
+            fp.close()
+
+
+def _is_selected(doc, fileids, categories):
+    if fileids is not None and doc.get('id') not in fileids:
+        return False
+    if categories is not None:
+        tags = sorted(set(el.text for el in doc.findall('tags/tag')))
+        index = CategoryIndex([doc.id], tags, [[0]] * len(tags))
+        return bool(as_query(categories).positions(index))
+    return True
+
+
+class _LeanSource(object):
+    """
+    File-like wrapper which rewrites OpenCorpora XML before parsing:
+    ``<g v="..."/>`` children of ``<l>`` elements are replaced with
+    a single ``g`` attribute (every element costs several hundred bytes
+    in lxml trees) and unused ``tfr/@t`` attributes are removed.
+
+    Only complete ``<l>`` elements which contain nothing but ``<g>``
+    elements are rewritten; data is passed to the parser in pieces
+    which end after ``</l>``, and markup in an unexpected format
+    is passed as-is (Parse reads ``<g>`` elements as usual then).
     """
-    parser = get_xml_parser()
-    return etree.parse(source, parser=parser).getroot()
+    # <l ..><g v="A"/><g v="B"/></l> -> <l .. g="A,B"/>
+    _parse_re = re.compile(br'(<l\s[^<>]*?)\s*>((?:\s*<g\s+v="[^"<>]*"\s*/>)*)\s*</l>')
+    _grammeme_re = re.compile(br'v="([^"]*)"')
+    # <tfr rev_id=".." t=".."> -> <tfr rev_id="..">
+    _tfr_re = re.compile(br'(<tfr(?:\s[^<>]*?)?)\s+t="[^"]*"')
+
+    def __init__(self, fp):
+        self.fp = fp
+        self.buf = b''
+
+    def read(self, size=-1):
+        while True:
+            data = self.fp.read(size)
+            if not data:
+                data, self.buf = self.buf, b''
+                break
+            data = self.buf + data
+            end = data.rfind(b'</l>')
+            end = data.rfind(b'>') if end == -1 else end + 3
+            if end != -1:
+                data, self.buf = data[:end + 1], data[end + 1:]
+                break
+            self.buf = data
+        data = self._parse_re.sub(self._pack, data)
+        return self._tfr_re.sub(br'\1', data)
+
+    def _pack(self, match):
+        grammemes = self._grammeme_re.findall(match.group(2))
+        return match.group(1) + b' g="' + b','.join(grammemes) + b'"/>'
+
+
+def get_xml_parser(lean=False):
+    """
+    Return a parser which creates element wrappers;
+    ``lean`` parser discards blank text and has no tree size limits.
+    """
+    if lean:
+        parser = etree.XMLParser(remove_blank_text=True, huge_tree=True)
+    else:
+        parser = etree.XMLParser()
+    parser.set_element_class_lookup(_get_lookup())
+    return parser
 
 
-def get_xml_parser():
+def _get_lookup():
     lookup = etree.ElementNamespaceClassLookup()
-    parser = etree.XMLParser()
-    parser.set_element_class_lookup(lookup)
-
     namespace = lookup.get_namespace('')
     namespace['text'] = Doc
     namespace['annotation'] = Corpus
@@ -37,7 +136,7 @@ def get_xml_parser():
     namespace['token'] = Token
     namespace['l'] = Parse
 
-    return parser
+    return lookup
 
 
 class Query(object):
@@ -48,32 +147,68 @@ class Query(object):
         return self.query_func(obj)
 
 
-class Xpath(object):
-    def __init__(self, xpath):
-        self.xpath = xpath
-
+class CachedQuery(Query):
+    """
+    Query which result is computed once and stored on the element proxy.
+    lxml returns the same proxy for an element while the proxy is alive;
+    a recreated proxy starts with an empty cache. Cached ``Corpus.docs``
+    keeps document proxies alive, so document results live as long as
+    the corpus or document object is referenced.
+
+    Corpus and Doc cache element lists; Paragraph and Sentence cache only
+    ``num_tokens``: cached lists of tokens would keep their proxies in memory.
+    Call :func:`invalidate_cache` after modifying the tree.
+    Results are shared, don't modify them.
+    """
     def __get__(self, obj, objtype):
-        return obj.xpath(self.xpath)
+        if obj is None:
+            return self
+        cache = obj.__dict__.setdefault('_query_cache', {})
+        try:
+            return cache[self]
+        except KeyError:
+            value = cache[self] = self.query_func(obj)
+            return value
+
+
+def invalidate_cache(element):
+    """
+    Drop cached query results for the tree ``element`` belongs to.
+    It should be called after the tree is modified.
+    """
+    root = element.getroottree().getroot()
+    for el in root.iter('annotation', 'text', 'paragraph', 'sentence'):
+        el.__dict__.pop('_query_cache', None)
+
+
+def Xpath(xpath):
+    return Query(lambda obj: obj.xpath(xpath))
 
 
 def Attrib(name):
     return Query(lambda obj: obj.get(name))
 
 
-def Children(query):
-    return Query(lambda obj: obj.findall(query))
+def InternedAttrib(name):
+    """ Attribute with a small set of often repeated values. """
+    def get_value(obj):
+        value = obj.get(name)
+        return value if value is None else intern(value)
+    return Query(get_value)
 
 
-def ChildrenText(query):
-    return Query(lambda obj: [el.text for el in obj.findall(query)])
+def Children(query, cached=False):
+    query_cls = CachedQuery if cached else Query
+    return query_cls(lambda obj: obj.findall(query))
+
+
+def ChildrenText(query, cached=False):
+    query_cls = CachedQuery if cached else Query
+    return query_cls(lambda obj: [el.text for el in obj.findall(query)])
 
 
 def NumTokens():
-    def get_num_tokens(obj):
-        if getattr(obj, '_num_tokens_cached', None) is None:
-            obj._num_tokens_cached = int(obj.xpath('count(.//token)'))
-        return obj._num_tokens_cached
-    return Query(get_num_tokens)
+    return CachedQuery(lambda obj: int(obj.xpath('count(.//token)')))
 
 
 class TokensIter(object):
@@ -84,31 +219,223 @@ class TokensIter(object):
         return iter(self.tokens)
 
 
-class Corpus(etree.ElementBase):
+class ElementSequence(Sequence):
+    """
+    Read-only sequence of elements which are looked up by position
+    when accessed; ``len()``, indexing and slicing don't create
+    proxies for other elements. It compares equal to a list
+    of the same elements.
+    """
+    def __init__(self, length, get_item, iterate):
+        self._length = length
+        self._get_item = get_item
+        self._iterate = iterate
+
+    def __len__(self):
+        return self._length
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self._get_item(i) for i in range(*index.indices(self._length))]
+        if index < 0:
+            index += self._length
+        if not 0 <= index < self._length:
+            raise IndexError("element index out of range")
+        return self._get_item(index)
+
+    def __iter__(self):
+        return self._iterate()
+
+    def __eq__(self, other):
+        if not isinstance(other, (Sequence, list)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __ne__(self, other):
+        result = self.__eq__(other)
+        return result if result is NotImplemented else not result
+
+    __hash__ = None
+
+    def __repr__(self):
+        return repr(list(self))
+
+
+# Paragraph and Sentence indexing and iteration is over tokens
+_child = etree.ElementBase.__getitem__
+_children = etree.ElementBase.iterchildren
+
+# plain strings: "smart" xpath strings keep a reference to their element
+_token_ids_xpath = etree.XPath("token/@id", smart_strings=False)
+
+
+class _Layout(object):
+    """
+    Positions of paragraphs, sentences and tokens in a list of documents.
+    An element is stored as a path of child indices, so it can be found
+    without visiting preceding elements; tokens are found by bisecting
+    an array of per-sentence token offsets. ``<tokens>`` elements
+    are expected to contain only ``<token>`` children.
+    """
+    def __init__(self, docs):
+        self.para_docs = array.array('I')
+        self.para_children = array.array('I')
+        self.sent_paras = array.array('I')
+        self.sent_children = array.array('I')
+        self.sent_ids = array.array('Q')
+        self.token_offsets = array.array('Q', [0])
+        self._sentence_ids = None
+        self._token_ids = None
+        self._doc_positions = None
+
+        for doc_pos, doc in enumerate(docs):
+            paragraphs = doc.find('paragraphs')
+            if paragraphs is None:
+                continue
+            for para_child, para in enumerate(paragraphs):
+                if para.tag != 'paragraph':
+                    continue
+                para_pos = len(self.para_docs)
+                self.para_docs.append(doc_pos)
+                self.para_children.append(para_child)
+                for sent_child, sent in enumerate(_children(para)):
+                    if sent.tag != 'sentence':
+                        continue
+                    self.sent_paras.append(para_pos)
+                    self.sent_children.append(sent_child)
+                    self.sent_ids.append(int(sent.get('id')))
+                    tokens = sent.find('tokens')
+                    num_tokens = len(tokens) if tokens is not None else 0
+                    self.token_offsets.append(self.token_offsets[-1] + num_tokens)
+
+    def paragraph(self, docs, pos):
+        doc = docs[self.para_docs[pos]]
+        return doc.find('paragraphs')[self.para_children[pos]]
+
+    def sentence(self, docs, pos):
+        para = self.paragraph(docs, self.sent_paras[pos])
+        return _child(para, self.sent_children[pos])
+
+    def token(self, docs, pos):
+        sent_pos = bisect.bisect_right(self.token_offsets, pos) - 1
+        sent = self.sentence(docs, sent_pos)
+        return sent.find('tokens')[pos - self.token_offsets[sent_pos]]
+
+    def doc_position(self, docs, doc_id):
+        if self._doc_positions is None:
+            self._doc_positions = dict((doc.id, pos) for pos, doc in enumerate(docs))
+        return self._doc_positions[str(doc_id)]
+
+    def sentence_position(self, sent_id):
+        if self._sentence_ids is None:
+            self._sentence_ids = _IdIndex(self.sent_ids)
+        return self._sentence_ids.position(sent_id)
+
+    def token_position(self, docs, token_id):
+        if self._token_ids is None:
+            ids = array.array('Q')
+            for doc in docs:
+                for tokens in doc.iterfind('paragraphs/paragraph/sentence/tokens'):
+                    ids.extend(int(token_id) for token_id in _token_ids_xpath(tokens))
+            self._token_ids = _IdIndex(ids)
+        return self._token_ids.position(token_id)
+
+
+class _IdIndex(object):
+    """ OpenCorpora id -> position mapping stored in sorted arrays. """
+    def __init__(self, ids):
+        order = sorted(range(len(ids)), key=ids.__getitem__)
+        self.sorted_ids = array.array('Q', [ids[pos] for pos in order])
+        self.sorted_positions = array.array('Q', order)
+
+    def position(self, item_id):
+        try:
+            key = int(item_id)
+        except ValueError:
+            raise KeyError(item_id)
+        index = bisect.bisect_left(self.sorted_ids, key)
+        if index == len(self.sorted_ids) or self.sorted_ids[index] != key:
+            raise KeyError(item_id)
+        return self.sorted_positions[index]
+
+
+def Positions(kind, query):
+    """
+    Lazy :class:`ElementSequence` of paragraphs, sentences or tokens
+    of a Corpus or Doc; ``query`` is used for iteration.
+    """
+    def get_view(obj):
+        layout = obj._layout
+        if kind == 'paragraph':
+            length = len(layout.para_docs)
+        elif kind == 'sentence':
+            length = len(layout.sent_paras)
+        else:
+            length = layout.token_offsets[-1]
+        get_item = getattr(layout, kind)
+        return ElementSequence(
+            length,
+            lambda pos: get_item(obj._layout_docs(), pos),
+            lambda: obj.iterfind(query)
+        )
+    return Query(get_view)
+
+
+class _PositionsMixin(object):
+    """
+    Position arrays and id lookup for elements which contain documents.
+    """
+    _layout = CachedQuery(lambda obj: _Layout(obj._layout_docs()))
+
+    def get_sentence(self, sent_id):
+        """ Return a Sentence for a given OpenCorpora sentence id. """
+        return self.sentences[self._layout.sentence_position(sent_id)]
+
+    def get_token(self, token_id):
+        """
+        Return a Token for a given OpenCorpora token id. A token id
+        index is built on first call.
+        """
+        docs = self._layout_docs()
+        return self.tokens[self._layout.token_position(docs, token_id)]
+
+
+class Corpus(_PositionsMixin, etree.ElementBase):
     version = Attrib('version')
     revision = Attrib('revision')
-    docs = Children('text')
-    paragraphs = Children('text/paragraphs/paragraph')
-    sentences = Children('text/paragraphs/paragraph/sentence')
-    tokens = Children('text/paragraphs/paragraph/sentence/tokens/token')
+    docs = Children('text', cached=True)
+    paragraphs = Positions('paragraph', 'text/paragraphs/paragraph')
+    sentences = Positions('sentence', 'text/paragraphs/paragraph/sentence')
+    tokens = Positions('token', 'text/paragraphs/paragraph/sentence/tokens/token')
     num_tokens = NumTokens()
 
+    def _layout_docs(self):
+        return self.docs
+
+    def get_document(self, doc_id):
+        """ Return a Doc for a given OpenCorpora document id. """
+        docs = self.docs
+        return docs[self._layout.doc_position(docs, doc_id)]
+
     def __repr__(self):
         return "<Corpus revision=%s docs:%s tokens:%s>" % (
             self.revision, len(self.docs), self.num_tokens
         )
 
 
-class Doc(TokensIter, etree.ElementBase):
+class Doc(TokensIter, _PositionsMixin, etree.ElementBase):
     id = Attrib('id')
     name = Attrib('name')
     parent = Attrib('parent')
-    tags = ChildrenText('tags/tag')
-    paragraphs = Children('paragraphs/paragraph')
-    sentences = Children('paragraphs/paragraph/sentence')
-    tokens = Children('paragraphs/paragraph/sentence/tokens/token')
+    tags = ChildrenText('tags/tag', cached=True)
+    paragraphs = Positions('paragraph', 'paragraphs/paragraph')
+    sentences = Positions('sentence', 'paragraphs/paragraph/sentence')
+    tokens = Positions('token', 'paragraphs/paragraph/sentence/tokens/token')
     num_tokens = NumTokens()
 
+    def _layout_docs(self):
+        return [self]
+
     @property
     def source(self):
         return "\n\n".join(p.source for p in self.paragraphs)
@@ -162,10 +489,21 @@ class Token(etree.ElementBase):
         return "<Token id=%s source=%r>" % (self.id, self.source)
 
 
+# plain strings: "smart" xpath strings keep a reference to their element
+_grammemes_xpath = etree.XPath("g/@v", smart_strings=False)
+
+
+def _parse_grammemes(parse):
+    packed = parse.get('g')
+    if packed is not None:  # lean mode
+        return [intern(v) for v in packed.split(',')] if packed else []
+    return [intern(v) for v in _grammemes_xpath(parse)]
+
+
 class Parse(etree.ElementBase):
     id = Attrib('id')
-    lemma = Attrib('t')
-    grammemes = Xpath("g/@v")
+    lemma = InternedAttrib('t')
+    grammemes = Query(lambda obj: _parse_grammemes(obj))
 
     def __repr__(self):
         return "<Parse id=%s lemma=%s grammemes=%s>" % (self.id, self.lemma, self.grammemes)
@@ -0,0 +1,200 @@
+# -*- coding: utf-8 -*-
+"""
+Precomputed corpus statistics: paragraph, sentence and token counts
+of every document and corpus-wide frequencies of word forms, lemmas,
+tags and grammemes.
+
+Statistics are computed in a single streaming pass over documents
+on the first ``CorpusReader.statistics()`` call and saved next to
+the document index as "<cache name>.stats"; after that queries only
+read this memory-mapped file::
+
+    >>> stats = corpus.statistics()  # doctest: +SKIP
+    >>> stats.document('44')  # doctest: +SKIP
+    Counts(paragraphs=41, sentences=168, tokens=2502)
+    >>> stats.most_common('lemmas', 2)  # doctest: +SKIP
+    [('и', 47411), ('в', 43925)]
+
+Form frequencies count tokens. An ambiguous token adds one to every
+distinct lemma, tag and grammeme of its parses, so these frequencies
+may add up to more than the number of tokens.
+
+Statistics of separate parts of a corpus can be merged
+(:meth:`StatisticsBuilder.merge`), so the pass can be split
+between worker processes.
+"""
+from __future__ import absolute_import
+import array
+import bisect
+from collections import Counter, namedtuple
+
+from opencorpora import binfile, streaming
+
+MAGIC = b'OCSTATS\0'
+VERSION = 1
+
+KINDS = ('forms', 'lemmas', 'tags', 'grammemes')
+
+Counts = namedtuple('Counts', 'paragraphs sentences tokens')
+
+
+class StatisticsBuilder(object):
+    """ Mergeable in-memory statistics of a sequence of documents. """
+
+    def __init__(self):
+        self.doc_ids = array.array('Q')
+        self.doc_counts = array.array('Q')
+        self.frequencies = dict((kind, Counter()) for kind in KINDS)
+
+    def add_document(self, doc_id, data):
+        """ Add a document given its XML ``data`` (bytes or a buffer). """
+        forms, lemmas, tags, grammemes = [self.frequencies[kind] for kind in KINDS]
+        token_lemmas, token_tags = Counter(), Counter()
+        paragraphs = sentences = tokens = 0
+        for event, sent in streaming.parse_events(data, streaming.PARSED):
+            if event == streaming.PARAGRAPH:
+                paragraphs += 1
+                continue
+            sentences += 1
+            tokens += len(sent)
+            for form, parses in sent:
+                forms[form] += 1
+                if len(parses) == 1:
+                    lemma, tag = parses[0]
+                    token_lemmas[lemma] += 1
+                    token_tags[tag] += 1
+                elif parses:
+                    lemmas.update(set(lemma for lemma, _ in parses))
+                    tags.update(set(tag for _, tag in parses))
+                    grammemes.update(set(
+                        grammeme for _, tag in parses for grammeme in tag.split(',') if grammeme
+                    ))
+        # unambiguous tokens are counted per document first: tags are split once
+        lemmas.update(token_lemmas)
+        tags.update(token_tags)
+        for tag, count in token_tags.items():
+            for grammeme in set(tag.split(',')):
+                if grammeme:
+                    grammemes[grammeme] += count
+        self.doc_ids.append(int(doc_id))
+        self.doc_counts.extend([paragraphs, sentences, tokens])
+
+    def merge(self, other):
+        """ Add statistics of documents from another builder. """
+        self.doc_ids.extend(other.doc_ids)
+        self.doc_counts.extend(other.doc_counts)
+        for kind in KINDS:
+            self.frequencies[kind].update(other.frequencies[kind])
+        return self
+
+    def arrays(self):
+        """ Return a dict of arrays for :class:`CorpusStatistics`. """
+        arrays = {'doc_ids': self.doc_ids, 'doc_counts': self.doc_counts}
+        for kind in KINDS:
+            items = sorted(self.frequencies[kind].items(), key=lambda item: (-item[1], item[0]))
+            strings = [string for string, _ in items]
+            arrays[kind] = binfile.string_table(strings)
+            arrays[kind + '.counts'] = array.array('Q', [count for _, count in items])
+            order = sorted(range(len(strings)), key=strings.__getitem__)
+            arrays[kind + '.order'] = array.array('I', order)
+        return arrays
+
+
+def write(filename, arrays, file_info):
+    sections = []
+    for name, values in sorted(arrays.items()):
+        if name in KINDS:
+            offsets, data = values
+            sections.extend([(name + '.offsets', offsets), (name + '.data', data)])
+        else:
+            sections.append((name, values))
+    binfile.write(filename, MAGIC, VERSION, file_info, sections)
+
+
+class CorpusStatistics(object):
+    """
+    Read-only statistics created either from a dict of arrays
+    (see :meth:`StatisticsBuilder.arrays`) or from a file.
+    ``kind`` arguments are one of "forms", "lemmas", "tags", "grammemes".
+    """
+
+    def __init__(self, arrays, file=None):
+        self._arrays = dict(arrays)
+        for kind in KINDS:
+            if not isinstance(self._arrays[kind], binfile.StringTable):
+                self._arrays[kind] = binfile.StringTable(*self._arrays[kind])
+        self._file = file
+        self._doc_positions = None
+        self.file_info = file.meta if file is not None else None
+
+    @classmethod
+    def load(cls, filename):
+        f = binfile.SectionFile(filename, MAGIC, VERSION)
+        arrays = {'doc_ids': f.array('doc_ids'), 'doc_counts': f.array('doc_counts')}
+        for kind in KINDS:
+            arrays[kind] = f.strings(kind)
+            arrays[kind + '.counts'] = f.array(kind + '.counts')
+            arrays[kind + '.order'] = f.array(kind + '.order')
+        return cls(arrays, f)
+
+    def __len__(self):
+        """ Number of documents. """
+        return len(self._arrays['doc_ids'])
+
+    def document(self, doc_id):
+        """ Return Counts for a document. """
+        if self._doc_positions is None:
+            self._doc_positions = dict(
+                (doc, pos) for pos, doc in enumerate(self._arrays['doc_ids']))
+        try:
+            pos = self._doc_positions[int(doc_id)]
+        except (KeyError, ValueError):
+            raise KeyError(doc_id)
+        counts = self._arrays['doc_counts']
+        return Counts(counts[pos*3], counts[pos*3 + 1], counts[pos*3 + 2])
+
+    def totals(self, doc_ids=None):
+        """ Return Counts summed over ``doc_ids`` (all documents by default). """
+        if doc_ids is None:
+            counts = self._arrays['doc_counts']
+            return Counts(*[sum(counts[i::3]) for i in range(3)])
+        totals = [0, 0, 0]
+        for doc_id in doc_ids:
+            for i, value in enumerate(self.document(doc_id)):
+                totals[i] += value
+        return Counts(*totals)
+
+    def frequency(self, kind, value):
+        """ Return a frequency of a form, lemma, tag or grammeme (0 if unknown). """
+        strings, order = self._arrays[kind], self._arrays[kind + '.order']
+        keys = _Keys(strings, order)
+        index = bisect.bisect_left(keys, value)
+        if index == len(keys) or keys[index] != value:
+            return 0
+        return self._arrays[kind + '.counts'][order[index]]
+
+    def most_common(self, kind, n=None):
+        """ Return a list of ``n`` most frequent (value, frequency) pairs. """
+        strings, counts = self._arrays[kind], self._arrays[kind + '.counts']
+        n = len(strings) if n is None else min(n, len(strings))
+        return [(strings[i], counts[i]) for i in range(n)]
+
+    def close(self):
+        self._arrays = None
+        self._doc_positions = None
+        if self._file is not None:
+            self._file.close()
+
+
+class _Keys(object):
+    """ Strings of a table in sorted order, for bisect. """
+
+    def __init__(self, strings, order):
+        self._strings = strings
+        self._order = order
+
+    def __len__(self):
+        return len(self._order)
+
+    def __getitem__(self, index):
+        return self._strings[self._order[index]]
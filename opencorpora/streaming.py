@@ -0,0 +1,259 @@
+# -*- coding: utf-8 -*-
+"""
+Event-driven (expat-based) sentence extraction. It produces the same
+results as ``Document.iter_*`` methods, but doesn't build ElementTrees:
+sentences, tokens and parses are emitted as the parser streams by.
+"""
+from __future__ import absolute_import
+import itertools
+from xml.parsers import expat
+from opencorpora import compressed
+from opencorpora.compat import text_type
+
+READ_SIZE = 1024*1024
+
+# sentence kinds
+WORDS, TAGGED, PARSED, RAW = 'words', 'tagged', 'parsed', 'raw'
+
+# Document method name -> (sentence kind, shape of the result)
+VIEWS = {
+    'iter_sents': (WORDS, 'sents'),
+    'iter_raw_sents': (RAW, 'sents'),
+    'iter_tagged_sents': (TAGGED, 'sents'),
+    'iter_parsed_sents': (PARSED, 'sents'),
+    'iter_paras': (WORDS, 'paras'),
+    'iter_raw_paras': (RAW, 'raw_paras'),
+    'iter_tagged_paras': (TAGGED, 'paras'),
+    'iter_parsed_paras': (PARSED, 'paras'),
+    'iter_words': (WORDS, 'words'),
+    'iter_tagged_words': (TAGGED, 'words'),
+    'iter_parsed_words': (PARSED, 'words'),
+}
+
+# events
+PARAGRAPH, SENTENCE = 0, 1
+
+
+class SentenceStream(object):
+    """
+    Incremental parser of OpenCorpora XML. Feed it with data;
+    it returns lists of (PARAGRAPH, None) and (SENTENCE, sentence) events.
+    Sentence format depends on ``kind``:
+
+    * WORDS - a list of words;
+    * TAGGED - a list of (word, tag) tuples (tag of the first parse);
+    * PARSED - a list of (word, [(lemma, tag), ...]) tuples;
+    * RAW - sentence source text.
+    """
+
+    def __init__(self, kind):
+        self.kind = kind
+        self._events = []
+        self._parser = expat.ParserCreate()
+        self._parser.buffer_text = True
+        if kind == RAW:
+            self._init_raw()
+        else:
+            self._init_tokens(kind)
+
+    def feed(self, data, final=False):
+        self._parser.Parse(data, final)
+        if final:
+            self._flush()
+        events = self._events[:]
+        del self._events[:]
+        return events
+
+    def close(self):
+        return self.feed(b'', True)
+
+    def _init_tokens(self, kind):
+        events = self._events
+        # current sentence, current token text and parses, grammemes list
+        # of the current parse; None means "not started" or "skipped".
+        state = [None, None, None, None]
+
+        def flush_token():
+            if state[1] is None:
+                return
+            text, parses = state[1], state[2]
+            if kind == TAGGED:
+                state[0].append((text, text_type(',').join(parses[0][1])))
+            else:
+                state[0].append((text, [
+                    (lemma, text_type(',').join(grammemes))
+                    for lemma, grammemes in parses
+                ]))
+            state[1] = None
+
+        def flush_sentence():
+            if state[0] is None:
+                return
+            if kind != WORDS:
+                flush_token()
+            events.append((SENTENCE, state[0]))
+            state[0] = None
+
+        if kind == WORDS:
+            def start(name, attrs):
+                if name == 'token':
+                    state[0].append(attrs['text'])
+                elif name == 'sentence':
+                    flush_sentence()
+                    state[0] = []
+                elif name == 'paragraph':
+                    flush_sentence()
+                    events.append((PARAGRAPH, None))
+
+        elif kind == TAGGED:
+            def start(name, attrs):
+                if name == 'g':
+                    if state[3] is not None:
+                        state[3].append(attrs['v'])
+                elif name == 'l':
+                    if state[2]:  # only the first parse is needed
+                        state[3] = None
+                    else:
+                        state[3] = []
+                        state[2].append((None, state[3]))
+                elif name == 'token':
+                    flush_token()
+                    state[1], state[2], state[3] = attrs['text'], [], None
+                elif name == 'sentence':
+                    flush_sentence()
+                    state[0] = []
+                elif name == 'paragraph':
+                    flush_sentence()
+                    events.append((PARAGRAPH, None))
+
+        else:
+            def start(name, attrs):
+                if name == 'g':
+                    if state[3] is not None:
+                        state[3].append(attrs['v'])
+                elif name == 'l':
+                    state[3] = []
+                    state[2].append((attrs['t'], state[3]))
+                elif name == 'token':
+                    flush_token()
+                    state[1], state[2], state[3] = attrs['text'], [], None
+                elif name == 'sentence':
+                    flush_sentence()
+                    state[0] = []
+                elif name == 'paragraph':
+                    flush_sentence()
+                    events.append((PARAGRAPH, None))
+
+        self._flush = flush_sentence
+        self._parser.StartElementHandler = start
+
+    def _init_raw(self):
+        events = self._events
+        source = []  # text parts of the current <source> element
+
+        def start(name, attrs):
+            if name == 'source':
+                source.append([])
+            elif name == 'paragraph':
+                events.append((PARAGRAPH, None))
+
+        def end(name):
+            if name == 'source':
+                parts = source.pop()
+                # empty <source/> is rendered as 'None', like in Document
+                text = text_type('').join(parts) if parts else text_type(None)
+                events.append((SENTENCE, text))
+
+        def data(text):
+            if source:
+                source[-1].append(text)
+
+        self._flush = lambda: None
+        self._parser.StartElementHandler = start
+        self._parser.EndElementHandler = end
+        self._parser.CharacterDataHandler = data
+
+
+def parse_events(data, kind):
+    """ Return a list of events for a complete XML chunk. """
+    stream = SentenceStream(kind)
+    return stream.feed(data, True)
+
+
+def document_view(data, doc_method):
+    """
+    Return a list with results of ``Document.<doc_method>()`` for
+    XML document ``data`` (bytes or a buffer), computed without
+    building an ElementTree.
+    """
+    kind, shape = VIEWS[doc_method]
+    return list(_shape(parse_events(data, kind), shape))
+
+
+def map_tags(results, doc_method, func):
+    """
+    Apply ``func`` to all tags in ``results`` of a view
+    (e.g. to convert them to interned Tag objects).
+    """
+    kind, shape = VIEWS[doc_method]
+    if kind == TAGGED:
+        def convert_sent(sent):
+            return [(word, func(tag)) for word, tag in sent]
+    elif kind == PARSED:
+        def convert_sent(sent):
+            return [(word, [(lemma, func(tag)) for lemma, tag in parses])
+                    for word, parses in sent]
+    else:
+        return results
+
+    if shape == 'words':
+        return convert_sent(results)
+    if shape == 'sents':
+        return [convert_sent(sent) for sent in results]
+    return [[convert_sent(sent) for sent in para] for para in results]
+
+
+def iter_file(filename, doc_method, read_size=READ_SIZE):
+    """
+    Stream the whole corpus file and yield results of
+    ``Document.<doc_method>()`` for all documents; memory usage
+    doesn't depend on file or document size.
+    """
+    kind, shape = VIEWS[doc_method]
+    return _shape(_iter_file_events(filename, kind, read_size), shape)
+
+
+def _iter_file_events(filename, kind, read_size):
+    stream = SentenceStream(kind)
+    with compressed.open_stream(filename, parallel=True) as f:
+        while True:
+            data = f.read(read_size)
+            for event in stream.feed(data, not data):
+                yield event
+            if not data:
+                break
+
+
+def _shape(events, shape):
+    if shape == 'sents':
+        return (sent for event, sent in events if event == SENTENCE)
+    if shape == 'words':
+        return itertools.chain.from_iterable(
+            sent for event, sent in events if event == SENTENCE)
+    paras = _paras(events)
+    if shape == 'raw_paras':
+        return (" ".join(para) for para in paras)
+    return paras
+
+
+def _paras(events):
+    para = None
+    for event, sent in events:
+        if event == PARAGRAPH:
+            if para is not None:
+                yield para
+            para = []
+        elif para is not None:
+            para.append(sent)
+    if para is not None:
+        yield para
@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, division
 import codecs
+import mmap
 from collections import namedtuple
 import re
+import threading
 import xml.sax.saxutils
 from .compat import ElementTree
 
@@ -63,6 +65,93 @@ def load_chunk(filename, bounds, encoding='utf8', slow=False):
         return f.read(size).decode(encoding)
 
 
+class MappedFile(object):
+    """
+    Read-only memory-mapped view of a file. Chunks are returned as
+    zero-copy memoryviews; they must be released before the
+    file is closed.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.closed = False
+        self._mmap = None
+        self._fp = None
+        self._lock = threading.Lock()
+        with open(filename, 'rb') as f:
+            try:
+                self._mmap = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except ValueError:  # empty file can't be mapped
+                pass
+
+    def chunk(self, bounds):
+        """ Return a memoryview of a chunk using Bounds info. """
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        data = b'' if self._mmap is None else self._mmap
+        return memoryview(data)[bounds.byte_start:bounds.byte_end]
+
+    def read(self, bounds):
+        """
+        Return a memoryview of a chunk copied with a single read() call.
+        For large chunks this is faster than faulting in mapped pages
+        one by one, especially on network file systems.
+        """
+        if self.closed:
+            raise ValueError("I/O operation on closed file")
+        size = max(bounds.byte_end - bounds.byte_start, 0)
+        buf = bytearray(size)
+        view = memoryview(buf)
+        done = 0
+        with self._lock:
+            if self._fp is None:
+                self._fp = open(self.filename, 'rb', buffering=0)
+            self._fp.seek(bounds.byte_start)
+            while done < size:
+                read = self._fp.readinto(view[done:])
+                if not read:
+                    break
+                done += read
+        view.release()
+        return memoryview(buf)[:done]
+
+    def close(self):
+        if self._mmap is not None:
+            self._mmap.close()
+            self._mmap = None
+        with self._lock:
+            if self._fp is not None:
+                self._fp.close()
+                self._fp = None
+        self.closed = True
+
+
+def coalesce_bounds(bounds, max_gap=0, max_span=None):
+    """
+    Group byte ranges for sequential reading. Ranges are sorted by offset;
+    neighbouring ranges less than ``max_gap`` bytes apart are merged into
+    a span unless the span would become longer than ``max_span`` bytes.
+    Return a list of ``(byte_start, byte_end, indices)`` tuples, where
+    ``indices`` are positions of merged ranges in ``bounds``.
+
+    >>> coalesce_bounds([Bounds(0, 0, 50, 60), Bounds(0, 0, 0, 10),
+    ...                  Bounds(0, 0, 12, 20)], max_gap=5)
+    [(0, 20, [1, 2]), (50, 60, [0])]
+    """
+    order = sorted(range(len(bounds)), key=lambda i: bounds[i].byte_start)
+    spans = []
+    for index in order:
+        start, end = bounds[index].byte_start, bounds[index].byte_end
+        if spans:
+            span = spans[-1]
+            new_end = max(span[1], end)
+            if start - span[1] <= max_gap and (max_span is None or new_end - span[0] <= max_span):
+                span[1] = new_end
+                span[2].append(index)
+                continue
+        spans.append([start, end, [index]])
+    return [tuple(span) for span in spans]
+
+
 def _load_chunk_slow(filename, bounds, encoding='utf8'):
     lines = []
     with codecs.open(filename, 'rb', encoding) as f:
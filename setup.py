@@ -1,15 +1,8 @@
 #!/usr/bin/env python
-import sys
 from setuptools import setup
 
 __version__ = '0.6'
 
-PY2 = sys.version_info[0] == 2
-if PY2:
-    reload(sys)
-    sys.setdefaultencoding("utf-8")
-
-
 setup(
     name='opencorpora-tools',
     version=__version__,
@@ -24,6 +17,7 @@ setup(
     packages=['opencorpora'],
     scripts=['bin/opencorpora'],
     install_requires=['lxml'],
+    python_requires='>=3.5',
 
     classifiers=[
         'Development Status :: 3 - Alpha',
@@ -32,9 +26,8 @@ setup(
         'License :: OSI Approved :: MIT License',
         'Natural Language :: Russian',
         'Programming Language :: Python',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
+        'Programming Language :: Python :: 3 :: Only',
         'Programming Language :: Python :: 3.5',
         'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
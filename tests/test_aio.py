@@ -0,0 +1,82 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import os
+import asyncio
+import unittest
+import tempfile
+import shutil
+
+from opencorpora.reader import CorpusReader
+from opencorpora.aio import AsyncCorpusReader
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'annot.corpus.xml')
+
+
+class AsyncReaderTest(unittest.TestCase):
+    processes = False
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.corpus = CorpusReader(TEST_DATA, cache_filename=os.path.join(self.temp_dir, 'cache'),
+                                   document_cache_size=10)
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.loop.close()
+        self.corpus.close()
+        shutil.rmtree(self.temp_dir)
+
+    def _run(self, func, **kwargs):
+        async def run():
+            async with AsyncCorpusReader(self.corpus, processes=self.processes,
+                                         max_workers=2, **kwargs) as corpus:
+                return await func(corpus)
+        return self.loop.run_until_complete(run())
+
+    def test_get_document(self):
+        async def func(corpus):
+            return await corpus.get_document(2)
+        doc = self._run(func)
+        self.assertEqual(doc.title(), '00021 Школа злословия')
+        self.assertEqual(doc.words(), self.corpus.get_document(2).words())
+        # the document cache of the wrapped reader is shared
+        self.assertTrue(self.corpus.get_document('2') is doc)
+
+    def test_get_documents(self):
+        async def func(corpus):
+            return await corpus.get_documents(['4', 3, '2', '1'])
+        docs = self._run(func, max_in_flight=2)
+        self.assertEqual([doc.title() for doc in docs], [
+            '00023 За кота - ответишь!', '00022 Последнее восстание в Сеуле',
+            '00021 Школа злословия', '"Частный корреспондент"'])
+
+    def test_missing_document(self):
+        async def func(corpus):
+            return await corpus.get_document(99)
+        self.assertRaises(KeyError, self._run, func)
+
+    def test_get_sentence(self):
+        async def func(corpus):
+            return await corpus.get_sentence(2)
+        self.assertEqual(self._run(func).raw(), 'Сохранится ли градус дискуссии в новом сезоне?')
+
+    def test_views(self):
+        async def func(corpus):
+            words, sents = [], []
+            async for word in corpus.iter_tagged_words():
+                words.append(word)
+            async for sent in corpus.iter_raw_sents(categories='Автор:Яна Сарно'):
+                sents.append(sent)
+            return words, sents
+        words, sents = self._run(func, max_in_flight=1)
+        self.assertEqual(words, self.corpus.tagged_words())
+        self.assertEqual(sents, self.corpus.raw_sents(categories='Автор:Яна Сарно'))
+
+    def test_fileids(self):
+        async def func(corpus):
+            return await corpus.fileids(categories='Автор:*')
+        self.assertEqual(self._run(func), ['2', '3', '4'])
+
+
+class AsyncProcessReaderTest(AsyncReaderTest):
+    processes = True
@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import os
+import unittest
+import tempfile
+import shutil
+
+from opencorpora.reader import CorpusReader
+from opencorpora.batches import (batches, encode_sentences, encode_columnar,
+                                 FeatureVocabulary, Vocabulary)
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'annot.corpus.xml')
+
+# the last token of the first sentence has no parses
+NO_PARSES_DATA = """<?xml version="1.0" encoding="utf-8" standalone="yes"?>
+<annotation version="0.12" revision="1">
+  <text id="1" parent="0" name="test">
+    <tags></tags>
+    <paragraphs>
+      <paragraph id="1">
+        <sentence id="1">
+          <source>Школа X</source>
+          <tokens>
+            <token id="1" text="Школа"><tfr rev_id="1" t="Школа"><v><l id="1" t="школа"><g v="NOUN"/><g v="nomn"/></l></v></tfr></token>
+            <token id="2" text="X"><tfr rev_id="2" t="X"><v></v></tfr></token>
+          </tokens>
+        </sentence>
+        <sentence id="2">
+          <source>в</source>
+          <tokens>
+            <token id="3" text="в"><tfr rev_id="3" t="в"><v><l id="2" t="в"><g v="PREP"/></l></v></tfr></token>
+          </tokens>
+        </sentence>
+      </paragraph>
+    </paragraphs>
+  </text>
+</annotation>
+"""
+
+
+class BatchesTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.corpus = CorpusReader(TEST_DATA, cache_filename=os.path.join(self.temp_dir, 'cache'))
+        self.columnar_path = os.path.join(self.temp_dir, 'corpus.columnar')
+        self.corpus.export_columnar(self.columnar_path)
+        self.store = CorpusReader.load_columnar(self.columnar_path)
+
+    def tearDown(self):
+        self.store.close()
+        self.corpus.close()
+        shutil.rmtree(self.temp_dir)
+
+    def _decode(self, batch, vocab):
+        sents = []
+        width = batch.max_length
+        for i, length in enumerate(batch.lengths):
+            sent = []
+            for j in range(length):
+                pos = i * width + j
+                row = batch.grammemes[pos * batch.num_grammemes:(pos + 1) * batch.num_grammemes]
+                grammemes = [g for g, bit in zip(vocab.registry.grammemes, row) if bit]
+                sent.append((vocab.forms.string(batch.forms[pos]),
+                             vocab.lemmas.string(batch.lemmas[pos]), grammemes))
+            self.assertEqual(list(batch.forms[i * width + length:(i + 1) * width]),
+                             [0] * (width - length))
+            sents.append(sent)
+        return sents
+
+    def _expected(self):
+        return [
+            [(form, parses[0][0], sorted(parses[0][1].split(','),
+                                         key=FeatureVocabulary().registry.bit))
+             for form, parses in sent]
+            for sent in self.corpus.iter_parsed_sents()
+        ]
+
+    def test_parsed_sents(self):
+        vocab = FeatureVocabulary()
+        result = []
+        for batch in batches(self.corpus.iter_parsed_sents(), vocab, batch_size=7):
+            self.assertTrue(len(batch.lengths) <= 7)
+            self.assertEqual(len(batch.forms), len(batch.lengths) * batch.max_length)
+            self.assertEqual(batch.max_length, max(batch.lengths))
+            result.extend(self._decode(batch, vocab))
+        self.assertEqual(result, self._expected())
+
+    def test_columnar(self):
+        vocab = FeatureVocabulary()
+        result = []
+        for batch in batches(self.store, vocab, batch_size=16):
+            result.extend(self._decode(batch, vocab))
+        self.assertEqual(result, self._expected())
+
+    def test_max_length(self):
+        vocab = FeatureVocabulary()
+        for batch in batches(self.store, vocab, batch_size=10, max_length=5, drop_last=True):
+            self.assertEqual(len(batch.lengths), 10)
+            self.assertEqual(len(batch.lemmas), 50)
+            self.assertTrue(max(batch.lengths) <= 5)
+
+    def test_shuffle(self):
+        def sentences(**kwargs):
+            vocab = FeatureVocabulary()
+            return [
+                tuple(sent)
+                for batch in batches(self.store, vocab, batch_size=8, **kwargs)
+                for sent in self._decode(batch, vocab)
+            ]
+        shuffled = sentences(shuffle_buffer=20, seed=1)
+        self.assertEqual(shuffled, sentences(shuffle_buffer=20, seed=1))
+        self.assertNotEqual(shuffled, sentences())
+        self.assertEqual(sorted(shuffled), sorted(sentences()))
+
+    def test_shared_vocabulary(self):
+        vocab = FeatureVocabulary()
+        first = list(batches(self.store, vocab, batch_size=16))
+        path = os.path.join(self.temp_dir, 'vocab.json')
+        vocab.save(path)
+
+        loaded = FeatureVocabulary.load(path)
+        self.assertEqual(list(batches(self.corpus.iter_parsed_sents(), loaded, batch_size=16)), first)
+        self.assertEqual(loaded.forms.id('нетакогослова'), Vocabulary.UNKNOWN)
+        self.assertEqual(len(loaded.forms), len(vocab.forms))
+
+    def test_no_parses(self):
+        filename = os.path.join(self.temp_dir, 'no_parses.xml')
+        with open(filename, 'wb') as f:
+            f.write(NO_PARSES_DATA.encode('utf8'))
+        path = os.path.join(self.temp_dir, 'no_parses.columnar')
+        with CorpusReader(filename, use_cache=False) as corpus:
+            corpus.export_columnar(path)
+            with CorpusReader.load_columnar(path) as store:
+                vocab = FeatureVocabulary()
+                columnar = list(encode_columnar(store, vocab))
+                expected = list(encode_sentences(corpus.iter_parsed_sents(), vocab))
+        self.assertEqual(columnar, expected)
+        self.assertEqual(list(columnar[0][1])[1], Vocabulary.UNKNOWN)
+        self.assertEqual(list(columnar[0][2])[1], Vocabulary.UNKNOWN)
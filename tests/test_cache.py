@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import threading
+import unittest
+
+from opencorpora.cache import LRUCache
+
+
+class LRUCacheTest(unittest.TestCase):
+
+    def test_entries_limit(self):
+        cache = LRUCache(max_entries=2)
+        cache.put('a', 1)
+        cache.put('b', 2)
+        self.assertEqual(cache.get('a'), 1)  # 'b' is now the oldest
+        cache.put('c', 3)
+        self.assertEqual(cache.get('b'), None)
+        self.assertEqual(cache.get('a'), 1)
+        self.assertEqual(cache.get('c'), 3)
+        self.assertEqual(cache.info(), (3, 1, 1, 2, 2))
+
+    def test_size_limit(self):
+        cache = LRUCache(max_size=10)
+        cache.put('a', 1, size=6)
+        cache.put('b', 2, size=3)
+        cache.put('c', 3, size=3)
+        self.assertFalse('a' in cache)
+        self.assertEqual(len(cache), 2)
+        self.assertEqual(cache.info().size, 6)
+
+        cache.put('d', 4, size=11)  # too large to be cached
+        self.assertFalse('d' in cache)
+        self.assertEqual(len(cache), 2)
+
+    def test_replace(self):
+        cache = LRUCache(max_size=10)
+        cache.put('a', 1, size=6)
+        cache.put('a', 2, size=5)
+        self.assertEqual(cache.get('a'), 2)
+        self.assertEqual(cache.info().size, 5)
+
+    def test_threads(self):
+        cache = LRUCache(max_entries=50)
+
+        def worker(offset):
+            for i in range(1000):
+                key = (i + offset) % 80
+                if cache.get(key) is None:
+                    cache.put(key, key)
+
+        threads = [threading.Thread(target=worker, args=(i,)) for i in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        info = cache.info()
+        self.assertEqual(info.hits + info.misses, 4000)
+        self.assertEqual(info.entries, 50)
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import
+import io
+import os
+import contextlib
 import mock
 import unittest
 import tempfile
 from opencorpora import cli
 
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'annot.corpus.xml')
+
 class CliTest(unittest.TestCase):
 
     @mock.patch('opencorpora.cli.urlopen')
@@ -19,3 +24,30 @@ class CliTest(unittest.TestCase):
                 quiet = False
             args = Args()
             cli.download(args)
+
+    def test_stats(self):
+        out = io.StringIO()
+        snapshot = cli._stats(TEST_DATA, 'iter_words', tree=True, use_cache=False, out=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0].split(' in ')[0], 'iter_words: 2358 items')
+        self.assertEqual(snapshot['counters']['documents_parsed'], 4)
+        self.assertTrue(any(line.split()[0] == 'parse' for line in lines))
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            cli._stats(TEST_DATA, 'iter_words', use_cache=False)
+        self.assertEqual(out.getvalue().split(' in ')[0], 'iter_words: 2358 items')
+
+    def test_concordance(self):
+        out = io.StringIO()
+        num_lines = cli._concordance(TEST_DATA, grammemes='NOUN,plur', width=2, limit=3,
+                                     use_cache=False, out=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(num_lines, 3)
+        self.assertEqual(lines[0].split('\t'), ['2', '3', u'после летних [каникул] в новом'])
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            cli._concordance(TEST_DATA, grammemes='NOUN,plur', width=2, limit=3,
+                             use_cache=False)
+        self.assertEqual(len(out.getvalue().splitlines()), 3)
@@ -1,15 +1,24 @@
 # -*- coding: utf-8 -*-
 from __future__ import absolute_import, print_function, division, unicode_literals
 import os
+import re
 try:
     import unittest2 as unittest
 except ImportError:
     import unittest
 import tempfile
 import shutil
+import mock
 from collections import OrderedDict
 
-from opencorpora.reader import CorpusReader
+from opencorpora.reader import CorpusReader, Document
+from opencorpora.compat import ElementTree
+from opencorpora.grammemes import GrammemeRegistry, Tag
+from opencorpora.categories import Category, CategoryIndex
+from opencorpora.parallel import ParallelCorpusReader
+from opencorpora import (indexing, xml_utils, streaming, compressed, statistics,
+                         concordance, parallel)
+from opencorpora.instrumentation import ReaderStats
 
 
 TEST_DATA = os.path.join(os.path.dirname(__file__), 'annot.corpus.xml')
@@ -22,8 +31,12 @@ class BaseTest(unittest.TestCase):
         self.corpus = CorpusReader(TEST_DATA, cache_filename=cache_filename)
 
     def tearDown(self):
+        self.corpus.close()
         shutil.rmtree(self.temp_dir)
 
+    def _reader(self, **kwargs):
+        return CorpusReader(TEST_DATA, self.corpus._cache_filename, **kwargs)
+
 
 class CorporaTest(BaseTest):
 
@@ -51,6 +64,22 @@ class CorporaTest(BaseTest):
         loaded_line = self.corpus._get_doc_by_line_offset(3)  # this is reliable
         self.assertEqual(loaded_raw, loaded_line)
 
+    def test_close(self):
+        with CorpusReader(TEST_DATA, use_cache=False) as corpus:
+            words = corpus.words('3')
+            source = corpus._source
+            self.assertFalse(source.closed)
+        self.assertTrue(source.closed)
+        self.assertEqual(corpus.words('3'), words)  # reopened
+        corpus.close()
+
+    def test_close_index(self):
+        self.corpus.fileids()
+        with self._reader() as corpus:
+            self.assertEqual(corpus.fileids(), ['1', '2', '3', '4'])
+            index = corpus._document_meta
+        self.assertTrue(index._file.closed)
+
     def test_single_doc_xml(self):
         xml = self.corpus._document_xml(3)
         tokens = xml.findall('paragraphs//token')
@@ -161,6 +190,412 @@ class CorporaTest(BaseTest):
         self.assertEqual(raw, self.corpus.raw(3))
 
 
+class IndexingTest(BaseTest):
+
+    def _legacy_bounds(self):
+        return [
+            (match.group(1), bounds) for match, bounds in xml_utils.bounds(
+                TEST_DATA, start_re=r'\s*<text id="(\d+)"', end_re=r'\s*</text>')
+        ]
+
+    def test_bounds_match_regex_scan(self):
+        meta = self.corpus._get_meta()
+        self.assertEqual(
+            [(doc_id, m.bounds) for doc_id, m in meta.items()],
+            self._legacy_bounds()
+        )
+
+    def test_small_reads(self):
+        with open(TEST_DATA, 'rb') as f:
+            scanner = indexing.DocumentScanner(f, read_size=7)
+            docs = list(scanner.documents())
+        self.assertEqual(docs, list(indexing.scan_documents(TEST_DATA)))
+
+    def test_ranges(self):
+        offsets = indexing.split_offsets(TEST_DATA, 10)
+        self.assertEqual(offsets, sorted(set(offsets)))
+        self.assertEqual(offsets[0], 0)
+        starts = [m.bounds.byte_start for m in self.corpus._get_meta().values()]
+        self.assertTrue(len(offsets) > 1)
+        self.assertTrue(set(offsets[1:]) <= set(starts))
+
+    def test_ranges_merged(self):
+        serial = list(indexing.scan_documents(TEST_DATA))
+        self.assertEqual(list(indexing.scan_documents(TEST_DATA, parts=10)), serial)
+        self.assertEqual(list(indexing.scan_documents(TEST_DATA, workers=2)), serial)
+
+    def test_parallel_reader(self):
+        corpus = CorpusReader(TEST_DATA, use_cache=False, index_workers=2)
+        self.assertEqual(corpus._get_meta(), self.corpus._get_meta())
+
+    def test_parents(self):
+        meta = self.corpus._get_meta()
+        self.assertEqual([m.parent for m in meta.values()], ['0', '1', '1', '1'])
+
+    def test_categories(self):
+        meta = self.corpus._get_meta()
+        for doc_id in meta:
+            doc = self.corpus.get_document(doc_id)
+            self.assertEqual(meta[doc_id].categories, doc.categories())
+
+
+class MetaCacheTest(BaseTest):
+
+    def setUp(self):
+        super(MetaCacheTest, self).setUp()
+        self.filename = os.path.join(self.temp_dir, 'annot.corpus.xml')
+        shutil.copy(TEST_DATA, self.filename)
+
+    def _reader(self):
+        return CorpusReader(self.filename)
+
+    def test_index_loaded(self):
+        meta = self._reader()._get_meta()
+        self.assertTrue(isinstance(meta, OrderedDict))
+
+        meta2 = self._reader()._get_meta()
+        self.assertTrue(isinstance(meta2, indexing.DocumentIndex))
+        self.assertEqual(list(meta2.keys()), list(meta.keys()))
+        self.assertEqual(list(meta2.values()), list(meta.values()))
+        self.assertEqual(meta2['3'], meta['3'])
+        self.assertTrue('4' in meta2)
+        self.assertFalse('5' in meta2)
+        self.assertFalse('foo' in meta2)
+        self.assertRaises(KeyError, lambda: meta2['0'])
+        meta2.close()
+
+    def test_reader_uses_index(self):
+        words = self._reader().words('3')
+        reader = self._reader()
+        self.assertEqual(reader.words('3'), words)
+        self.assertEqual(reader.catalog('Автор:*'), self.corpus.catalog('Автор:*'))
+        self.assertTrue(isinstance(reader._document_meta, indexing.DocumentIndex))
+
+    def _rewrite(self, old, new):
+        with open(self.filename, 'rb') as f:
+            data = f.read()
+        with open(self.filename, 'wb') as f:
+            f.write(data.replace(old.encode('utf8'), new.encode('utf8')))
+        os.utime(self.filename, (0, 0))  # make data older than the cache
+
+    def test_revision_change(self):
+        self._reader()._get_meta()
+        self._rewrite('revision="4579844"', 'revision="4579845"')
+        meta = self._reader()._get_meta()
+        self.assertTrue(isinstance(meta, OrderedDict))
+
+    def test_size_change(self):
+        self._reader()._get_meta()
+        self._rewrite('Школа злословия', 'Школа')
+        meta = self._reader()._get_meta()
+        self.assertTrue(isinstance(meta, OrderedDict))
+        self.assertEqual(meta['2'].title, '00021 Школа')
+
+    def test_incremental_update(self):
+        reader = self._reader()
+        old_meta = list(reader._get_meta().items())
+        sentence = reader.get_sentence('2').raw()
+        reader.close()
+        self._rewrite('Школа злословия', 'Школа')
+
+        previous = indexing.DocumentIndex(self.filename + '.~')
+        with open(self.filename, 'rb') as f:
+            scanner = indexing.DocumentScanner(f, previous=previous)
+            docs = list(scanner.documents())
+        previous.close()
+        self.assertEqual(scanner.reused, 3)
+        self.assertEqual(docs, list(indexing.scan_documents(self.filename)))
+
+        with mock.patch('opencorpora.indexing.scan_sentences',
+                        side_effect=indexing.scan_sentences) as scan:
+            reader = self._reader()
+            meta = reader._get_meta()
+            self.assertEqual(meta, CorpusReader(self.filename, use_cache=False)._get_meta())
+            self.assertEqual(meta['1'], dict(old_meta)['1'])
+            self.assertNotEqual(meta['3'].bounds, dict(old_meta)['3'].bounds)
+            self.assertEqual(meta['3'].digest, dict(old_meta)['3'].digest)
+            self.assertEqual(reader.get_sentence('2').raw(), sentence)
+            self.assertEqual(reader.token_location('1029'), ('3', '45', 1))
+            # only the changed document is scanned for sentences
+            self.assertEqual(scan.call_count, 1)
+            reader.close()
+
+        fresh = indexing.build_sentence_index(meta, xml_utils.MappedFile(self.filename))
+        stored = indexing.SentenceIndex.load(self.filename + '.~.sents')
+        for name, values in fresh.items():
+            self.assertEqual(stored._arrays[name].tolist(), values.tolist(), name)
+        stored.close()
+
+    def test_foreign_cache(self):
+        with open(self.filename + '.~', 'wb') as f:
+            f.write(b'\x80\x01}q\x00.')  # an old pickle cache
+        meta = self._reader()._get_meta()
+        self.assertTrue(isinstance(meta, OrderedDict))
+        self.assertEqual(len(meta), 4)
+
+        meta2 = self._reader()._get_meta()
+        self.assertTrue(isinstance(meta2, indexing.DocumentIndex))
+        meta2.close()
+
+
+class ParallelReaderTest(BaseTest):
+
+    def setUp(self):
+        super(ParallelReaderTest, self).setUp()
+        self.parallel = ParallelCorpusReader(
+            TEST_DATA, cache_filename=self.corpus._cache_filename,
+            workers=2, max_pending=2)
+
+    def tearDown(self):
+        self.parallel.close()
+        super(ParallelReaderTest, self).tearDown()
+
+    def test_views(self):
+        self.assertEqual(self.parallel.words(), self.corpus.words())
+        self.assertEqual(self.parallel.tagged_sents(['3', '2']),
+                         self.corpus.tagged_sents(['3', '2']))
+        self.assertEqual(self.parallel.parsed_paras(categories='Автор:*'),
+                         self.corpus.parsed_paras(categories='Автор:*'))
+        self.assertEqual(self.parallel.raw_sents('3'), self.corpus.raw_sents('3'))
+
+    def test_unordered(self):
+        self.parallel.ordered = False
+        self.assertEqual(sorted(self.parallel.raw_paras()),
+                         sorted(self.corpus.raw_paras()))
+
+    def test_errors(self):
+        self.assertRaises(KeyError, self.parallel.words, '5')
+
+
+class StreamingTest(BaseTest):
+
+    def test_document_views(self):
+        for doc_id in self.corpus.fileids():
+            doc = self.corpus.get_document(doc_id)
+            xml = self.corpus._get_doc_by_raw_offset(doc_id).encode('utf8')
+            for method in streaming.VIEWS:
+                self.assertEqual(
+                    streaming.document_view(xml, method),
+                    list(getattr(doc, method)()),
+                    (doc_id, method)
+                )
+
+    def test_iter_file(self):
+        for method in ['iter_paras', 'iter_raw_paras', 'iter_tagged_words']:
+            expected = []
+            for doc in self.corpus.iter_documents():
+                expected.extend(getattr(doc, method)())
+            self.assertEqual(list(streaming.iter_file(TEST_DATA, method)), expected)
+            self.assertEqual(
+                list(streaming.iter_file(TEST_DATA, method, read_size=100)),
+                expected
+            )
+
+    def test_empty_source(self):
+        xml = '<text><paragraphs><paragraph><sentence><source/><tokens/></sentence></paragraph><paragraph/></paragraphs></text>'.encode('utf8')
+        doc = Document(ElementTree.XML(xml))
+        for method in streaming.VIEWS:
+            self.assertEqual(streaming.document_view(xml, method),
+                             list(getattr(doc, method)()))
+
+
+class CompressedTest(BaseTest):
+
+    def _compressed_copy(self, ext, compress):
+        with open(TEST_DATA, 'rb') as f:
+            data = f.read()
+        filename = os.path.join(self.temp_dir, 'annot.corpus.xml' + ext)
+        with open(filename, 'wb') as f:
+            f.write(compress(data))
+        return filename
+
+    def _reader(self, filename, **kwargs):
+        reader = CorpusReader(filename, cache_filename=filename + '.cache', **kwargs)
+        self.addCleanup(reader.close)
+        return reader
+
+    def assertSameCorpus(self, reader):
+        self.assertEqual(reader.fileids(), self.corpus.fileids())
+        self.assertEqual(reader.get_annotation_info(), self.corpus.get_annotation_info())
+        self.assertEqual(reader.categories(), self.corpus.categories())
+        for doc_id in ['3', '1', '2']:
+            self.assertEqual(reader.get_document(doc_id).raw(),
+                             self.corpus.get_document(doc_id).raw())
+        self.assertEqual([doc.raw() for doc in reader.get_documents(['3', '1', '2'])],
+                         [self.corpus.get_document(doc_id).raw() for doc_id in ['3', '1', '2']])
+        self.assertEqual(reader.tagged_words(), self.corpus.tagged_words())
+
+    def test_bz2(self):
+        import bz2
+        # compression level 1 uses 100k blocks, so there are several of them
+        filename = self._compressed_copy('.bz2', lambda data: bz2.compress(data, 1))
+        self.assertSameCorpus(self._reader(filename))
+
+        source = self._reader(filename)._get_source()
+        self.assertTrue(isinstance(source, compressed.Bz2BlockFile))
+        self.assertTrue(source.num_blocks > 1)
+        self.assertTrue(os.path.exists(filename + '.cache.blocks'))
+
+        # index files are reused
+        reader = self._reader(filename)
+        self.assertSameCorpus(reader)
+        self.assertTrue(isinstance(reader._get_meta(), indexing.DocumentIndex))
+        self.assertEqual(reader.get_sentence('2').raw(), self.corpus.get_sentence('2').raw())
+
+    def test_bz2_blocks(self):
+        import bz2
+        with open(TEST_DATA, 'rb') as f:
+            data = f.read()
+        filename = self._compressed_copy('.bz2', lambda data: bz2.compress(data, 1))
+        source = compressed.Bz2BlockFile(filename, threads=2, cache_blocks=1)
+        self.addCleanup(source.close)
+        with source.stream() as stream:
+            self.assertEqual(stream.read(1000), data[:1000])
+            self.assertEqual(stream.read(), data[1000:])
+        with compressed.open_stream(filename, parallel=True) as stream:
+            self.assertEqual(stream.read(), data)
+        for start, end in [(0, 10), (99990, 100010), (123456, 345678), (len(data) - 5, len(data))]:
+            chunk = source.chunk(xml_utils.Bounds(None, None, start, end))
+            self.assertEqual(chunk.tobytes(), data[start:end])
+
+    def test_bz2_lazy_offsets(self):
+        import bz2
+        with open(TEST_DATA, 'rb') as f:
+            data = f.read()
+        filename = self._compressed_copy('.bz2', lambda data: bz2.compress(data, 1))
+        index_filename = filename + '.blocks'
+        source = compressed.Bz2BlockFile(filename, index_filename, threads=1)
+        self.addCleanup(source.close)
+        chunk = source.chunk(xml_utils.Bounds(None, None, 10, 20))
+        self.assertEqual(chunk.tobytes(), data[10:20])
+        self.assertTrue(len(source._known_offsets) < source.num_blocks + 1)
+        self.assertFalse(os.path.exists(index_filename))
+
+        chunk = source.chunk(xml_utils.Bounds(None, None, len(data) - 5, len(data)))
+        self.assertEqual(chunk.tobytes(), data[-5:])
+        self.assertTrue(os.path.exists(index_filename))
+
+    def test_bz2_stream_close(self):
+        import bz2
+        filename = self._compressed_copy('.bz2', lambda data: bz2.compress(data, 1))
+        source = compressed.Bz2BlockFile(filename, filename + '.blocks', threads=1)
+        self.addCleanup(source.close)
+        with source.stream() as stream:
+            stream.read(10)
+        # the rest of the file is not decompressed on close
+        self.assertTrue(source._offsets is None)
+        self.assertFalse(os.path.exists(filename + '.blocks'))
+
+    def test_bz2_worker_threads(self):
+        import bz2
+        filename = self._compressed_copy('.bz2', bz2.compress)
+        with mock.patch('os.cpu_count', return_value=8):
+            parallel._init_worker(filename, None)
+        self.addCleanup(parallel._worker_source.close)
+        self.assertEqual(parallel._worker_source.threads, 1)
+
+    def test_gzip(self):
+        import gzip
+        import io
+
+        def compress(data):
+            buf = io.BytesIO()
+            with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+                f.write(data)
+            return buf.getvalue()
+
+        filename = self._compressed_copy('.gz', compress)
+        self.assertSameCorpus(self._reader(filename))
+        self.assertSameCorpus(self._reader(filename, use_cache=False))
+
+    def test_zstd(self):
+        try:
+            import zstandard
+        except ImportError:
+            raise unittest.SkipTest("zstandard is not installed")
+        filename = self._compressed_copy('.zst', zstandard.ZstdCompressor().compress)
+        self.assertSameCorpus(self._reader(filename))
+
+    def test_parallel(self):
+        import bz2
+        filename = self._compressed_copy('.bz2', lambda data: bz2.compress(data, 1))
+        reader = ParallelCorpusReader(filename, cache_filename=filename + '.cache',
+                                      workers=2)
+        self.addCleanup(reader.close)
+        self.assertEqual(reader.parsed_sents(['3', '1']),
+                         self.corpus.parsed_sents(['3', '1']))
+
+    def test_iter_file(self):
+        import bz2
+        filename = self._compressed_copy('.bz2', bz2.compress)
+        self.assertEqual(list(streaming.iter_file(filename, 'iter_words')),
+                         self.corpus.words())
+
+
+class ColumnarTest(BaseTest):
+
+    def setUp(self):
+        super(ColumnarTest, self).setUp()
+        self.path = os.path.join(self.temp_dir, 'corpus.columns')
+        self.corpus.export_columnar(self.path)
+        self.store = CorpusReader.load_columnar(self.path)
+
+    def tearDown(self):
+        self.store.close()
+        super(ColumnarTest, self).tearDown()
+
+    def test_views(self):
+        self.assertEqual(self.store.fileids(), self.corpus.fileids())
+        self.assertEqual(self.store.revision, '4579844')
+        for method in ['sents', 'paras', 'tagged_sents', 'tagged_paras',
+                       'parsed_sents', 'words', 'tagged_words', 'parsed_words']:
+            self.assertEqual(getattr(self.store, method)(),
+                             getattr(self.corpus, method)(), method)
+
+    def test_fileids(self):
+        self.assertEqual(self.store.words('3'), self.corpus.words('3'))
+        self.assertEqual(self.store.paras(['3', '1', 2]), self.corpus.paras(['3', '1', 2]))
+        self.assertEqual(self.store.sents('1'), [])
+
+    def test_arrays(self):
+        self.assertEqual(len(self.store.forms), len(self.corpus.words()))
+        self.assertEqual(self.store.forms.format, 'I')
+        form = self.store.forms[967]
+        self.assertEqual(self.store.form_vocab[form], 'Школа')
+        self.assertEqual(self.store.sent_offsets[-1], len(self.store.forms))
+        self.assertEqual(len(self.store.doc_offsets), 5)
+
+    def test_filtered_export(self):
+        path = os.path.join(self.temp_dir, 'filtered.columns')
+        self.corpus.export_columnar(path, categories='Автор:Яна Сарно')
+        with CorpusReader.load_columnar(path) as store:
+            self.assertEqual(store.fileids(), ['3'])
+            self.assertEqual(store.tagged_sents(), self.corpus.tagged_sents('3'))
+
+    def test_no_parses(self):
+        with open(TEST_DATA, 'rb') as f:
+            data = f.read()
+        # token 2 (in the middle of a sentence) and the last token
+        # of the corpus lose their parses
+        data = re.sub(br'(<token id="2" .*?<v>).*?</v>', br'\1</v>', data, count=1)
+        last = data.rindex(b'<v>')
+        data = data[:last] + re.sub(br'<v>.*?</v>', b'<v></v>', data[last:], count=1)
+        filename = os.path.join(self.temp_dir, 'no_parses.xml')
+        with open(filename, 'wb') as f:
+            f.write(data)
+        path = os.path.join(self.temp_dir, 'no_parses.columns')
+        with CorpusReader(filename, use_cache=False) as corpus:
+            corpus.export_columnar(path)
+            parsed = corpus.parsed_sents()
+        with CorpusReader.load_columnar(path) as store:
+            tagged = store.tagged_sents()
+            self.assertEqual(store.parsed_sents(), parsed)
+        self.assertEqual(tagged[0][1], ('Школа', ''))
+        self.assertEqual(tagged[0][2][1], 'NOUN,inan,neut,sing,gent')
+        self.assertEqual(tagged[-1][-1], (parsed[-1][-1][0], ''))
+        self.assertEqual(parsed[-1][-1][1], [])
+
+
 class CategoriesTest(BaseTest):
     def test_categories(self):
         cats = self.corpus.categories()
@@ -210,6 +645,36 @@ class CategoriesTest(BaseTest):
         ids = self.corpus.fileids(categories=['Автор:*']) # docs ids with authors
         self.assertEqual(ids, ['2', '3', '4'])
 
+    def test_category_queries(self):
+        ids = self.corpus.fileids(Category('Автор:*') & ~Category('Дата:25/08'))
+        self.assertEqual(ids, ['3', '4'])
+        ids = self.corpus.fileids(Category('Автор:*') & ~Category('Год:2008'))
+        self.assertEqual(ids, [])
+        ids = self.corpus.fileids(Category('Тип:Газета') | Category('*Сарно'))
+        self.assertEqual(ids, ['1', '3'])
+        ids = self.corpus.fileids(~Category('Автор:*'))
+        self.assertEqual(ids, ['1'])
+        ids = self.corpus.fileids(Category('Тема:ЧасКор:Культура*') & 'Автор:Яна*')
+        self.assertEqual(ids, ['3'])
+
+    def test_category_queries_fileids(self):
+        sents = self.corpus.sents([4, 3, 1], categories=~Category('Тип:*'))
+        self.assertEqual(sents, self.corpus.sents(['4', '3']))
+
+    def test_stored_category_index(self):
+        self.corpus.fileids()
+        with self._reader() as corpus:
+            self.assertEqual(corpus.fileids(['Автор:*']), ['2', '3', '4'])
+            self.assertTrue(isinstance(corpus._document_meta, indexing.DocumentIndex))
+            self.assertEqual(corpus.fileids(~Category('url:*chaskor.ru')), ['2', '3', '4'])
+            index = corpus._get_category_index()
+            expected = CategoryIndex.from_meta(self.corpus._get_meta())
+            self.assertEqual(index.categories, expected.categories)
+            self.assertEqual(
+                [index.postings(i) for i in range(len(index.categories))],
+                [expected.postings(i) for i in range(len(expected.categories))],
+            )
+
     def test_categories_patterns(self):
         cats = self.corpus.categories([1, 3], ['Автор:*', 'Тема:*'])
         self.assertEqual(cats, [
@@ -236,6 +701,290 @@ class DocumentTest(BaseTest):
         self.assertEqual(sents[1], 'Сохранится ли градус дискуссии в новом сезоне?')
 
 
+class DocumentCacheTest(BaseTest):
+
+    def test_cache_hits(self):
+        with self._reader(document_cache_size=2) as corpus:
+            doc = corpus.get_document(2)
+            self.assertTrue(corpus.get_document('2') is doc)
+            corpus.get_document(3)
+            corpus.get_document(4)
+            self.assertFalse(corpus.get_document(2) is doc)
+            self.assertEqual(corpus.document_cache.info()[:3], (1, 4, 2))
+
+    def test_iter_documents_doesnt_destroy(self):
+        with self._reader(document_cache_size=10) as corpus:
+            doc = corpus.get_document(3)
+            words = doc.words()
+            list(corpus.iter_documents_raw())
+            self.assertEqual(doc.words(), words)
+            self.assertTrue(corpus.get_document(3) is doc)
+
+    def test_cache_bytes(self):
+        meta = self.corpus._get_meta()
+        size = meta['2'].bounds.byte_end - meta['2'].bounds.byte_start
+        with self._reader(document_cache_bytes=size) as corpus:
+            corpus.get_document(2)
+            corpus.get_document(3)
+            self.assertFalse('2' in corpus.document_cache)
+            self.assertTrue('3' in corpus.document_cache)
+
+    def test_no_cache(self):
+        doc = self.corpus.get_document(2)
+        self.assertFalse(self.corpus.get_document(2) is doc)
+        self.assertEqual(self.corpus.document_cache, None)
+
+
+class BulkFetchTest(BaseTest):
+
+    def test_get_documents(self):
+        doc_ids = ['4', '2', '3', '2']
+        docs = self.corpus.get_documents(doc_ids)
+        self.assertEqual([doc.raw() for doc in docs],
+                         [self.corpus.get_document(doc_id).raw() for doc_id in doc_ids])
+        self.assertFalse(docs[1] is docs[3])
+        self.assertEqual(self.corpus.get_documents([]), [])
+        self.assertRaises(KeyError, self.corpus.get_documents, ['2', '100'])
+
+    def test_coalesced_reads(self):
+        with self._reader(stats=True) as corpus:
+            corpus.get_documents(['4', '2', '3'])
+            self.assertEqual(corpus.stats.snapshot()['counters']['chunks_read'], 1)
+            corpus.stats.reset()
+            corpus.get_documents(['4', '2', '3'], max_gap=0, max_span=1)
+            self.assertEqual(corpus.stats.snapshot()['counters']['chunks_read'], 3)
+
+    def test_cache(self):
+        with self._reader(document_cache_size=10) as corpus:
+            doc = corpus.get_document(3)
+            docs = corpus.get_documents([2, 3, 2])
+            self.assertTrue(docs[1] is doc)
+            self.assertTrue(docs[0] is docs[2])
+            self.assertTrue(corpus.get_document(2) is docs[0])
+
+    def test_iter_documents(self):
+        with mock.patch('opencorpora.reader.BULK_BATCH_SIZE', 2):
+            raw = [doc.raw() for doc in self.corpus.iter_documents(['4', '1', '2'])]
+        self.assertEqual(raw, [self.corpus.get_document(doc_id).raw()
+                               for doc_id in ['4', '1', '2']])
+
+    def test_mapped_file_read(self):
+        source = self.corpus._get_source()
+        bounds = self.corpus._get_meta()['3'].bounds
+        self.assertEqual(source.read(bounds).tobytes(), source.chunk(bounds).tobytes())
+        end = os.path.getsize(TEST_DATA)
+        self.assertEqual(source.read(xml_utils.Bounds(0, 0, end - 5, end + 10)).tobytes(),
+                         source.chunk(xml_utils.Bounds(0, 0, end - 5, end)).tobytes())
+
+
+class StatisticsTest(BaseTest):
+
+    def test_counts(self):
+        self.assertEqual(self.corpus.counts(), statistics.Counts(
+            len(self.corpus.paras()), len(self.corpus.sents()), len(self.corpus.words())))
+        self.assertEqual(self.corpus.counts('2'), statistics.Counts(
+            len(self.corpus.paras('2')), len(self.corpus.sents('2')), len(self.corpus.words('2'))))
+        self.assertEqual(self.corpus.counts(categories='Год:2008').tokens,
+                         len(self.corpus.words(categories='Год:2008')))
+        self.assertEqual(self.corpus.statistics().document(1), statistics.Counts(0, 0, 0))
+        self.assertRaises(KeyError, self.corpus.statistics().document, '100')
+
+    def test_frequencies(self):
+        forms, lemmas = {}, {}
+        for form, parses in self.corpus.iter_parsed_words():
+            forms[form] = forms.get(form, 0) + 1
+            for lemma in set(lemma for lemma, _ in parses):
+                lemmas[lemma] = lemmas.get(lemma, 0) + 1
+        stats = self.corpus.statistics()
+        self.assertEqual(dict(stats.most_common('forms')), forms)
+        self.assertEqual(dict(stats.most_common('lemmas')), lemmas)
+        self.assertEqual(stats.most_common('forms', 1), [(',', forms[','])])
+        self.assertEqual(stats.frequency('lemmas', 'и'), lemmas['и'])
+        self.assertEqual(stats.frequency('forms', 'нет такого'), 0)
+        tags = dict(stats.most_common('tags'))
+        self.assertEqual(stats.frequency('grammemes', 'PNCT'), tags['PNCT'])
+
+    def test_stored(self):
+        events = []
+        built = self.corpus.statistics()
+        with self._reader(stats=ReaderStats([lambda *args: events.append(args)])) as corpus:
+            stats = corpus.statistics()
+            self.assertEqual(len(stats), len(built))
+            self.assertEqual(corpus.counts(), built.totals())
+            for kind in statistics.KINDS:
+                self.assertEqual(stats.most_common(kind), built.most_common(kind))
+            self.assertEqual(stats.frequency('tags', 'PNCT'), built.frequency('tags', 'PNCT'))
+        self.assertTrue((None, 0.0, {'statistics_loads': 1}) in events)
+
+    def test_merge(self):
+        meta = self.corpus._get_meta()
+        source = self.corpus._get_source()
+        whole, parts = statistics.StatisticsBuilder(), []
+        for doc_id in meta:
+            chunk = source.chunk(meta[doc_id].bounds)
+            whole.add_document(doc_id, chunk)
+            part = statistics.StatisticsBuilder()
+            part.add_document(doc_id, chunk)
+            parts.append(part)
+            chunk.release()
+        merged = parts[0]
+        for part in parts[1:]:
+            merged.merge(part)
+        self.assertEqual(merged.arrays(), whole.arrays())
+
+    def test_parallel(self):
+        reader = ParallelCorpusReader(TEST_DATA, use_cache=False, workers=2)
+        self.addCleanup(reader.close)
+        stats = reader.statistics()
+        self.assertEqual(stats.totals(), self.corpus.counts())
+        self.assertEqual(stats.most_common('lemmas'), self.corpus.statistics().most_common('lemmas'))
+
+
+class ConcordanceTest(BaseTest):
+
+    def _scan(self, predicate, fileids=None):
+        return [
+            (doc_id, position, form)
+            for doc_id in self.corpus.fileids(fileids)
+            for sent in self.corpus.iter_parsed_sents(doc_id)
+            for position, (form, parses) in enumerate(sent)
+            if predicate(form, parses)
+        ]
+
+    def _query(self, **kwargs):
+        return [(line.doc_id, line.position, line.word)
+                for line in self.corpus.concordance(**kwargs)]
+
+    def test_lemma_grammemes(self):
+        expected = self._scan(lambda form, parses: any(
+            lemma == 'год' and 'gent' in tag.split(',') for lemma, tag in parses))
+        self.assertTrue(expected)
+        self.assertEqual(self._query(lemma='год', grammemes='gent'), expected)
+        self.assertEqual(self._query(lemma='Год', grammemes=['gent']), expected)
+
+    def test_same_parse(self):
+        # "что" has CONJ and NPRO,neut,... parses
+        self.assertTrue(self.corpus.concordance(form='что', grammemes='CONJ'))
+        self.assertTrue(self.corpus.concordance(form='что', grammemes='NPRO,neut'))
+        self.assertEqual(self.corpus.concordance(form='что', grammemes='CONJ,neut'), [])
+
+    def test_form(self):
+        expected = self._scan(lambda form, parses: form.lower() == 'и')
+        self.assertEqual(self._query(form='И'), expected)
+        self.assertEqual(self._query(form='И', fileids=['4', '3']), [
+            item for item in expected if item[0] in ['3', '4']])
+        self.assertEqual(self._query(form='нет такого слова'), [])
+
+    def test_context(self):
+        line = self.corpus.concordance(grammemes='NOUN,plur', width=2, limit=1)[0]
+        words = self.corpus.get_sentence(line.sent_id).words()
+        self.assertEqual(line.word, words[line.position])
+        self.assertEqual(line.left, words[line.position - 2:line.position])
+        self.assertEqual(line.right, words[line.position + 1:line.position + 3])
+        self.assertEqual(len(self.corpus.concordance(grammemes='NOUN', limit=5)), 5)
+        self.assertRaises(ValueError, self.corpus.concordance)
+
+    def test_stored(self):
+        expected = self.corpus.concordance(grammemes='PNCT')
+        with self._reader(stats=True) as corpus:
+            self.assertEqual(corpus.concordance(grammemes='PNCT'), expected)
+            self.assertEqual(corpus.stats.snapshot()['counters']['concordance_loads'], 1)
+            index = corpus._get_concordance_index()
+            self.assertEqual(index.terms('grammemes'), self.corpus._get_concordance_index().terms('grammemes'))
+
+    def test_postings(self):
+        positions = list(range(3, 3000, 7)) + [10 ** 6, 10 ** 6 + 1]
+        arrays = concordance.encode({'forms': {'a': positions, 'b': [5, 10, 1998]},
+                                     'lemmas': {}, 'grammemes': {}})
+        index = concordance.ConcordanceIndex(arrays)
+        postings = index.postings('forms', 'a')
+        self.assertEqual(len(postings), len(positions))
+        self.assertEqual(list(postings), positions)
+        self.assertEqual(list(concordance.intersect([postings, index.postings('forms', 'b')])),
+                         [10, 1998])
+        self.assertEqual(list(concordance.intersect([postings, index.postings('forms', 'c')])), [])
+
+
+class InstrumentationTest(BaseTest):
+
+    def test_disabled(self):
+        self.assertEqual(self.corpus.stats, None)
+        self.assertEqual(self.corpus.get_document(2).stats, None)
+
+    def test_streaming(self):
+        with self._reader(use_cache=False, stats=True) as corpus:
+            words = corpus.words()
+            snapshot = corpus.stats.snapshot()
+        self.assertEqual(sorted(snapshot['stages']), ['index', 'read', 'view'])
+        self.assertEqual(snapshot['stages']['view']['calls'], 4)
+        counters = snapshot['counters']
+        self.assertEqual(counters['documents_streamed'], 4)
+        self.assertEqual(counters['chunks_read'], 4)
+        self.assertEqual(counters['index_builds'], 1)
+        self.assertTrue(counters['bytes_read'] > 0)
+        self.assertEqual(words, self.corpus.words())
+
+    def test_tree(self):
+        events = []
+        stats = ReaderStats(callbacks=[lambda *args: events.append(args)])
+        self.corpus._get_meta()  # index file is created
+        with self._reader(stats=stats, document_cache_size=10) as corpus:
+            corpus.get_document(2).tagged_words()
+            corpus.get_document(2).raw()
+        snapshot = stats.snapshot()
+        self.assertEqual(snapshot['stages']['parse']['calls'], 1)
+        self.assertEqual(snapshot['stages']['view']['calls'], 2)
+        self.assertEqual(snapshot['counters'], {
+            'index_loads': 1, 'document_cache_misses': 1, 'document_cache_hits': 1,
+            'documents_parsed': 1, 'chunks_read': 1,
+            'bytes_read': snapshot['counters']['bytes_read'],
+        })
+        self.assertTrue((None, 0.0, {'index_loads': 1}) in events)
+        self.assertEqual([stage for stage, _, _ in events if stage], ['read', 'parse', 'view', 'view'])
+
+        stats.reset()
+        self.assertEqual(stats.snapshot(), {'stages': {}, 'counters': {}})
+
+
+class SentenceIndexTest(BaseTest):
+
+    def test_get_sentence(self):
+        sent = self.corpus.get_sentence(2)
+        self.assertEqual(sent.id, '2')
+        self.assertEqual(sent.doc_id, '2')
+        self.assertEqual(sent.raw(), 'Сохранится ли градус дискуссии в новом сезоне?')
+        self.assertEqual(sent.words()[:2], ['Сохранится', 'ли'])
+
+    def test_all_sentences(self):
+        for doc in self.corpus.iter_documents():
+            for sent_elem, tagged in zip(doc._xml_sents(), doc.tagged_sents()):
+                sent = self.corpus.get_sentence(sent_elem.get('id'))
+                self.assertEqual(sent.tagged_words(), tagged)
+
+    def test_get_token(self):
+        self.assertEqual(self.corpus.get_token(2),
+                         ('Школа', [('школа', 'NOUN,inan,femn,sing,nomn')]))
+        word, parses = self.corpus.get_token('1029')
+        self.assertEqual(word, 'Последнее')
+        self.assertEqual(len(parses), 2)
+        self.assertEqual(self.corpus.token_location(1029), ('3', '45', 1))
+
+    def test_unknown_ids(self):
+        self.assertRaises(KeyError, self.corpus.get_sentence, 100000)
+        self.assertRaises(KeyError, self.corpus.get_token, 'foo')
+
+    def test_index_file(self):
+        self.corpus.get_sentence(1)
+        self.assertTrue(os.path.exists(self.corpus._cache_filename + '.sents'))
+        with self._reader() as corpus:
+            self.assertEqual(corpus.get_token(2)[0], 'Школа')
+            self.assertTrue(corpus._get_sentence_index()._file is not None)
+
+    def test_no_cache(self):
+        with CorpusReader(TEST_DATA, use_cache=False) as corpus:
+            self.assertEqual(corpus.get_token(2)[0], 'Школа')
+
+
 class TaggedWordsTest(BaseTest):
 
     def assertTaggedAreTheSame(self, obj):
@@ -264,6 +1013,40 @@ class TaggedWordsTest(BaseTest):
         self.assertTaggedAreTheSame(doc)
 
 
+class CompactTagsTest(BaseTest):
+
+    def setUp(self):
+        super(CompactTagsTest, self).setUp()
+        self.registry = GrammemeRegistry()
+        self.compact = self._reader(tag_registry=self.registry)
+
+    def tearDown(self):
+        self.compact.close()
+        super(CompactTagsTest, self).tearDown()
+
+    def test_same_values(self):
+        for method in ['tagged_words', 'parsed_sents', 'tagged_paras', 'words']:
+            self.assertEqual(getattr(self.compact, method)(),
+                             getattr(self.corpus, method)())
+
+    def test_tags(self):
+        words = self.compact.tagged_words()
+        tag = words[967][1]
+        self.assertTrue(isinstance(tag, Tag))
+        self.assertTrue(tag.has_all(self.registry.mask('NOUN', 'nomn')))
+        self.assertTrue(tag is self.registry.tag('NOUN,inan,femn,sing,nomn'))
+
+        parsed = self.compact.parsed_words('3')
+        self.assertTrue(parsed[17][1][2][1] is self.registry.tag('NOUN,inan,femn,sing,gent'))
+
+    def test_parallel(self):
+        with ParallelCorpusReader(TEST_DATA, self.corpus._cache_filename,
+                                  tag_registry=self.registry, workers=2) as corpus:
+            words = corpus.tagged_words('2')
+        self.assertEqual(words, self.corpus.tagged_words('2'))
+        self.assertTrue(words[1][1] is self.registry.tag(words[1][1]))
+
+
 class ParsedWordsTest(BaseTest):
 
     def assertParsedAreTheSame(self, obj):
@@ -0,0 +1,100 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import io
+import os
+import contextlib
+import re
+import unittest
+import tempfile
+import shutil
+
+from opencorpora import cli
+from opencorpora.diff import diff, TokenInfo
+from opencorpora.reader import CorpusReader
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'annot.corpus.xml')
+
+
+class DiffTest(unittest.TestCase):
+
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.old_file = os.path.join(self.temp_dir, 'old.xml')
+        self.new_file = os.path.join(self.temp_dir, 'new.xml')
+        shutil.copy(TEST_DATA, self.old_file)
+
+        with io.open(TEST_DATA, encoding='utf8') as f:
+            data = f.read()
+        replacements = [
+            ('revision="4579844"', 'revision="4579845"'),
+            # document title
+            ('name="&quot;Частный корреспондент&quot;"', 'name="Частный корреспондент"'),
+            # token annotation
+            ('<tfr rev_id="834910" t="Школа"><v><l id="380220" t="школа"><g v="NOUN"/><g v="inan"/><g v="femn"/><g v="sing"/><g v="nomn"/>',
+             '<tfr rev_id="999999" t="Школа"><v><l id="380220" t="школа"><g v="NOUN"/><g v="inan"/><g v="femn"/><g v="sing"/><g v="accs"/>'),
+            # sentence source
+            ('<source>Сохранится ли градус дискуссии в новом сезоне?</source>',
+             '<source>Сохранится ли градус дискуссии в новом сезоне ?</source>'),
+        ]
+        for old, new in replacements:
+            self.assertTrue(old in data)
+            data = data.replace(old, new)
+        # document 4 is removed
+        data = re.sub(r'  <text id="4".*?</text>\n', '', data, flags=re.DOTALL)
+        with io.open(self.new_file, 'w', encoding='utf8') as f:
+            f.write(data)
+
+        self.old = CorpusReader(self.old_file)
+        self.new = CorpusReader(self.new_file)
+
+    def tearDown(self):
+        self.old.close()
+        self.new.close()
+        shutil.rmtree(self.temp_dir)
+
+    def test_diff(self):
+        changes = [change[:4] for change in diff(self.old, self.new)]
+        self.assertEqual(changes, [
+            ('removed', 'document', '4', '4'),
+            ('changed', 'document', '1', '1'),
+            ('changed', 'token', '2', '2'),
+            ('changed', 'sentence', '2', '2'),
+        ])
+
+    def test_values(self):
+        changes = dict(((c.kind, c.id), c) for c in diff(self.old, self.new))
+        token = changes['token', '2']
+        self.assertEqual(token.old, TokenInfo('Школа', '834910', [('школа', 'NOUN,inan,femn,sing,nomn')]))
+        self.assertEqual(token.new, TokenInfo('Школа', '999999', [('школа', 'NOUN,inan,femn,sing,accs')]))
+        self.assertEqual(changes['document', '1'].new.title, 'Частный корреспондент')
+        self.assertEqual(changes['document', '4'].new, None)
+        self.assertEqual(changes['sentence', '2'].new, 'Сохранится ли градус дискуссии в новом сезоне ?')
+
+    def test_reverse(self):
+        changes = [change[:3] for change in diff(self.new, self.old)]
+        self.assertEqual(changes[0], ('changed', 'document', '1'))
+        self.assertEqual(changes[-1], ('added', 'document', '4'))
+
+    def test_same(self):
+        self.assertEqual(list(diff(self.old, CorpusReader(TEST_DATA, use_cache=False))), [])
+
+    def test_cli(self):
+        out = io.StringIO()
+        counts = cli._diff(self.old_file, self.new_file, out=out)
+        lines = out.getvalue().splitlines()
+        self.assertEqual(lines[0], 'revision 4579844 -> 4579845')
+        self.assertEqual(
+            lines[3],
+            'changed\ttoken\t2\t2\tШкола rev:834910 школа NOUN,inan,femn,sing,nomn\t'
+            'Школа rev:999999 школа NOUN,inan,femn,sing,accs'
+        )
+        self.assertEqual(counts[('document', 'removed')], 1)
+
+        out = io.StringIO()
+        cli._diff(self.old_file, self.new_file, kinds=['token'], summary=True, out=out)
+        self.assertEqual(out.getvalue().splitlines()[1:], ['token changed: 1'])
+
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            cli._diff(self.old_file, self.new_file, kinds=['token'], summary=True)
+        self.assertEqual(out.getvalue().splitlines()[1:], ['token changed: 1'])
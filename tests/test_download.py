@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+import os
+import re
+import bz2
+import json
+import hashlib
+import unittest
+import tempfile
+import shutil
+import threading
+try:
+    from http.server import HTTPServer, BaseHTTPRequestHandler
+except ImportError:
+    from BaseHTTPServer import HTTPServer, BaseHTTPRequestHandler
+
+from opencorpora import download
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'annot.corpus.xml')
+
+
+class _Handler(BaseHTTPRequestHandler):
+
+    def do_GET(self):
+        server = self.server
+        data = server.data
+        match = re.match(r'bytes=(\d+)-(\d*)', self.headers.get('Range') or '')
+        if match and server.ranges:
+            start = int(match.group(1))
+            end = int(match.group(2) or len(data) - 1) + 1
+            server.requests.append((start, end))
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, end - 1, len(data)))
+        else:
+            start, end = 0, len(data)
+            server.requests.append(None)
+            self.send_response(200)
+        self.send_header('Content-Length', str(end - start))
+        self.send_header('ETag', '"test"')
+        self.end_headers()
+
+        body = data[start:end]
+        if server.fail_after is not None and start < server.fail_after < end:
+            # simulate a dropped connection
+            body = body[:server.fail_after - start]
+            server.fail_after = None
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class DownloadTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        with open(TEST_DATA, 'rb') as f:
+            cls.xml = f.read()
+        cls.compressed = bz2.compress(cls.xml)
+        cls.server = HTTPServer(('127.0.0.1', 0), _Handler)
+        cls.server.data = cls.compressed
+        cls.url = 'http://127.0.0.1:%d/annot.opcorpora.xml.bz2' % cls.server.server_address[1]
+        cls.thread = threading.Thread(target=cls.server.serve_forever)
+        cls.thread.daemon = True
+        cls.thread.start()
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.server.shutdown()
+        cls.server.server_close()
+
+    def setUp(self):
+        self.server.ranges = True
+        self.server.fail_after = None
+        self.server.requests = []
+        self.temp_dir = tempfile.mkdtemp()
+        self.out_file = os.path.join(self.temp_dir, 'annot.opcorpora.xml')
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir)
+
+    def _download(self, **kwargs):
+        kwargs.setdefault('segment_size', 10000)
+        kwargs.setdefault('chunk_size', 1000)
+        return download.download(self.url, self.out_file, **kwargs)
+
+    def _read(self):
+        with open(self.out_file, 'rb') as f:
+            return f.read()
+
+    def assertNoTempFiles(self):
+        self.assertEqual(os.listdir(self.temp_dir), ['annot.opcorpora.xml'])
+
+    def test_parallel(self):
+        progress = []
+        digest = self._download(jobs=4, on_progress=lambda done, total: progress.append((done, total)))
+        self.assertEqual(self._read(), self.xml)
+        self.assertEqual(digest, hashlib.sha256(self.compressed).hexdigest())
+        self.assertEqual(progress[-1], (len(self.compressed), len(self.compressed)))
+        self.assertTrue(len(self.server.requests) > 4)
+        self.assertNoTempFiles()
+
+    def test_no_decompress(self):
+        self._download(decompress=False)
+        self.assertEqual(self._read(), self.compressed)
+        self.assertNoTempFiles()
+
+    def test_no_range_support(self):
+        self.server.ranges = False
+        self._download()
+        self.assertEqual(self._read(), self.xml)
+        self.assertTrue(all(request is None for request in self.server.requests))
+        self.assertNoTempFiles()
+
+    def test_retry(self):
+        self.server.fail_after = 25000
+        self._download(jobs=2)
+        self.assertEqual(self._read(), self.xml)
+        self.assertTrue((20000 + 5000, 30000) in self.server.requests)
+
+    def test_resume(self):
+        # emulate an interrupted download: the first two segments are
+        # complete and the third one is downloaded partially
+        part_file = self.out_file + '.part'
+        size = len(self.compressed)
+        done = [0] * ((size + 9999) // 10000)
+        done[:3] = [10000, 10000, 4000]
+        with open(part_file, 'wb') as f:
+            f.write(self.compressed[:24000])
+            f.truncate(size)
+        with open(part_file + '.state', 'w') as f:
+            json.dump({'url': self.url, 'size': size, 'validator': '"test"',
+                       'segment_size': 10000, 'done': done}, f)
+
+        self._download(jobs=1)
+        self.assertEqual(self._read(), self.xml)
+        requests = [req for req in self.server.requests if req != (0, 1)]
+        self.assertEqual(requests[0], (24000, 30000))
+        self.assertFalse(any(start < 24000 for start, end in requests))
+        self.assertNoTempFiles()
+
+    def test_stale_state(self):
+        part_file = self.out_file + '.part'
+        with open(part_file, 'wb') as f:
+            f.write(b'garbage' * len(self.compressed))
+        with open(part_file + '.state', 'w') as f:
+            json.dump({'url': self.url, 'size': 7, 'validator': '"old"',
+                       'segment_size': 10000, 'done': [7]}, f)
+        self._download()
+        self.assertEqual(self._read(), self.xml)
+
+    def test_checksum(self):
+        self.assertRaises(download.DownloadError, self._download, sha256='0' * 64)
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+        self._download(sha256=hashlib.sha256(self.compressed).hexdigest())
+        self.assertEqual(self._read(), self.xml)
+
+    def test_truncated(self):
+        self.server.data = self.compressed[:-100]
+        try:
+            self.assertRaises(download.DownloadError, self._download)
+        finally:
+            self.server.data = self.compressed
+        self.assertEqual(os.listdir(self.temp_dir), [])
+
+    def test_invalid_data(self):
+        self.server.data = b'not a bzip2 file' * 1000
+        try:
+            self.assertRaises(download.DownloadError, self._download)
+        finally:
+            self.server.data = self.compressed
+        self.assertEqual(os.listdir(self.temp_dir), [])
@@ -0,0 +1,50 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import pickle
+import unittest
+
+from opencorpora.grammemes import GrammemeRegistry, Tag
+
+
+class GrammemeRegistryTest(unittest.TestCase):
+
+    def setUp(self):
+        self.registry = GrammemeRegistry()
+
+    def test_tag_is_string(self):
+        tag = self.registry.tag('NOUN,inan,femn,sing,nomn')
+        self.assertTrue(isinstance(tag, Tag))
+        self.assertEqual(tag, 'NOUN,inan,femn,sing,nomn')
+        self.assertEqual(tag.grammemes, ('NOUN', 'inan', 'femn', 'sing', 'nomn'))
+        self.assertEqual(tag.split(','), ['NOUN', 'inan', 'femn', 'sing', 'nomn'])
+
+    def test_interning(self):
+        tag = self.registry.tag('NOUN,inan,femn,sing,nomn')
+        self.assertTrue(tag is self.registry.tag(','.join(tag.grammemes)))
+        self.assertFalse(tag is GrammemeRegistry().tag(tag))
+
+    def test_masks(self):
+        tag = self.registry.tag('NOUN,inan,femn,sing,gent')
+        self.assertTrue(tag.has_all(self.registry.mask('NOUN', 'gent')))
+        self.assertFalse(tag.has_all(self.registry.mask('NOUN', 'nomn')))
+        self.assertTrue(tag.has_any(self.registry.mask('VERB', 'gent')))
+        self.assertFalse(tag.has_any(self.registry.mask('VERB')))
+        self.assertEqual(self.registry.tag('PNCT').mask, self.registry.mask('PNCT'))
+        self.assertEqual(self.registry.tag('').mask, 0)
+
+    def test_unknown_grammemes(self):
+        size = len(self.registry)
+        tag = self.registry.tag('NOUN,Xxxx')
+        self.assertEqual(len(self.registry), size + 1)
+        self.assertEqual(self.registry.bit('Xxxx'), size)
+        self.assertTrue(tag.has_all(self.registry.mask('Xxxx')))
+
+    def test_to_string(self):
+        tag = self.registry.tag('NOUN,inan,femn,sing,gent')
+        self.assertEqual(self.registry.to_string(tag.mask), 'NOUN,inan,femn,sing,gent')
+        mask = self.registry.mask('gent', 'NOUN')
+        self.assertEqual(self.registry.to_string(mask), 'NOUN,gent')
+
+    def test_pickle(self):
+        tag = self.registry.tag('NOUN,inan')
+        self.assertEqual(pickle.loads(pickle.dumps(tag)), 'NOUN,inan')
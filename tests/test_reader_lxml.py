@@ -0,0 +1,214 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import, unicode_literals
+import os
+import io
+import re
+import gc
+import weakref
+import unittest
+
+from opencorpora import load
+from opencorpora.categories import Category
+from opencorpora.reader_lxml import invalidate_cache
+
+TEST_DATA = os.path.join(os.path.dirname(__file__), 'annot.corpus.xml')
+
+
+class LoadTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = load(TEST_DATA)
+
+    def _tokens(self, corpus):
+        return [
+            (tok.id, tok.source, tok.rev_id,
+             [(p.id, p.lemma, p.grammemes) for p in tok.parses])
+            for tok in corpus.tokens
+        ]
+
+    def test_lean(self):
+        lean = load(TEST_DATA, lean=True)
+        self.assertEqual(repr(lean), repr(self.corpus))
+        self.assertEqual(self._tokens(lean), self._tokens(self.corpus))
+        self.assertEqual([doc.source for doc in lean.docs],
+                         [doc.source for doc in self.corpus.docs])
+        self.assertEqual([doc.tags for doc in lean.docs],
+                         [doc.tags for doc in self.corpus.docs])
+
+        tfr = lean.tokens[0].find('tfr')
+        self.assertEqual(dict(tfr.attrib), {'rev_id': '2420236'})
+        self.assertEqual(lean.tokens[1].parse.findall('g'), [])
+        self.assertEqual(lean.tokens[0].text, None)  # blank text is removed
+
+    def test_lean_file_object(self):
+        with io.open(TEST_DATA, 'rb') as f:
+            lean = load(f, lean=True)
+        self.assertEqual(self._tokens(lean), self._tokens(self.corpus))
+
+    def test_lean_layout(self):
+        with io.open(TEST_DATA, 'rb') as f:
+            data = f.read()
+        no_newlines = re.sub(br'>\s+<', b'><', data)
+        reflowed = re.sub(br'<tfr (rev_id="\d+") (t="[^"]*")>', br'<tfr\n\2 \1>', data)
+        reflowed = (reflowed.replace(b'"><g v=', b'">\n<g\n v=')
+                            .replace(b'"/></l>', b'"/>\n</l>')
+                            .replace(b'<l ', b'<l\n'))
+        for xml in [no_newlines, reflowed]:
+            lean = load(io.BytesIO(xml), lean=True)
+            self.assertEqual(self._tokens(lean), self._tokens(self.corpus))
+            self.assertEqual(lean.tokens[1].parse.findall('g'), [])
+            self.assertEqual(lean.tokens[0].find('tfr').get('t'), None)
+
+    def test_lean_short_reads(self):
+        class ShortReads(io.BytesIO):
+            def read(self, size=-1):
+                return super(ShortReads, self).read(7)
+
+        with io.open(TEST_DATA, 'rb') as f:
+            lean = load(ShortReads(f.read()), lean=True)
+        self.assertEqual(self._tokens(lean), self._tokens(self.corpus))
+
+    def test_interned(self):
+        lean = load(TEST_DATA, lean=True)
+        self.assertTrue(self.corpus.tokens[1].grammemes[0] is lean.tokens[1].grammemes[0])
+        self.assertTrue(self.corpus.tokens[1].lemma is lean.tokens[1].lemma)
+
+    def test_fileids(self):
+        corpus = load(TEST_DATA, fileids=[3, '1'])
+        self.assertEqual([doc.id for doc in corpus.docs], ['1', '3'])
+        self.assertEqual(corpus.revision, '4579844')
+        self.assertEqual(self._tokens(corpus), self._tokens(self.corpus.docs[2]))
+
+    def test_categories(self):
+        corpus = load(TEST_DATA, lean=True, categories='Автор:*')
+        self.assertEqual([doc.id for doc in corpus.docs], ['2', '3', '4'])
+
+        query = Category('Автор:*') & ~Category('Тема:ЧасКор:Медиа')
+        corpus = load(TEST_DATA, categories=query, fileids=['2', '3'])
+        self.assertEqual([doc.id for doc in corpus.docs], ['3'])
+
+
+class QueryCacheTest(unittest.TestCase):
+
+    def setUp(self):
+        self.corpus = load(TEST_DATA)
+
+    def test_cached(self):
+        docs = self.corpus.docs
+        self.assertTrue(self.corpus.docs is docs)
+        doc = self.corpus.docs[1]
+        self.assertTrue(self.corpus.docs[1] is doc)
+        self.assertTrue(doc.tags is self.corpus.docs[1].tags)
+        # sequence views are cheap, position arrays are computed once
+        self.assertTrue(doc._layout is self.corpus.docs[1]._layout)
+        self.assertEqual(doc.num_tokens, 1027)
+
+    def test_tokens_not_cached(self):
+        def cache_sizes():
+            return [len(el.__dict__.get('_query_cache', {}))
+                    for el in [self.corpus] + self.corpus.docs]
+
+        self.corpus.docs[0].tags
+        len(self.corpus.tokens)  # position arrays are cached once
+        sizes = cache_sizes()
+        for token in self.corpus.tokens:
+            token.parses
+        self.assertEqual(cache_sizes(), sizes)
+        ref = weakref.ref(token)
+        del token
+        self.assertEqual(ref(), None)
+
+    def test_cached_after_proxy_recreation(self):
+        doc = self.corpus.docs[1]
+        tags, doc_id = doc.tags, doc.id
+        del doc
+        gc.collect()
+        # cached Corpus.docs keeps the proxy alive, so a new lookup returns it
+        doc = self.corpus.xpath('text[@id=$id]', id=doc_id)[0]
+        self.assertTrue(doc.tags is tags)
+
+    def test_num_tokens_cached(self):
+        paragraph = self.corpus.docs[3].paragraphs[0]
+        sentence = paragraph.sentences[0]
+        num_tokens = paragraph.num_tokens, sentence.num_tokens
+        sentence.tokens[0].getparent().remove(sentence.tokens[0])
+
+        self.assertEqual((paragraph.num_tokens, sentence.num_tokens), num_tokens)
+        invalidate_cache(paragraph)
+        self.assertEqual((paragraph.num_tokens, sentence.num_tokens),
+                         (num_tokens[0] - 1, num_tokens[1] - 1))
+
+    def test_without_root(self):
+        doc = load(TEST_DATA).docs[1]
+        self.assertTrue(doc.tags is doc.tags)
+
+    def test_invalidate(self):
+        doc = self.corpus.docs[3]
+        num_tokens = doc.num_tokens
+        sentences = list(doc.sentences)
+        sentence = sentences[0]
+        sentence.getparent().remove(sentence)
+
+        self.assertEqual(self.corpus.docs[3].num_tokens, num_tokens)
+        invalidate_cache(doc)
+        self.assertEqual(self.corpus.docs[3].num_tokens, num_tokens - sentence.num_tokens)
+        self.assertEqual(self.corpus.docs[3].sentences, sentences[1:])
+
+    def test_detached(self):
+        # a removed document is a root of its own tree
+        doc = self.corpus.docs[3]
+        self.corpus.remove(doc)
+        invalidate_cache(self.corpus)
+        self.assertEqual(len(self.corpus.docs), 3)
+        self.assertEqual(doc.num_tokens, 1012)
+
+
+class PositionsTest(unittest.TestCase):
+
+    @classmethod
+    def setUpClass(cls):
+        cls.corpus = load(TEST_DATA)
+
+    def test_views(self):
+        for obj, prefix in [(self.corpus, 'text/'), (self.corpus.docs[2], '')]:
+            for name, query in [('paragraphs', 'paragraphs/paragraph'),
+                                ('sentences', 'paragraphs/paragraph/sentence'),
+                                ('tokens', 'paragraphs/paragraph/sentence/tokens/token')]:
+                expected = obj.findall(prefix + query)
+                view = getattr(obj, name)
+                self.assertEqual(len(view), len(expected))
+                self.assertEqual(view, expected)
+                self.assertEqual([view[i] for i in range(len(view))], expected)
+
+    def test_indexing(self):
+        tokens = self.corpus.tokens
+        self.assertEqual(len(tokens), self.corpus.num_tokens)
+        self.assertEqual(tokens[1029].id, '1030')
+        self.assertEqual(tokens[-1].id, '2358')
+        self.assertEqual([t.id for t in tokens[5:8]], ['6', '7', '8'])
+        self.assertEqual([t.id for t in tokens[-3::2]], ['2356', '2358'])
+        self.assertRaises(IndexError, lambda: tokens[len(tokens)])
+
+        doc = self.corpus.docs[3]
+        self.assertEqual(doc[0], doc.sentences[0].tokens[0])
+        self.assertEqual(doc.sentences[-1], doc.paragraphs[-1].sentences[-1])
+
+    def test_empty(self):
+        doc = self.corpus.docs[0]
+        self.assertEqual(len(doc.tokens), 0)
+        self.assertEqual(doc.tokens, [])
+        self.assertEqual(doc.tokens[:10], [])
+
+    def test_id_lookup(self):
+        self.assertEqual(self.corpus.get_document('3').id, '3')
+        self.assertEqual(self.corpus.get_document(3).name, '00022 Последнее восстание в Сеуле')
+        self.assertEqual(self.corpus.get_sentence(47).id, '47')
+        self.assertEqual(self.corpus.get_token('1030').source, 'восстание')
+
+        doc = self.corpus.docs[2]
+        self.assertEqual(doc.get_token(1031).source, '»')
+        self.assertEqual(doc.get_sentence('47').id, '47')
+        self.assertRaises(KeyError, doc.get_token, 1)
+        self.assertRaises(KeyError, self.corpus.get_sentence, 'foo')
+        self.assertRaises(KeyError, self.corpus.get_document, 10)